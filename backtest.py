@@ -0,0 +1,263 @@
+"""
+Запис тікерів MEXC futures і детермінований бектест детекторів splash.py.
+
+Запис (кожен снапшот /contract/ticker дописується в стиснутий файл):
+    python backtest.py record ticks.splr --interval 1
+Відтворення через check_price / check_fairprice / check_holdvol_splash
+з віртуальним годинником, так швидко, як дозволяє CPU:
+    python backtest.py replay ticks.splr --threshold 3 5 --fairprice 1.5 --oi 10
+    python backtest.py replay ticks.splr --engine batch --alerts alerts.jsonl
+Конвертація кадрів фікстури (JSONL, як для MARKET_SOURCE=fixture:) у запис:
+    python backtest.py convert frames.jsonl ticks.splr
+
+Формат: заголовок, далі блоки (вид, ts, довжина, zlib(сира відповідь MEXC)).
+"d" - /contract/detail (на початку кожного запису), "t" - /contract/ticker.
+Файл лише дописується; недописаний блок після падіння відкидається при
+читанні і обрізається при наступному record.
+"""
+
+import argparse
+import asyncio
+import contextlib
+import hashlib
+import json
+import os
+import struct
+import time
+import zlib
+
+# Telegram у бектесті не використовується, а splash.py без токена завершується при імпорті
+os.environ.setdefault("TELEGRAM_BOT_TOKEN", "0:backtest")
+import aiohttp
+import splash
+
+RECORDING_MAGIC = b"SPLR"
+RECORDING_VERSION = 1
+RECORDING_HEADER = struct.Struct("<4sH")  # magic, версія
+RECORDING_BLOCK = struct.Struct("<cdI")  # вид, ts, довжина стиснутих даних
+RECORDING_COMPRESS_LEVEL = 6
+
+
+class VirtualClock:
+    """Заміна модуля time у splash: time() повертає час поточного снапшоту запису"""
+
+    def __init__(self):
+        self.now = 0.0
+
+    def time(self) -> float:
+        return self.now
+
+    def __getattr__(self, name):
+        return getattr(time, name)
+
+
+def _read_header(f):
+    magic, version = RECORDING_HEADER.unpack(f.read(RECORDING_HEADER.size))
+    if magic != RECORDING_MAGIC or version != RECORDING_VERSION:
+        raise ValueError(f"невідомий формат запису {magic!r} v{version}")
+
+
+def iter_blocks(f):
+    """(вид, ts, сирі байти) по черзі; зупиняється на недописаному блоці"""
+    _read_header(f)
+    while True:
+        head = f.read(RECORDING_BLOCK.size)
+        if len(head) < RECORDING_BLOCK.size:
+            return
+        kind, ts, length = RECORDING_BLOCK.unpack(head)
+        payload = f.read(length)
+        if len(payload) < length:
+            return
+        yield kind.decode(), ts, zlib.decompress(payload)
+
+
+def open_recording(path: str):
+    """Файл для дописування: новий - із заголовком, існуючий - без недописаного хвоста"""
+    size = os.path.getsize(path) if os.path.exists(path) else 0
+    if size == 0:
+        f = open(path, "wb")
+        f.write(RECORDING_HEADER.pack(RECORDING_MAGIC, RECORDING_VERSION))
+        return f
+    with open(path, "rb") as f:
+        _read_header(f)
+        end = f.tell()
+        while end + RECORDING_BLOCK.size <= size:
+            length = RECORDING_BLOCK.unpack(f.read(RECORDING_BLOCK.size))[2]
+            if end + RECORDING_BLOCK.size + length > size:
+                break
+            end += RECORDING_BLOCK.size + length
+            f.seek(end)
+    if end < size:
+        print(f"[RECORD] Обрізано недописаний хвіст: {size - end} байт")
+        os.truncate(path, end)
+    return open(path, "ab")
+
+
+def write_block(f, kind: str, ts: float, raw: bytes):
+    payload = zlib.compress(raw, RECORDING_COMPRESS_LEVEL)
+    f.write(RECORDING_BLOCK.pack(kind.encode(), ts, len(payload)) + payload)
+    f.flush()
+
+
+async def record(path: str, interval: float, count: int):
+    """Опитує /contract/ticker кожні interval секунд і дописує відповіді у path"""
+    timeout = aiohttp.ClientTimeout(total=10)
+    written = raw_bytes = 0
+    with open_recording(path) as f:
+        async with aiohttp.ClientSession(timeout=timeout) as session:
+            async with session.get(f"{splash.MEXC_FUTURES_URL}/detail") as r:
+                write_block(f, "d", time.time(), await r.read())
+            while count == 0 or written < count:
+                started = time.monotonic()
+                try:
+                    async with session.get(f"{splash.MEXC_FUTURES_URL}/ticker") as r:
+                        raw = await r.read()
+                except Exception as e:
+                    print(f"[RECORD] Error: {e}")
+                else:
+                    write_block(f, "t", time.time(), raw)
+                    written += 1
+                    raw_bytes += len(raw)
+                    if written % 60 == 0:
+                        print(f"[RECORD] {written} snapshots, {raw_bytes / 1e6:.1f} MB -> {f.tell() / 1e6:.1f} MB")
+                await asyncio.sleep(max(0.0, interval - (time.monotonic() - started)))
+
+
+def convert(source: str, path: str, interval: float):
+    """Кадри фікстури -> запис; мітки часу з кроком interval"""
+    frames = splash.FixtureSource(source).frames
+    with open_recording(path) as f:
+        started = time.time()
+        write_block(f, "d", started, json.dumps({"data": splash.synthetic_contract_detail(frames)}).encode())
+        for i, frame in enumerate(frames):
+            write_block(f, "t", started + i * interval, json.dumps({"data": frame}, separators=(",", ":")).encode())
+    print(f"[CONVERT] {len(frames)} frames -> {path}")
+
+
+def read_recording(path: str):
+    """Повертає (contracts, [(ts, tickers)]); каталог - останній "d" у файлі"""
+    details, frames = [], []
+    with open(path, "rb") as f:
+        for kind, ts, raw in iter_blocks(f):
+            data = splash.json_loads(raw)["data"]
+            if kind == "d":
+                details = data
+            else:
+                frames.append((ts, data))
+    return {c["symbol"]: splash.parse_contract_detail(c) for c in details}, frames
+
+
+async def replay(frames: list, contracts: dict, clock: VirtualClock):
+    snapshot = splash.market_snapshot
+    bot = object()  # check_fairprice / check_holdvol_splash шлють алерти лише з ботом
+    for ts, data in frames:
+        clock.now = ts
+        snapshot.update_all(data, contracts, splash.symbol_subscribers, extras=False)
+        await splash.evaluate_market(snapshot, None, bot, time.perf_counter(), snapshot.take_changed())
+
+
+def replay_alerts(frames: list, contracts: dict, verbose: bool = False) -> list:
+    """Проганяє запис через splash.DETECTOR_ENGINE і повертає відсортовані алерти
+    (ts, вид, символ, отримувачі, текст). На час прогону підмінює splash.time і splash.dispatch_alert"""
+    clock = VirtualClock()
+    alerts = []
+
+    async def collect(recipients, text, kind, symbol=None):
+        recipients = tuple(recipients)
+        if recipients:
+            alerts.append((clock.now, kind, symbol, recipients, text))
+        return len(recipients)
+
+    with contextlib.ExitStack() as stack:
+        for name, value in (("time", clock), ("dispatch_alert", collect)):
+            stack.callback(setattr, splash, name, getattr(splash, name))
+            setattr(splash, name, value)
+        if not verbose:
+            stack.enter_context(contextlib.redirect_stdout(stack.enter_context(open(os.devnull, "w"))))
+        asyncio.run(replay(frames, contracts, clock))
+    # порядок алертів усередині снапшоту залежить від движка - для порівняння сортуємо
+    alerts.sort(key=lambda alert: alert[:3] + alert[4:])
+    return alerts
+
+
+def run_replay(args):
+    load_started = time.perf_counter()
+    contracts, frames = read_recording(args.path)
+    load_seconds = time.perf_counter() - load_started
+    if not frames:
+        print("[REPLAY] У записі немає снапшотів")
+        return
+
+    splash.DETECTOR_ENGINE = args.engine
+    splash.FAIRPRICE_CHANGE_THRESHOLD = args.fairprice
+    symbols = [s.upper() for s in args.symbols] if args.symbols else list(contracts)
+    # один віртуальний користувач на кожну пару порогів (splash, OI), підписаний на всі монети
+    users = {}
+    for threshold in args.threshold:
+        for oi_threshold in args.oi:
+            user_id = len(users) + 1
+            users[user_id] = (threshold, oi_threshold)
+            splash.set_user_threshold(user_id, threshold)
+            splash.set_user_oi_threshold(user_id, oi_threshold)
+            for symbol in symbols:
+                splash.add_subscription(user_id, symbol)
+
+    started = time.perf_counter()
+    alerts = replay_alerts(frames, contracts, args.verbose)
+    elapsed = time.perf_counter() - started
+
+    tickers = sum(len(data) for _, data in frames)
+    digest = hashlib.sha256()
+    by_kind, by_user = {}, {user_id: 0 for user_id in users}
+    for ts, kind, symbol, recipients, text in alerts:
+        digest.update(f"{ts!r}|{kind}|{symbol}|{recipients}|{text}\n".encode())
+        by_kind[kind] = by_kind.get(kind, 0) + 1
+        for user_id in recipients:
+            by_user[user_id] += 1
+
+    span = frames[-1][0] - frames[0][0]
+    print(f"[REPLAY] {args.path}: {len(frames)} snapshots, {len(contracts)} contracts, {span / 3600:.2f} h of market")
+    print(f"[REPLAY] Engine: {args.engine}, load {load_seconds:.2f} s, detect {elapsed:.2f} s")
+    print(f"[REPLAY] Throughput: {len(frames) / elapsed:,.0f} snapshots/s, {tickers / elapsed:,.0f} tickers/s")
+    print(f"[REPLAY] Alerts: {len(alerts)} ({', '.join(f'{k} {v}' for k, v in sorted(by_kind.items())) or '-'})")
+    for user_id, (threshold, oi_threshold) in users.items():
+        print(f"  splash {threshold}% / OI {oi_threshold}% / fair price {args.fairprice}%: {by_user[user_id]} alerts")
+    print(f"[REPLAY] Digest: {digest.hexdigest()[:16]}")
+
+    if args.alerts:
+        with open(args.alerts, "w", encoding="utf-8") as f:
+            for ts, kind, symbol, recipients, text in alerts:
+                f.write(json.dumps({"ts": ts, "kind": kind, "symbol": symbol, "users": recipients, "text": text}, ensure_ascii=False) + "\n")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Запис тікерів MEXC і бектест детекторів")
+    sub = parser.add_subparsers(dest="command", required=True)
+    rec = sub.add_parser("record")
+    rec.add_argument("path")
+    rec.add_argument("--interval", type=float, default=splash.EVALUATION_CYCLE_TARGET, help="пауза між снапшотами, сек")
+    rec.add_argument("--count", type=int, default=0, help="скільки снапшотів записати (0 - без обмеження)")
+    conv = sub.add_parser("convert")
+    conv.add_argument("source", help="JSONL кадрів (формат FixtureSource)")
+    conv.add_argument("path")
+    conv.add_argument("--interval", type=float, default=splash.EVALUATION_CYCLE_TARGET, help="крок часу між кадрами, сек")
+    rep = sub.add_parser("replay")
+    rep.add_argument("path")
+    rep.add_argument("--engine", choices=("scalar", "batch"), default="scalar")
+    rep.add_argument("--threshold", type=float, nargs="+", default=[splash.CASUAL_SPLASH_THRESHOLD], help="пороги splash, %%")
+    rep.add_argument("--oi", type=float, nargs="+", default=[splash.HOLDVOL_SPLASH_THRESHOLD], help="пороги OI, %%")
+    rep.add_argument("--fairprice", type=float, default=splash.FAIRPRICE_CHANGE_THRESHOLD, help="поріг fair price, %%")
+    rep.add_argument("--symbols", nargs="+", help="лише ці монети (за замовчуванням усі)")
+    rep.add_argument("--alerts", help="записати алерти в JSONL для порівняння")
+    rep.add_argument("--verbose", action="store_true", help="не приглушувати лог splash.py")
+    args = parser.parse_args()
+
+    if args.command == "record":
+        try:
+            asyncio.run(record(args.path, args.interval, args.count))
+        except KeyboardInterrupt:
+            print("\n[RECORD] Stopped")
+    elif args.command == "convert":
+        convert(args.source, args.path, args.interval)
+    else:
+        run_replay(args)
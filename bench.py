@@ -0,0 +1,405 @@
+"""
+Мікро-бенчмарки гарячих шляхів splash.py.
+
+Вартість алерту на одного отримувача (1k і 10k підписників):
+    python bench.py alerts --recipients 1000 10000
+"до" - як було через aiogram: SendMessage + form data на кожного отримувача,
+"після" - PreparedAlert: текст і JSON один раз, на отримувача лише склейка байтів.
+
+Алокації і CPU на одне опитування ринку:
+    python bench.py snapshot --contracts 800
+"до" - свіжий dict з TickerMarketData на кожне опитування, "після" - MarketSnapshot.update_all.
+
+Час розбору і пік пам'яті на опитування /contract/ticker і /contract/detail:
+    python bench.py parse --subscribed 50
+"до" - stdlib json і всі поля всіх монет, "після" - json_loads (orjson, якщо є)
+і лише монети з підписниками з полями детекторів.
+
+Замість синтетичного ринку можна взяти запис backtest.py: --recording ticks.splr
+
+Вартість OI-детектора в проході BatchDetector.step (800 і 3000 монет):
+    python bench.py oi --coins 800 3000
+
+Відновлення стану при старті (знімок bot_state.json + журнал bot_state.log):
+    python bench.py recovery --users 100000
+"""
+
+import argparse
+import json
+import os
+import random
+import tempfile
+import time
+import tracemalloc
+
+# Telegram у бенчмарках не використовується, а splash.py без токена завершується при імпорті
+os.environ.setdefault("TELEGRAM_BOT_TOKEN", "0:bench")
+from aiogram import Bot
+from aiogram.methods import SendMessage
+import backtest
+import splash
+
+SAMPLE_ALERT = (
+    "🟢 <a href='https://www.mexc.com/ru-RU/futures/BTC_USDT?lang=ru-RU'>$BTC</a> Splash +5.12%\n"
+    "LastPrice: 64123.5\n"
+    "FairPrice: 64101.2\n\n"
+    "Side: long\n"
+    "Limit: ~$1,234,567.89"
+)
+
+
+def synthetic_market(contracts: int, polls: int, seed: int = 1):
+    """Каталог і кадри /contract/ticker з усіма полями MEXC, ціни блукають від кадру до кадру"""
+    rng = random.Random(seed)
+    symbols = [f"C{i:04d}_USDT" for i in range(contracts)]
+    prices = {symbol: 10 ** rng.uniform(-5, 4) for symbol in symbols}
+    frames = []
+    for poll in range(polls):
+        frame = []
+        for symbol in symbols:
+            price = prices[symbol] = prices[symbol] * (1 + rng.gauss(0, 0.002))
+            frame.append({
+                "contractId": len(frame), "symbol": symbol, "lastPrice": price, "bid1": price * 0.9999, "ask1": price * 1.0001,
+                "volume24": rng.uniform(1e3, 1e8), "amount24": rng.uniform(1e4, 1e9), "holdVol": rng.uniform(1e3, 1e7),
+                "lower24Price": price * 0.95, "high24Price": price * 1.05, "riseFallRate": rng.uniform(-0.1, 0.1),
+                "riseFallValue": price * 0.01, "indexPrice": price * 1.0002, "fairPrice": price * 1.0001,
+                "fundingRate": rng.uniform(-0.001, 0.001), "maxBidPrice": price * 1.1, "minAskPrice": price * 0.9,
+                "timestamp": 1_700_000_000_000 + poll * 1000, "riseFallRates": {}, "zone": "UTC+8",
+            })
+        frames.append(frame)
+    return {c["symbol"]: splash.parse_contract_detail(c) for c in splash.synthetic_contract_detail(frames)}, frames
+
+
+def synthetic_detail(frames) -> list:
+    """/contract/detail з полями, яких splash.py не читає, як у відповіді MEXC"""
+    details = splash.synthetic_contract_detail(frames)
+    for i, c in enumerate(details):
+        c.update({
+            "displayName": f"{c['symbol']} PERPETUAL", "displayNameEn": f"{c['symbol']} PERPETUAL", "positionOpenType": 3,
+            "settleCoin": "USDT", "contractSize": 0.0001, "minLeverage": 1, "maxLeverage": 200, "priceScale": 2,
+            "volScale": 0, "amountScale": 4, "priceUnit": 0.1, "volUnit": 1, "minVol": 1, "maxVol": 1_000_000,
+            "bidLimitPriceRate": 0.2, "askLimitPriceRate": 0.2, "takerFeeRate": 0.0002, "makerFeeRate": 0,
+            "maintenanceMarginRate": 0.004, "initialMarginRate": 0.005, "riskBaseVol": 150000, "riskIncrVol": 150000,
+            "riskIncrMmr": 0.004, "riskIncrImr": 0.004, "riskLevelLimit": 5, "priceCoefficientVariation": 0.1,
+            "indexOrigin": ["BINANCE", "OKX", "MEXC"], "state": 0, "isNew": False, "isHot": i < 20, "isHidden": False,
+            "conceptPlate": ["mc-trade-zone-grey"], "riskLimitType": "BY_VOLUME", "maxNumOrders": [200, 50],
+            "marketOrderMaxLevel": 20, "marketOrderPriceLimitRate1": 0.2, "marketOrderPriceLimitRate2": 0.005,
+            "triggerProtect": 0.1, "appraisal": 0, "showAppraisalCountdown": 0, "automaticDelivery": 0, "apiAllowed": False,
+        })
+    return details
+
+
+def load_payloads(args):
+    """(сирий /contract/detail, [сирі /contract/ticker]) із запису backtest.py або синтетичні"""
+    if args.recording:
+        detail, tickers = b"", []
+        with open(args.recording, "rb") as f:
+            for kind, _, raw in backtest.iter_blocks(f):
+                if kind == "d":
+                    detail = raw
+                elif len(tickers) < args.polls:
+                    tickers.append(raw)
+        return detail, tickers
+    _, frames = synthetic_market(args.contracts, args.polls)
+    detail = json.dumps({"success": True, "code": 0, "data": synthetic_detail(frames)}).encode()
+    return detail, [json.dumps({"success": True, "code": 0, "data": frame}).encode() for frame in frames]
+
+
+def load_market(args):
+    """(каталог, кадри тікерів) із запису backtest.py або синтетичні"""
+    if args.recording:
+        contracts, frames = backtest.read_recording(args.recording)
+        return contracts, [data for _, data in frames[:args.polls]]
+    return synthetic_market(args.contracts, args.polls)
+
+
+def best_of(repeat: int, func, *args) -> float:
+    """Найкращий час func(*args) з repeat запусків, сек"""
+    best = float("inf")
+    for _ in range(repeat):
+        started = time.perf_counter()
+        func(*args)
+        best = min(best, time.perf_counter() - started)
+    return best
+
+
+def fanout_aiogram(bot: Bot, recipients: int):
+    for chat_id in range(recipients):
+        method = SendMessage(chat_id=chat_id, text=SAMPLE_ALERT, parse_mode="HTML", disable_web_page_preview=True)
+        bot.session.build_form_data(bot, method)()
+
+
+def fanout_prepared(recipients: int):
+    prepared = splash.PreparedAlert.build("splash", SAMPLE_ALERT)
+    for chat_id in range(recipients):
+        prepared.body_for(chat_id)
+
+
+def poll_dataclasses(data: list, contracts: dict, previous: dict):
+    """Опитування як до колонкового снапшоту: новий dict з TickerMarketData і набір змінених"""
+    market, changed = {}, set()
+    for t in data:
+        c = contracts.get(t["symbol"])
+        if not c or not t.get("fairPrice"):
+            continue
+        old = previous.get(t["symbol"])
+        entry = splash.TickerMarketData(
+            tickerContract=c,
+            lastPrice=float(t["lastPrice"]),
+            fairPrice=float(t["fairPrice"]),
+            indexPrice=float(t.get("indexPrice", old.indexPrice if old else 0.0)),
+            fundingRate=float(t.get("fundingRate", old.fundingRate if old else 0.0)),
+            openInterest=float(t.get("holdVol", old.openInterest if old else 0.0)),
+            volume24h=float(t.get("volume24", old.volume24h if old else 0.0)),
+        )
+        if old is None or old.lastPrice != entry.lastPrice or old.fairPrice != entry.fairPrice or old.openInterest != entry.openInterest:
+            changed.add(t["symbol"])
+        market[t["symbol"]] = entry
+    return market, changed
+
+
+def replay_dataclasses(frames: list, contracts: dict):
+    market = {}
+    for data in frames:
+        market, _ = poll_dataclasses(data, contracts, market)
+
+
+def replay_snapshot(frames: list, contracts: dict):
+    snapshot = splash.MarketSnapshot()
+    for data in frames:
+        snapshot.update_all(data, contracts)
+        snapshot.take_changed()
+
+
+def poll_allocations(frames: list, contracts: dict, poll) -> tuple:
+    """(пік, залишок після опитування) у байтах для одного опитування після прогріву"""
+    state = poll(frames[0], None)
+    tracemalloc.start()
+    try:
+        tracemalloc.reset_peak()
+        before = tracemalloc.get_traced_memory()[0]
+        state = poll(frames[1], state)
+        current, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    return peak - before, current - before
+
+
+def run_snapshot(args):
+    contracts, frames = load_market(args)
+    if len(frames) < 2:
+        print("[SNAPSHOT] Потрібно щонайменше 2 кадри")
+        return
+
+    def dataclass_poll(data, market):
+        # старий dict живе, поки не зібрано новий - як у monitoring_loop до колонкового снапшоту
+        return poll_dataclasses(data, contracts, market or {})[0]
+
+    def snapshot_poll(data, snapshot):
+        snapshot = snapshot or splash.MarketSnapshot()
+        snapshot.update_all(data, contracts)
+        snapshot.take_changed()
+        return snapshot
+
+    tickers = len(frames[0])
+    print(f"[SNAPSHOT] {len(contracts)} contracts, {len(frames)} polls, {tickers} tickers per poll")
+    for name, replay_func, poll in (
+        ("dataclasses", replay_dataclasses, dataclass_poll),
+        ("columnar", replay_snapshot, snapshot_poll),
+    ):
+        elapsed = best_of(args.repeat, replay_func, frames, contracts)
+        peak, retained = poll_allocations(frames, contracts, poll)
+        print(f"  {name:<12} CPU {elapsed / len(frames) * 1000:7.3f} ms/poll, peak {peak / 1024:8.1f} KiB, "
+              f"new objects kept {retained / 1024:8.1f} KiB per poll")
+
+
+def peak_memory(func, raw: bytes) -> int:
+    """Пік пам'яті func(raw) у байтах понад те, що вже виділено"""
+    tracemalloc.start()
+    try:
+        before = tracemalloc.get_traced_memory()[0]
+        func(raw)
+        return tracemalloc.get_traced_memory()[1] - before
+    finally:
+        tracemalloc.stop()
+
+
+def run_parse(args):
+    detail, tickers = load_payloads(args)
+    if not detail or not tickers:
+        print("[PARSE] У записі немає /contract/detail або /contract/ticker")
+        return
+    contracts = {c["symbol"]: splash.parse_contract_detail(c) for c in json.loads(detail)["data"]}
+    wanted = set(sorted(contracts)[:args.subscribed])
+    snapshot = splash.MarketSnapshot()
+    snapshot.update_all(json.loads(tickers[0])["data"], contracts)
+    backend = splash.JSON_BACKEND
+
+    cases = (
+        ("/contract/ticker", tickers, (
+            ("json, all symbols and fields", lambda raw: snapshot.update_all(json.loads(raw)["data"], contracts)),
+            (f"{backend}, all symbols and fields", lambda raw: snapshot.update_all(splash.json_loads(raw)["data"], contracts)),
+            (f"{backend}, {len(wanted)} subscribed, last/fair/OI",
+             lambda raw: snapshot.update_all(splash.json_loads(raw)["data"], contracts, wanted, extras=False)),
+        )),
+        ("/contract/detail", [detail], (
+            ("json", lambda raw: {c["symbol"]: splash.parse_contract_detail(c) for c in json.loads(raw)["data"]}),
+            (backend, lambda raw: {c["symbol"]: splash.parse_contract_detail(c) for c in splash.json_loads(raw)["data"]}),
+        )),
+    )
+
+    def parse_all(func, payloads):
+        for raw in payloads:
+            func(raw)
+
+    print(f"[PARSE] {len(contracts)} contracts, JSON backend: {backend}")
+    for endpoint, payloads, variants in cases:
+        size = sum(len(raw) for raw in payloads) / len(payloads)
+        print(f"  {endpoint} ({size / 1024:.0f} KiB per poll, {len(payloads)} polls)")
+        for name, func in variants:
+            elapsed = best_of(args.repeat, parse_all, func, payloads) / len(payloads)
+            peak = peak_memory(func, payloads[-1])
+            print(f"    {name:<40} {elapsed * 1000:7.2f} ms/poll, peak {peak / 1024:8.0f} KiB")
+
+
+def subscribe_all(symbols):
+    """Один користувач з порогами за замовчуванням, підписаний на всі монети"""
+    splash.user_subscriptions = {}
+    splash.user_thresholds = {}
+    splash.user_oi_thresholds = {}
+    splash.rebuild_subscriber_index()
+    for symbol in symbols:
+        splash.add_subscription(1, symbol)
+
+
+def replay_detector(frames: list, contracts: dict, holdvol: bool) -> float:
+    """Сумарний час BatchDetector.step по кадрах (оновлення снапшоту не враховується), сек"""
+    snapshot = splash.MarketSnapshot()
+    detector = splash.BatchDetector(snapshot)
+    if not holdvol:
+        detector._step_holdvol = lambda rows, now, events: None
+    elapsed = 0.0
+    for i, data in enumerate(frames):
+        snapshot.update_all(data, contracts)
+        rows = snapshot.take_changed()
+        started = time.perf_counter()
+        detector.step(rows, 1_700_000_000.0 + i)
+        elapsed += time.perf_counter() - started
+    return elapsed
+
+
+def run_oi(args):
+    rng = random.Random(2)
+    for coins in args.coins:
+        contracts, frames = synthetic_market(coins, args.polls)
+        # OI блукає плавно, з рідкими стрибками - як на реальному ринку
+        oi = {symbol: rng.uniform(1e4, 1e7) for symbol in contracts}
+        for frame in frames:
+            for t in frame:
+                step = rng.gauss(0, 0.002) + (rng.uniform(-0.3, 0.3) if rng.random() < 0.001 else 0.0)
+                t["holdVol"] = oi[t["symbol"]] = oi[t["symbol"]] * (1 + step)
+        subscribe_all(contracts)
+        without = min(replay_detector(frames, contracts, False) for _ in range(args.repeat)) / len(frames)
+        with_oi = min(replay_detector(frames, contracts, True) for _ in range(args.repeat)) / len(frames)
+        print(f"[OI] {coins} coins, {len(frames)} sweeps")
+        print(f"  step without OI: {without * 1000:7.3f} ms/sweep")
+        print(f"  step with OI:    {with_oi * 1000:7.3f} ms/sweep")
+        print(f"  OI adds {(with_oi - without) * 1e6:.0f} us/sweep ({(with_oi - without) / without * 100:+.0f}% of step, "
+              f"{(with_oi - without) / splash.EVALUATION_CYCLE_TARGET * 100:.3f}% of the {splash.EVALUATION_CYCLE_TARGET:g} s cycle)")
+
+
+def write_recovery_files(directory: str, users: int, log_bytes: int, seed: int = 1) -> tuple:
+    """Знімок на users користувачів і журнал розміром ~log_bytes поверх нього. Повертає (знімок, журнал)"""
+    rng = random.Random(seed)
+    symbols = [f"C{i:04d}_USDT" for i in range(800)]
+    splash.bot_users = set(range(1, users + 1))
+    splash.user_usernames = {user_id: f"user{user_id}" for user_id in range(1, users + 1, 2)}
+    splash.user_subscriptions = {user_id: set(rng.sample(symbols, rng.randint(1, 10))) for user_id in range(1, users + 1)}
+    splash.user_thresholds = {user_id: rng.choice((2.0, 3.0, 5.0, 10.0)) for user_id in range(1, users + 1, 3)}
+    splash.user_oi_thresholds = {user_id: rng.choice((10.0, 15.0, 25.0)) for user_id in range(1, users + 1, 5)}
+    splash.user_windows = {user_id: (3.0, 300) for user_id in range(1, users + 1, 50)}
+    splash.user_cooldowns = {user_id: {"*": 600.0} for user_id in range(1, users + 1, 100)}
+    snapshot_path = os.path.join(directory, "bot_state.json")
+    log_path = os.path.join(directory, "bot_state.log")
+    splash.STATE_FILE = snapshot_path
+    splash.write_state_file(splash.snapshot_state())
+
+    size = 0
+    with open(log_path, "wb") as f:
+        while size < log_bytes:
+            user_id = rng.randint(1, users + users // 10)  # частина - нові користувачі
+            op = rng.choice("uussxxto")
+            arg = {
+                "u": f"user{user_id}", "s": rng.choice(symbols), "x": rng.choice(symbols),
+                "t": rng.choice((2.0, 3.0, 5.0)), "o": rng.choice((10.0, 15.0)),
+            }[op]
+            line = json.dumps([op, user_id, arg], separators=(",", ":")).encode() + b"\n"
+            f.write(line)
+            size += len(line)
+    return snapshot_path, log_path
+
+
+def run_recovery(args):
+    with tempfile.TemporaryDirectory() as directory:
+        snapshot_path, log_path = write_recovery_files(directory, args.users, args.log_bytes)
+        splash.STATE_FILE = snapshot_path
+        splash.STATE_LOG_FILE = log_path
+        splash.STATE_LOG_ENABLED = True
+        load = replay = index = float("inf")
+        for _ in range(args.repeat):
+            started = time.perf_counter()
+            splash.load_json_state()
+            loaded = time.perf_counter()
+            splash.rebuild_subscriber_index()
+            load = min(load, loaded - started)
+            replay = min(replay, splash.replay_stats["replay_ms"] / 1000)
+            index = min(index, time.perf_counter() - loaded)
+        subscriptions = sum(len(v) for v in splash.user_subscriptions.values())
+        print(f"[RECOVERY] {len(splash.bot_users):,} users, {subscriptions:,} subscriptions")
+        print(f"  snapshot {os.path.getsize(snapshot_path) / 1e6:.1f} MB, log {os.path.getsize(log_path) / 1e6:.1f} MB "
+              f"({splash.replay_stats['replayed']:,} records)")
+        print(f"  load_json_state:          {load * 1000:8.0f} ms (log replay {replay * 1000:.0f} ms)")
+        print(f"  rebuild_subscriber_index: {index * 1000:8.0f} ms")
+        print(f"  total:                    {(load + index) * 1000:8.0f} ms")
+
+
+def run_alerts(args):
+    bot = Bot("42:bench")
+    for recipients in args.recipients:
+        before = best_of(args.repeat, fanout_aiogram, bot, recipients)
+        after = best_of(args.repeat, fanout_prepared, recipients)
+        print(f"[ALERTS] {recipients:,} recipients")
+        print(f"  aiogram per recipient:  {before / recipients * 1e6:8.2f} us  ({before * 1000:.1f} ms total)")
+        print(f"  prepared per recipient: {after / recipients * 1e6:8.2f} us  ({after * 1000:.1f} ms total)")
+        print(f"  speedup: {before / after:.1f}x")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Мікро-бенчмарки splash.py")
+    sub = parser.add_subparsers(dest="command", required=True)
+    alerts = sub.add_parser("alerts")
+    alerts.add_argument("--recipients", type=int, nargs="+", default=[1000, 10000])
+    alerts.add_argument("--repeat", type=int, default=5, help="запусків, береться найкращий")
+    snapshot = sub.add_parser("snapshot")
+    snapshot.add_argument("--contracts", type=int, default=800, help="монет у синтетичному ринку")
+    snapshot.add_argument("--polls", type=int, default=60)
+    snapshot.add_argument("--recording", help="запис backtest.py замість синтетичного ринку")
+    snapshot.add_argument("--repeat", type=int, default=5, help="запусків, береться найкращий")
+    parse = sub.add_parser("parse")
+    parse.add_argument("--contracts", type=int, default=800, help="монет у синтетичному ринку")
+    parse.add_argument("--polls", type=int, default=20)
+    parse.add_argument("--subscribed", type=int, default=50, help="монет з підписниками для фільтрованого опитування")
+    parse.add_argument("--recording", help="запис backtest.py замість синтетичних відповідей")
+    parse.add_argument("--repeat", type=int, default=3, help="запусків, береться найкращий")
+    oi = sub.add_parser("oi")
+    oi.add_argument("--coins", type=int, nargs="+", default=[800, 3000])
+    oi.add_argument("--polls", type=int, default=60)
+    oi.add_argument("--repeat", type=int, default=3, help="запусків, береться найкращий")
+    recovery = sub.add_parser("recovery")
+    recovery.add_argument("--users", type=int, default=100000)
+    recovery.add_argument("--log-bytes", type=int, default=splash.STATE_LOG_COMPACT_BYTES, help="розмір журналу (за замовчуванням - поріг згортання)")
+    recovery.add_argument("--repeat", type=int, default=3, help="запусків, береться найкращий")
+    args = parser.parse_args()
+
+    commands = {"alerts": run_alerts, "snapshot": run_snapshot, "parse": run_parse, "oi": run_oi, "recovery": run_recovery}
+    commands[args.command](args)
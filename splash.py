@@ -1,15 +1,38 @@
+import abc
 import asyncio
 import time
 import json
-from dataclasses import dataclass
-from typing import Dict, Set
+import bisect
+import difflib
+import heapq
+import gzip
+import hashlib
+import random
+import sqlite3
+import struct
+import threading
+from array import array
+from collections import OrderedDict, deque
+from dataclasses import dataclass, field
+from typing import Awaitable, Callable, Dict, Set
 import os
 from dotenv import load_dotenv
 import aiohttp
+import numpy as np
 from aiogram import Bot, Dispatcher, types, F
+from aiogram.client.session.aiohttp import AiohttpSession
 from aiogram.filters import Command
 from aiogram.types import InlineKeyboardMarkup, InlineKeyboardButton
 
+# Швидкий JSON якщо встановлений orjson, інакше stdlib
+try:
+    import orjson
+    json_loads = orjson.loads
+    JSON_BACKEND = "orjson"
+except ImportError:
+    json_loads = json.loads
+    JSON_BACKEND = "json"
+
 # Завантажуємо конфігурацію з .env файлу
 load_dotenv()
 
@@ -34,46 +57,218 @@ else:
 # ----------------- Обязательная подписка -----------------
 REQUIRED_CHANNEL = "@mexcsofts"  # Канал на который нужно подписаться
 REQUIRED_CHANNEL_ID = -1003419272973  # ID канала (без @)
+MEMBERSHIP_POSITIVE_TTL = 600  # сколько помним, что пользователь подписан, сек
+MEMBERSHIP_NEGATIVE_TTL = 30  # сколько помним, что не подписан, сек
+MEMBERSHIP_CACHE_SIZE = 50000  # максимум пользователей в кеше (LRU)
+SUBSCRIBED_STATUSES = ("member", "administrator", "creator")
 
 # ----------------- Splash state -----------------
 STOCKS_SPLASH_THRESHOLD = 1
 CASUAL_SPLASH_THRESHOLD = 5
 FAIRPRICE_CHANGE_THRESHOLD = 3
 FAIRPRICE_STEP_THRESHOLD = 1
-HOLDVOL_SPLASH_THRESHOLD = 10
+FAIRPRICE_HYSTERESIS = 0.5  # состояние fair price сбрасывается только ниже FAIRPRICE_CHANGE_THRESHOLD - гистерезис
+HOLDVOL_SPLASH_THRESHOLD = 10  # порог OI splash по умолчанию, %
 SYMBOLS_TO_IGNORE = []
 isTrackingSTOCKS = True
+SPLASH_WINDOWS = (60, 300, 900)  # окна для правил "X% за Y минут", сек
+WINDOW_SAMPLE_INTERVAL = 1.0  # не чаще одной точки на монету в столько секунд
+WINDOW_BUFFER_SIZE = int(max(SPLASH_WINDOWS) / WINDOW_SAMPLE_INTERVAL) + 16  # точек в кольцевом буфере монеты
+# ----------------- Evaluation pass -----------------
+EVALUATION_CYCLE_TARGET = 1.0  # цільовий час одного циклу (тікери + перевірка всіх символів), сек
+EVALUATION_YIELD_BUDGET = 0.005  # скільки секунд оцінка може тримати event loop без передачі управління
+SWEEP_LOG_INTERVAL = 60  # раз на скільки циклів логуємо статистику
+DETECTOR_ENGINE = os.getenv("DETECTOR_ENGINE", "batch").strip().lower()  # "batch" - NumPy по всьому ринку, "scalar" - check_* по символу
+# ----------------- Market data ingestion -----------------
+INGESTION_MODE = os.getenv("INGESTION_MODE", "rest").strip().lower()  # "rest" - опрос /contract/ticker, "ws" - стрим
+MEXC_WS_URL = os.getenv("MEXC_WS_URL", "wss://contract.mexc.com/edge")  # можно указать локальный сервер
+WS_PING_INTERVAL = 15  # MEXC рвёт соединение без ping раз в ~60 сек
+WS_STALE_AFTER = 5  # если стрим молчит дольше, берём тикеры через REST
+WS_RECEIVE_TIMEOUT = 4 * WS_PING_INTERVAL  # нет даже pong - соединение мёртвое, переподключаемся
+WS_RECONNECT_DELAY_MAX = 30  # максимальная пауза между переподключениями, сек
+MARKET_SOURCE = os.getenv("MARKET_SOURCE", "mexc").strip()  # "mexc" - REST MEXC futures, "fixture:PATH" - кадры тикеров из файла (без биржи)
+REFERENCE_SOURCE = os.getenv("REFERENCE_SOURCE", "").strip()  # "mexc_spot" - спотовая цена для сравнения в алертах fair price
+REFERENCE_POLL_INTERVAL = 5  # как часто опрашиваем опорный источник, сек
+MEXC_FUTURES_URL = "https://contract.mexc.com/api/v1/contract"
+MEXC_SPOT_URL = "https://api.mexc.com/api/v3"
+CONTRACTS_REFRESH_INTERVAL = 60  # как часто проверяем /contract/detail, сек
+TICKER_EXTRAS_INTERVAL = 10  # раз в сколько секунд разбираем весь /contract/ticker (index, funding, volume, все монеты)
+# ----------------- Symbol search -----------------
+SEARCH_RESULTS_LIMIT = 20  # сколько монет показываем в /search
+SYMBOL_FUZZY_CUTOFF = 0.75  # похожесть названия для нечёткого поиска (difflib)
+SYMBOL_GRAM_SIZE = 3  # довжина n-грам індексу підрядків символів
+# ----------------- HTTP clients -----------------
+HTTP_POOL_LIMITS = {"mexc": 8, "mexc_ws": 1, "telegram": 64}  # одночасних з'єднань на хост
+HTTP_KEEPALIVE_TIMEOUT = 75  # тримаємо TLS з'єднання між циклами, сек
+HTTP_DNS_CACHE_TTL = 600  # сек
+# ----------------- Alert dispatch -----------------
+ALERT_QUEUE_SIZE = 10000  # максимум алертов в очереди на отправку
+ALERT_WORKERS = 8  # параллельных отправщиков
+TELEGRAM_GLOBAL_RATE = 25  # сообщений в секунду на весь бот (лимит Telegram ~30)
+TELEGRAM_PER_CHAT_INTERVAL = 1.0  # минимальный интервал между сообщениями в один чат, сек
+ALERT_MAX_ATTEMPTS = 3  # попыток отправки одного алерта
+ALERT_DRAIN_TIMEOUT = 5  # сколько при остановке ждём, пока воркеры дошлют очередь, сек
+ALERT_BACKPRESSURE_RATIO = 0.8  # с какого заполнения очереди мониторинг начинает ждать
+ALERT_BACKPRESSURE_TIMEOUT = 0.5  # сколько максимум ждём места в очереди, сек
+ALERT_DROP_POLICY = "oldest"  # что выбрасывать при переполнении: "oldest" или "newest"
+ALERT_COOLDOWN_MAX_ENTRIES = 200000  # максимум активных кулдаунов (пользователь, монета, тип)
+ALERT_COALESCE_WINDOW = float(os.getenv("ALERT_COALESCE_WINDOW", "3"))  # алерты одному пользователю в пределах окна склеиваются в дайджест, сек (0 - выключено)
+ALERT_COALESCE_MAX_BATCH = 20  # больше алертов в окне - дайджест уходит сразу
+ALERT_COALESCE_KINDS = ("splash", "fairprice", "oi")  # служебные сообщения (catalog и т.п.) не склеиваем
+TELEGRAM_MESSAGE_LIMIT = 4096  # символов в одном сообщении
 splash_state = {}
 fairprice_state = {}
 holdvol_state = {}
 bot_users: Set[int] = set()  # Храним ID пользователей которые писали боту
 user_subscriptions: Dict[int, Set[str]] = {}  # Храним подписки пользователей {user_id: {symbols}}
 user_thresholds: Dict[int, float] = {}  # Храним персональные пороги splash {user_id: threshold_percent}
+user_oi_thresholds: Dict[int, float] = {}  # Персональные пороги OI splash {user_id: threshold_percent}
 user_usernames: Dict[int, str] = {}  # Храним ники пользователей {user_id: username}
+user_windows: Dict[int, tuple] = {}  # Правило "X% за Y минут" {user_id: (percent, window_sec)}
+user_cooldowns: Dict[int, Dict[str, float]] = {}  # Кулдауны алертов {user_id: {symbol или "*": seconds}}
+symbol_subscribers: Dict[str, Set[int]] = {}  # Обратный индекс подписок {symbol: {user_id}}
+symbol_thresholds: Dict[str, "ThresholdLadder"] = {}  # Пороги подписчиков по монете {symbol: ThresholdLadder}
+symbol_oi_thresholds: Dict[str, "ThresholdLadder"] = {}  # Пороги OI подписчиков по монете
+symbol_window_thresholds: Dict[str, Dict[int, "ThresholdLadder"]] = {}  # {symbol: {window_sec: ThresholdLadder}}
+price_windows: Dict[str, "RollingWindow"] = {}  # Скользящие окна цены монет с оконными правилами
+# Статистика проходів моніторингу (для /stats)
+sweep_stats = {
+    "cycles": 0,
+    "symbols": 0,
+    "changed": 0,  # символов, у которых изменились last/fair/OI с прошлого снапшота
+    "symbols_total": 0,
+    "changed_total": 0,
+    "fetch_ms": 0.0,
+    "eval_ms": 0.0,
+    "cycle_ms": 0.0,
+    "lag_ms": 0.0,  # від отримання /contract/ticker до перевірки останнього символу
+    "max_lag_ms": 0.0,
+}
 
 # Файл для сохранения состояния
 STATE_FILE = "bot_state.json"
+STATE_SAVE_INTERVAL = 5  # изменения пишутся на диск не чаще раза в столько секунд
+STORAGE_BACKEND = os.getenv("STORAGE_BACKEND", "json").strip().lower()  # "json" - bot_state.json, "sqlite" - база SQLITE_FILE
+SQLITE_FILE = os.getenv("SQLITE_FILE", "bot_state.db")
+STATE_LOG_ENABLED = os.getenv("STATE_LOG", "1").strip() != "0"  # журнал изменений для STORAGE_BACKEND=json
+STATE_LOG_FILE = "bot_state.log"
+STATE_LOG_COMPACT_BYTES = 4 * 1024 * 1024  # при таком размере журнал сворачивается в новый снимок
+DETECTOR_STATE_FILE = "detector_state.bin"  # max/min/направления детекторов между перезапусками
+DETECTOR_STATE_SAVE_INTERVAL = 30  # сек
+DETECTOR_STATE_MAX_AGE = 300  # снимок старше этого при старте не используем, сек
+state_dirty = False
+persist_stats = {"writes": 0, "errors": 0, "bytes": 0, "ops": 0, "last_ms": 0.0, "max_ms": 0.0, "total_ms": 0.0}
+
+class MembershipCache:
+    """Кеш результатов get_chat_member: TTL для да/нет, LRU по размеру.
+
+    Одновременные проверки одного пользователя ждут один и тот же запрос
+    к Telegram (single-flight).
+    """
+
+    def __init__(self, positive_ttl: float, negative_ttl: float, max_size: int):
+        self.positive_ttl = positive_ttl
+        self.negative_ttl = negative_ttl
+        self.max_size = max_size
+        self.entries: OrderedDict = OrderedDict()  # {user_id: (is_subscribed, expires_at)}
+        self.pending: Dict[int, asyncio.Future] = {}
+        self.stats = {"hits": 0, "misses": 0, "coalesced": 0, "evictions": 0, "invalidations": 0}
+
+    def get(self, user_id: int) -> bool | None:
+        entry = self.entries.get(user_id)
+        if entry is None:
+            return None
+        value, expires_at = entry
+        if time.monotonic() >= expires_at:
+            del self.entries[user_id]
+            return None
+        self.entries.move_to_end(user_id)
+        return value
+
+    def put(self, user_id: int, value: bool):
+        ttl = self.positive_ttl if value else self.negative_ttl
+        self.entries[user_id] = (value, time.monotonic() + ttl)
+        self.entries.move_to_end(user_id)
+        while len(self.entries) > self.max_size:
+            self.entries.popitem(last=False)
+            self.stats["evictions"] += 1
+
+    def invalidate(self, user_id: int):
+        if self.entries.pop(user_id, None) is not None:
+            self.stats["invalidations"] += 1
+
+    async def lookup(self, user_id: int, fetch: Callable[[], Awaitable[bool]]) -> bool:
+        cached = self.get(user_id)
+        if cached is not None:
+            self.stats["hits"] += 1
+            return cached
+        pending = self.pending.get(user_id)
+        if pending is not None:
+            self.stats["coalesced"] += 1
+            try:
+                return await asyncio.shield(pending)
+            except asyncio.CancelledError:
+                if not pending.cancelled():
+                    raise
+                # отменили ведущий запрос, а не нас - проверяем сами
+                return await self.lookup(user_id, fetch)
+
+        self.stats["misses"] += 1
+        future = asyncio.get_running_loop().create_future()
+        self.pending[user_id] = future
+        try:
+            value = await fetch()
+        except Exception as e:
+            future.set_exception(e)
+            future.exception()  # ошибку получат ожидающие, без warning'а если их нет
+            raise
+        else:
+            self.put(user_id, value)
+            future.set_result(value)
+            return value
+        finally:
+            if not future.done():
+                # ведущий запрос отменён (CancelledError) - ожидающие не должны висеть
+                future.cancel()
+            del self.pending[user_id]
+
+membership_cache = MembershipCache(MEMBERSHIP_POSITIVE_TTL, MEMBERSHIP_NEGATIVE_TTL, MEMBERSHIP_CACHE_SIZE)
+
+async def fetch_subscription(bot: Bot, user_id: int) -> bool:
+    """Запрос подписки у Telegram. Временные ошибки пробрасываются (не кешируются)"""
+    try:
+        member = await bot.get_chat_member(chat_id=REQUIRED_CHANNEL_ID, user_id=user_id)
+    except Exception as e:
+        # Если ошибка доступа к каналу - пропускаем проверку (бот не админ канала)
+        if "chat not found" in str(e).lower() or "forbidden" in str(e).lower():
+            print(f"[SUBSCRIPTION] Бот не имеет доступа к каналу, пропускаем проверку")
+            return True
+        raise
+    # Проверяем статус: member, administrator, creator
+    is_subscribed = member.status in SUBSCRIBED_STATUSES
+    print(f"[SUBSCRIPTION] User {user_id} subscription check: {is_subscribed} (status: {member.status})")
+    return is_subscribed
 
 async def check_subscription(bot: Bot, user_id: int) -> bool:
-    """Проверяет подписку пользователя на обязательный канал"""
+    """Проверяет подписку пользователя на обязательный канал (через кеш)"""
     # Админ всегда имеет доступ
     if admin_user_id and user_id == admin_user_id:
         return True
     
     try:
-        member = await bot.get_chat_member(chat_id=REQUIRED_CHANNEL_ID, user_id=user_id)
-        # Проверяем статус: member, administrator, creator
-        is_subscribed = member.status in ["member", "administrator", "creator"]
-        print(f"[SUBSCRIPTION] User {user_id} subscription check: {is_subscribed} (status: {member.status})")
-        return is_subscribed
+        return await membership_cache.lookup(user_id, lambda: fetch_subscription(bot, user_id))
     except Exception as e:
         print(f"[SUBSCRIPTION] Ошибка проверки подписки для {user_id}: {e}")
-        # Если ошибка доступа к каналу - пропускаем проверку (бот не админ канала)
-        if "chat not found" in str(e).lower() or "forbidden" in str(e).lower():
-            print(f"[SUBSCRIPTION] Бот не имеет доступа к каналу, пропускаем проверку")
-            return True
         return False
 
+async def handle_chat_member_update(update: types.ChatMemberUpdated):
+    """Обновление участника канала: сразу обновляем кеш подписки"""
+    if update.chat.id != REQUIRED_CHANNEL_ID:
+        return
+    user_id = update.new_chat_member.user.id
+    membership_cache.invalidate(user_id)
+    membership_cache.put(user_id, update.new_chat_member.status in SUBSCRIBED_STATUSES)
+
 async def send_subscription_required(message: types.Message):
     """Отправляет сообщение о необходимости подписки с кнопками"""
     keyboard = InlineKeyboardMarkup(inline_keyboard=[
@@ -99,41 +294,678 @@ async def send_subscription_required(message: types.Message):
         parse_mode="HTML"
     )
 
-def save_state():
-    """Сохраняем состояние бота в файл"""
-    state = {
+@dataclass
+class ThresholdLadder:
+    """Пороги splash подписчиков одной монеты, отсортированные по возрастанию"""
+    thresholds: list = field(default_factory=list)
+    users: list = field(default_factory=list)
+
+    @property
+    def min_threshold(self) -> float:
+        return self.thresholds[0] if self.thresholds else float("inf")
+
+    def add(self, user_id: int, threshold: float):
+        i = bisect.bisect_right(self.thresholds, threshold)
+        self.thresholds.insert(i, threshold)
+        self.users.insert(i, user_id)
+
+    def remove(self, user_id: int, threshold: float):
+        lo = bisect.bisect_left(self.thresholds, threshold)
+        hi = bisect.bisect_right(self.thresholds, threshold)
+        for i in range(lo, hi):
+            if self.users[i] == user_id:
+                del self.thresholds[i]
+                del self.users[i]
+                return
+
+    def crossed(self, change: float) -> list:
+        """Пользователи, чей порог пересечён изменением change (%)"""
+        return self.users[:bisect.bisect_right(self.thresholds, abs(change))]
+
+def get_user_threshold(user_id: int) -> float:
+    return user_thresholds.get(user_id, CASUAL_SPLASH_THRESHOLD)
+
+def set_user_threshold(user_id: int, threshold: float):
+    """Устанавливает персональный порог и переставляет пользователя в лестницах его монет"""
+    old_threshold = get_user_threshold(user_id)
+    user_thresholds[user_id] = threshold
+    if state_store is not None:
+        state_store.set_threshold(user_id, threshold)
+    if change_log is not None:
+        change_log.append("t", user_id, threshold)
+    for symbol in user_subscriptions.get(user_id, ()):
+        ladder = symbol_thresholds[symbol]
+        ladder.remove(user_id, old_threshold)
+        ladder.add(user_id, threshold)
+        market_detector.sync_threshold(symbol)
+
+def get_user_oi_threshold(user_id: int) -> float:
+    return user_oi_thresholds.get(user_id, HOLDVOL_SPLASH_THRESHOLD)
+
+def set_user_oi_threshold(user_id: int, threshold: float):
+    """Персональный порог OI splash; пользователь переставляется в OI-лестницах своих монет"""
+    old_threshold = get_user_oi_threshold(user_id)
+    user_oi_thresholds[user_id] = threshold
+    if state_store is not None:
+        state_store.set_oi_threshold(user_id, threshold)
+    if change_log is not None:
+        change_log.append("o", user_id, threshold)
+    for symbol in user_subscriptions.get(user_id, ()):
+        ladder = symbol_oi_thresholds[symbol]
+        ladder.remove(user_id, old_threshold)
+        ladder.add(user_id, threshold)
+        market_detector.sync_threshold(symbol)
+
+def register_user(user_id: int, username: str | None = None) -> bool:
+    """Запоминает пользователя (и его ник, если передан). True если пользователь новый"""
+    is_new = user_id not in bot_users
+    bot_users.add(user_id)
+    renamed = username is not None and user_usernames.get(user_id) != username
+    if renamed:
+        user_usernames[user_id] = username
+    if is_new or renamed:
+        if state_store is not None:
+            state_store.upsert_user(user_id, user_usernames.get(user_id))
+        if change_log is not None:
+            change_log.append("u", user_id, user_usernames.get(user_id))
+    return is_new
+
+def _add_window_ladder(user_id: int, symbol: str):
+    rule = user_windows.get(user_id)
+    if rule is None:
+        return
+    percent, seconds = rule
+    symbol_window_thresholds.setdefault(symbol, {}).setdefault(seconds, ThresholdLadder()).add(user_id, percent)
+
+def _remove_window_ladder(user_id: int, symbol: str):
+    rule = user_windows.get(user_id)
+    ladders = symbol_window_thresholds.get(symbol)
+    if rule is None or ladders is None or rule[1] not in ladders:
+        return
+    percent, seconds = rule
+    ladders[seconds].remove(user_id, percent)
+    if not ladders[seconds].users:
+        del ladders[seconds]
+        if not ladders:
+            # оконных правил по монете больше нет - буфер не нужен
+            del symbol_window_thresholds[symbol]
+            price_windows.pop(symbol, None)
+
+def set_user_window(user_id: int, rule: tuple | None):
+    """Правило (percent, window_sec) для всех монет пользователя; None - выключить"""
+    subs = user_subscriptions.get(user_id, ())
+    for symbol in subs:
+        _remove_window_ladder(user_id, symbol)
+    if rule is None:
+        user_windows.pop(user_id, None)
+    else:
+        user_windows[user_id] = rule
+    for symbol in subs:
+        _add_window_ladder(user_id, symbol)
+    if state_store is not None:
+        state_store.set_window(user_id, rule)
+    if change_log is not None:
+        change_log.append("w", user_id, list(rule) if rule else None)
+
+def set_user_cooldown(user_id: int, scope: str, seconds: float | None):
+    """Кулдаун алертов пользователя по монете (scope="*" - для всех монет); None - убрать"""
+    settings = user_cooldowns.setdefault(user_id, {})
+    if seconds is None:
+        settings.pop(scope, None)
+    else:
+        settings[scope] = seconds
+    if not settings:
+        del user_cooldowns[user_id]
+    if state_store is not None:
+        state_store.set_cooldown(user_id, scope, seconds)
+    if change_log is not None:
+        change_log.append("c", user_id, [scope, seconds])
+
+def add_subscription(user_id: int, symbol: str) -> bool:
+    """Добавляет подписку и обновляет обратный индекс. False если уже подписан"""
+    subs = user_subscriptions.setdefault(user_id, set())
+    if symbol in subs:
+        return False
+    subs.add(symbol)
+    if state_store is not None:
+        state_store.add_subscription(user_id, symbol)
+    if change_log is not None:
+        change_log.append("s", user_id, symbol)
+    symbol_subscribers.setdefault(symbol, set()).add(user_id)
+    symbol_thresholds.setdefault(symbol, ThresholdLadder()).add(user_id, get_user_threshold(user_id))
+    symbol_oi_thresholds.setdefault(symbol, ThresholdLadder()).add(user_id, get_user_oi_threshold(user_id))
+    _add_window_ladder(user_id, symbol)
+    market_detector.sync_threshold(symbol)
+    return True
+
+def remove_subscription(user_id: int, symbol: str) -> bool:
+    """Удаляет подписку и обновляет обратный индекс. False если подписки не было"""
+    subs = user_subscriptions.get(user_id)
+    if not subs or symbol not in subs:
+        return False
+    subs.remove(symbol)
+    if state_store is not None:
+        state_store.remove_subscription(user_id, symbol)
+    if change_log is not None:
+        change_log.append("x", user_id, symbol)
+    ladder = symbol_thresholds.get(symbol)
+    if ladder is not None:
+        ladder.remove(user_id, get_user_threshold(user_id))
+    oi_ladder = symbol_oi_thresholds.get(symbol)
+    if oi_ladder is not None:
+        oi_ladder.remove(user_id, get_user_oi_threshold(user_id))
+    _remove_window_ladder(user_id, symbol)
+    subscribers = symbol_subscribers.get(symbol)
+    if subscribers is not None:
+        subscribers.discard(user_id)
+        if not subscribers:
+            # Монету больше никто не отслеживает - сбрасываем её состояние,
+            # чтобы при новой подписке не сработать по устаревшим max/min
+            del symbol_subscribers[symbol]
+            symbol_thresholds.pop(symbol, None)
+            symbol_oi_thresholds.pop(symbol, None)
+            splash_state.pop(symbol, None)
+            fairprice_state.pop(symbol, None)
+            holdvol_state.pop(symbol, None)
+            market_detector.forget(symbol)
+    market_detector.sync_threshold(symbol)
+    return True
+
+def clear_user_subscriptions(user_id: int) -> int:
+    """Удаляет все подписки пользователя, возвращает количество удалённых"""
+    subs = list(user_subscriptions.get(user_id, ()))
+    for symbol in subs:
+        remove_subscription(user_id, symbol)
+    return len(subs)
+
+def rebuild_subscriber_index():
+    """Полностью пересобирает обратный индекс и лестницы порогов из user_subscriptions"""
+    symbol_subscribers.clear()
+    symbol_thresholds.clear()
+    symbol_oi_thresholds.clear()
+    symbol_window_thresholds.clear()
+    for user_id, subs in user_subscriptions.items():
+        threshold = get_user_threshold(user_id)
+        oi_threshold = get_user_oi_threshold(user_id)
+        for symbol in subs:
+            symbol_subscribers.setdefault(symbol, set()).add(user_id)
+            symbol_thresholds.setdefault(symbol, ThresholdLadder()).add(user_id, threshold)
+            symbol_oi_thresholds.setdefault(symbol, ThresholdLadder()).add(user_id, oi_threshold)
+            _add_window_ladder(user_id, symbol)
+    market_detector.sync_all_rows()
+
+def mark_state_dirty():
+    """Помечает состояние изменённым; запись делает задача persist планировщика"""
+    global state_dirty
+    state_dirty = True
+
+async def persist_state():
+    """Сохраняет состояние, если с прошлого раза были изменения.
+
+    Снимок берётся на event loop (копия словарей), сериализация и запись -
+    в отдельном потоке, чтобы не задерживать обработку алертов.
+    С журналом изменений снимок пишется только при его сворачивании.
+    """
+    global state_dirty
+    if change_log is not None:
+        state_dirty = False  # изменения уже в журнале
+        if change_log.size < STATE_LOG_COMPACT_BYTES:
+            return
+    elif state_store is not None:
+        # все изменения (и register_user без mark_state_dirty) уже в очереди store
+        if not state_store.pending:
+            return
+    elif not state_dirty:
+        return
+    state_dirty = False
+    started = time.perf_counter()
+    try:
+        if state_store is not None:
+            persist_stats["ops"] = await state_store.flush()
+        elif change_log is not None:
+            persist_stats["bytes"] = await compact_change_log()
+        else:
+            persist_stats["bytes"] = await asyncio.to_thread(write_state_file, snapshot_state())
+    except Exception as e:
+        state_dirty = True  # попробуем ещё раз на следующем тике
+        persist_stats["errors"] += 1
+        print(f"[STATE] Ошибка сохранения: {e}")
+        return
+    elapsed_ms = (time.perf_counter() - started) * 1000
+    persist_stats["writes"] += 1
+    persist_stats["last_ms"] = elapsed_ms
+    persist_stats["max_ms"] = max(persist_stats["max_ms"], elapsed_ms)
+    persist_stats["total_ms"] += elapsed_ms
+
+def snapshot_state() -> dict:
+    """Копия состояния для записи (безопасна для передачи в другой поток)"""
+    return {
         "bot_users": list(bot_users),
         "user_subscriptions": {str(k): list(v) for k, v in user_subscriptions.items()},
         "user_thresholds": {str(k): v for k, v in user_thresholds.items()},
-        "user_usernames": {str(k): v for k, v in user_usernames.items()}
+        "user_oi_thresholds": {str(k): v for k, v in user_oi_thresholds.items()},
+        "user_usernames": {str(k): v for k, v in user_usernames.items()},
+        "user_windows": {str(k): list(v) for k, v in user_windows.items()},
+        "user_cooldowns": {str(k): dict(v) for k, v in user_cooldowns.items()},
     }
-    try:
-        with open(STATE_FILE, 'w', encoding='utf-8') as f:
-            json.dump(state, f, ensure_ascii=False, indent=2)
-        print(f"[STATE] Сохранено: {len(bot_users)} пользователей, {sum(len(v) for v in user_subscriptions.values())} подписок")
-    except Exception as e:
-        print(f"[STATE] Ошибка сохранения: {e}")
 
-def load_state():
-    """Загружаем состояние бота из файла"""
-    global bot_users, user_subscriptions, user_thresholds, user_usernames
-    
-    if not os.path.exists(STATE_FILE):
-        print("[STATE] Файл состояния не найден, начинаем с чистого листа")
-        return
+def write_file_atomic(path: str, data: bytes) -> int:
+    """Атомарная запись: временный файл + fsync + os.replace. Возвращает размер в байтах"""
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, 'wb') as f:
+        f.write(data)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_path, path)
+    return len(data)
+
+def write_state_file(state: dict) -> int:
+    return write_file_atomic(STATE_FILE, json.dumps(state, ensure_ascii=False, separators=(",", ":")).encode("utf-8"))
+
+async def compact_change_log() -> int:
+    """Сворачивает журнал в новый снимок.
+
+    Журнал переименовывается и снимок берётся без await между ними, поэтому
+    снимок содержит все записи старого журнала; старый удаляется после записи.
+    """
+    old_path = change_log.rotate()
+    state = snapshot_state()
+
+    def write():
+        written = write_state_file(state)
+        os.remove(old_path)
+        return written
+
+    written = await asyncio.to_thread(write)
+    change_log.stats["compactions"] += 1
+    return written
+
+def load_json_state():
+    """Снимок bot_state.json и журнал изменений поверх него - в словари состояния"""
+    global bot_users, user_subscriptions, user_thresholds, user_oi_thresholds, user_usernames, user_windows, user_cooldowns
     
-    try:
+    if os.path.exists(STATE_FILE):
         with open(STATE_FILE, 'r', encoding='utf-8') as f:
             state = json.load(f)
         
         bot_users = set(state.get("bot_users", []))
         user_subscriptions = {int(k): set(v) for k, v in state.get("user_subscriptions", {}).items()}
         user_thresholds = {int(k): float(v) for k, v in state.get("user_thresholds", {}).items()}
+        user_oi_thresholds = {int(k): float(v) for k, v in state.get("user_oi_thresholds", {}).items()}
         user_usernames = {int(k): v for k, v in state.get("user_usernames", {}).items()}
+        user_windows = {int(k): (float(v[0]), int(v[1])) for k, v in state.get("user_windows", {}).items()}
+        user_cooldowns = {int(k): dict(v) for k, v in state.get("user_cooldowns", {}).items()}
+    else:
+        print("[STATE] Файл состояния не найден, начинаем с чистого листа")
+    
+    if STATE_LOG_ENABLED:
+        # Изменения после снимка - из журнала
+        replay_change_log(STATE_LOG_FILE)
+
+def load_state():
+    """Загружаем состояние бота из файла (или из SQLite, см. STORAGE_BACKEND)"""
+    global bot_users, user_subscriptions, user_thresholds, user_oi_thresholds, user_usernames, user_windows, user_cooldowns, state_store, change_log
+    
+    if STORAGE_BACKEND == "sqlite":
+        state_store = SqliteStore(SQLITE_FILE)
+        state_store.open()
+        json_files = (STATE_FILE, STATE_LOG_FILE, f"{STATE_LOG_FILE}.old")
+        if state_store.is_empty() and any(os.path.exists(path) for path in json_files):
+            # с журналом bot_state.json пишется редко - переносим снимок вместе с журналом
+            load_json_state()
+            state_store.migrate(snapshot_state(), STATE_FILE)
+        bot_users, user_subscriptions, user_thresholds, user_oi_thresholds, user_usernames, user_windows, user_cooldowns = state_store.load()
+        rebuild_subscriber_index()
+        print(f"[STATE] Загружено из {SQLITE_FILE}: {len(bot_users)} пользователей, {sum(len(v) for v in user_subscriptions.values())} подписок")
+        return
+    
+    try:
+        load_json_state()
+        rebuild_subscriber_index()
         
         print(f"[STATE] Загружено: {len(bot_users)} пользователей, {sum(len(v) for v in user_subscriptions.values())} подписок")
     except Exception as e:
         print(f"[STATE] Ошибка загрузки: {e}")
+    
+    if STATE_LOG_ENABLED:
+        change_log = ChangeLog(STATE_LOG_FILE)
+        change_log.open()
+
+# ----------------- Change log -----------------
+class ChangeLog:
+    """Журнал изменений: одна JSON-строка [op, user_id, arg] на изменение.
+
+    op: "u" - пользователь/ник, "s" - подписка, "x" - отписка, "t" - порог, "o" - порог OI,
+    "w" - оконное правило [percent, window_sec] или null,
+    "c" - кулдаун [symbol или "*", seconds или null].
+    Каждая запись - один write() в файл без буфера, так что падение процесса
+    теряет максимум запись, которая писалась в этот момент.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self.old_path = f"{path}.old"
+        self.fd: int | None = None
+        self.size = 0
+        self.stats = {"appends": 0, "compactions": 0}
+
+    def open(self):
+        self._trim_torn_tail()
+        self.fd = os.open(self.path, os.O_WRONLY | os.O_CREAT | os.O_APPEND, 0o644)
+        self.size = os.fstat(self.fd).st_size
+
+    def _trim_torn_tail(self):
+        """Обрезает недописанную последнюю строку (падение посреди write).
+
+        Иначе следующая запись приклеится к обрывку и пропадёт при проигрывании.
+        """
+        if not os.path.exists(self.path):
+            return
+        with open(self.path, 'rb+') as f:
+            size = end = f.seek(0, os.SEEK_END)
+            while end > 0:
+                step = min(4096, end)
+                f.seek(end - step)
+                newline = f.read(step).rfind(b"\n")
+                if newline >= 0:
+                    end = end - step + newline + 1
+                    break
+                end -= step
+            if end < size:
+                print(f"[STATE] Обрезан недописанный хвост журнала {self.path}: {size - end} байт")
+                f.truncate(end)
+
+    def close(self):
+        if self.fd is not None:
+            os.close(self.fd)
+            self.fd = None
+
+    def append(self, op: str, user_id: int, arg=None):
+        line = json.dumps([op, user_id, arg], ensure_ascii=False, separators=(",", ":")).encode("utf-8") + b"\n"
+        os.write(self.fd, line)
+        self.size += len(line)
+        self.stats["appends"] += 1
+
+    def rotate(self) -> str:
+        """Убирает текущий журнал в .old и начинает новый. Возвращает путь .old"""
+        self.close()
+        if os.path.exists(self.old_path):
+            # прошлое сворачивание не дописало снимок - копим в тот же .old
+            with open(self.path, 'rb') as src, open(self.old_path, 'ab') as dst:
+                dst.write(src.read())
+            os.remove(self.path)
+        else:
+            os.replace(self.path, self.old_path)
+        self.open()
+        return self.old_path
+
+def apply_change(op: str, user_id: int, arg):
+    """Применяет запись журнала к словарям состояния (без повторной записи в журнал)"""
+    if op == "u":
+        bot_users.add(user_id)
+        if arg is not None:
+            user_usernames[user_id] = arg
+    elif op == "s":
+        user_subscriptions.setdefault(user_id, set()).add(arg)
+    elif op == "x":
+        user_subscriptions.get(user_id, set()).discard(arg)
+    elif op == "t":
+        user_thresholds[user_id] = float(arg)
+    elif op == "o":
+        user_oi_thresholds[user_id] = float(arg)
+    elif op == "w":
+        if arg is None:
+            user_windows.pop(user_id, None)
+        else:
+            user_windows[user_id] = (float(arg[0]), int(arg[1]))
+    elif op == "c":
+        scope, seconds = arg
+        settings = user_cooldowns.setdefault(user_id, {})
+        if seconds is None:
+            settings.pop(scope, None)
+        else:
+            settings[scope] = float(seconds)
+        if not settings:
+            del user_cooldowns[user_id]
+
+def replay_change_log(path: str) -> int:
+    """Проигрывает .old и текущий журнал поверх загруженного снимка.
+
+    Записи идемпотентны (последняя побеждает), поэтому повтор записей,
+    уже попавших в снимок, безопасен. Оборванная последняя строка пропускается.
+    """
+    started = time.perf_counter()
+    replayed = 0
+    for log_path in (f"{path}.old", path):
+        if not os.path.exists(log_path):
+            continue
+        with open(log_path, 'rb') as f:
+            for line in f:
+                try:
+                    op, user_id, arg = json_loads(line)
+                except ValueError:
+                    print(f"[STATE] Пропущена повреждённая запись журнала {log_path}")
+                    continue
+                apply_change(op, user_id, arg)
+                replayed += 1
+    replay_stats["replayed"] = replayed
+    replay_stats["replay_ms"] = (time.perf_counter() - started) * 1000
+    if replayed:
+        print(f"[STATE] Журнал: {replayed} записей за {replay_stats['replay_ms']:.0f} мс")
+    return replayed
+
+replay_stats = {"replayed": 0, "replay_ms": 0.0}
+change_log: ChangeLog | None = None  # открывается в load_state при STATE_LOG_ENABLED и STORAGE_BACKEND=json
+
+# ----------------- SQLite storage -----------------
+SQLITE_SCHEMA = """
+CREATE TABLE IF NOT EXISTS users (
+    user_id INTEGER PRIMARY KEY,
+    username TEXT
+);
+CREATE TABLE IF NOT EXISTS subscriptions (
+    user_id INTEGER NOT NULL,
+    symbol TEXT NOT NULL,
+    PRIMARY KEY (user_id, symbol)
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS subscriptions_by_symbol ON subscriptions (symbol, user_id);
+CREATE TABLE IF NOT EXISTS thresholds (
+    user_id INTEGER PRIMARY KEY,
+    threshold REAL NOT NULL
+);
+CREATE TABLE IF NOT EXISTS oi_thresholds (
+    user_id INTEGER PRIMARY KEY,
+    threshold REAL NOT NULL
+);
+CREATE TABLE IF NOT EXISTS windows (
+    user_id INTEGER PRIMARY KEY,
+    percent REAL NOT NULL,
+    seconds INTEGER NOT NULL
+);
+CREATE TABLE IF NOT EXISTS cooldowns (
+    user_id INTEGER NOT NULL,
+    scope TEXT NOT NULL,
+    seconds REAL NOT NULL,
+    PRIMARY KEY (user_id, scope)
+) WITHOUT ROWID;
+CREATE TABLE IF NOT EXISTS meta (
+    key TEXT PRIMARY KEY,
+    value TEXT
+);
+"""
+
+SQL_UPSERT_USER = "INSERT INTO users (user_id, username) VALUES (?, ?) ON CONFLICT(user_id) DO UPDATE SET username = excluded.username"
+SQL_ADD_SUBSCRIPTION = "INSERT OR IGNORE INTO subscriptions (user_id, symbol) VALUES (?, ?)"
+SQL_REMOVE_SUBSCRIPTION = "DELETE FROM subscriptions WHERE user_id = ? AND symbol = ?"
+SQL_SET_THRESHOLD = "INSERT INTO thresholds (user_id, threshold) VALUES (?, ?) ON CONFLICT(user_id) DO UPDATE SET threshold = excluded.threshold"
+SQL_SET_OI_THRESHOLD = "INSERT INTO oi_thresholds (user_id, threshold) VALUES (?, ?) ON CONFLICT(user_id) DO UPDATE SET threshold = excluded.threshold"
+SQL_SET_WINDOW = "INSERT INTO windows (user_id, percent, seconds) VALUES (?, ?, ?) ON CONFLICT(user_id) DO UPDATE SET percent = excluded.percent, seconds = excluded.seconds"
+SQL_CLEAR_WINDOW = "DELETE FROM windows WHERE user_id = ?"
+SQL_SET_COOLDOWN = "INSERT INTO cooldowns (user_id, scope, seconds) VALUES (?, ?, ?) ON CONFLICT(user_id, scope) DO UPDATE SET seconds = excluded.seconds"
+SQL_CLEAR_COOLDOWN = "DELETE FROM cooldowns WHERE user_id = ? AND scope = ?"
+
+class SqliteStore:
+    """Хранилище пользователей/подписок/порогов в SQLite (WAL).
+
+    Словари в памяти остаются рабочей копией для детекторов; изменения
+    копятся в pending и пишутся одной транзакцией из persist_state.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self.conn: sqlite3.Connection | None = None
+        self.pending: list = []  # [(sql, params)] в порядке изменений
+        self.lock = threading.Lock()  # соединение используется из потоков to_thread
+        self.flush_lock = asyncio.Lock()  # сохраняет порядок пачек
+        self.stats = {"flushes": 0, "ops": 0, "queries": 0}
+
+    def open(self):
+        self.conn = sqlite3.connect(self.path, check_same_thread=False, isolation_level=None)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        self.conn.executescript(SQLITE_SCHEMA)
+
+    def close(self):
+        if self.conn is not None:
+            self.conn.close()
+            self.conn = None
+
+    def is_empty(self) -> bool:
+        with self.lock:
+            return self.conn.execute("SELECT 1 FROM users LIMIT 1").fetchone() is None
+
+    def migrate(self, state: dict, source: str):
+        """Одноразовый перенос состояния JSON-бэкенда (формат snapshot_state) в пустую базу"""
+        usernames = state.get("user_usernames", {})
+        users = [(int(uid), usernames.get(str(uid))) for uid in state.get("bot_users", [])]
+        subscriptions = [(int(uid), symbol) for uid, subs in state.get("user_subscriptions", {}).items() for symbol in subs]
+        thresholds = [(int(uid), float(v)) for uid, v in state.get("user_thresholds", {}).items()]
+        oi_thresholds = [(int(uid), float(v)) for uid, v in state.get("user_oi_thresholds", {}).items()]
+        windows = [(int(uid), float(v[0]), int(v[1])) for uid, v in state.get("user_windows", {}).items()]
+        cooldowns = [(int(uid), scope, float(sec)) for uid, v in state.get("user_cooldowns", {}).items() for scope, sec in v.items()]
+        with self.lock:
+            self.conn.execute("BEGIN")
+            try:
+                self.conn.executemany(SQL_UPSERT_USER, users)
+                self.conn.executemany(SQL_ADD_SUBSCRIPTION, subscriptions)
+                self.conn.executemany(SQL_SET_THRESHOLD, thresholds)
+                self.conn.executemany(SQL_SET_OI_THRESHOLD, oi_thresholds)
+                self.conn.executemany(SQL_SET_WINDOW, windows)
+                self.conn.executemany(SQL_SET_COOLDOWN, cooldowns)
+                self.conn.execute("INSERT OR REPLACE INTO meta (key, value) VALUES ('migrated_from', ?)", (source,))
+                self.conn.execute("COMMIT")
+            except Exception:
+                self.conn.execute("ROLLBACK")
+                raise
+        print(f"[STATE] Миграция {source} -> {self.path}: {len(users)} пользователей, {len(subscriptions)} подписок")
+
+    def load(self):
+        """Читает всё состояние: (bot_users, user_subscriptions, user_thresholds, user_oi_thresholds, user_usernames, user_windows, user_cooldowns)"""
+        with self.lock:
+            users = self.conn.execute("SELECT user_id, username FROM users").fetchall()
+            subscriptions = self.conn.execute("SELECT user_id, symbol FROM subscriptions").fetchall()
+            thresholds = self.conn.execute("SELECT user_id, threshold FROM thresholds").fetchall()
+            oi_thresholds = self.conn.execute("SELECT user_id, threshold FROM oi_thresholds").fetchall()
+            windows = self.conn.execute("SELECT user_id, percent, seconds FROM windows").fetchall()
+            cooldown_rows = self.conn.execute("SELECT user_id, scope, seconds FROM cooldowns").fetchall()
+        subs: Dict[int, Set[str]] = {}
+        for user_id, symbol in subscriptions:
+            subs.setdefault(user_id, set()).add(symbol)
+        cooldowns: Dict[int, Dict[str, float]] = {}
+        for user_id, scope, seconds in cooldown_rows:
+            cooldowns.setdefault(user_id, {})[scope] = seconds
+        return (
+            {user_id for user_id, _ in users},
+            subs,
+            dict(thresholds),
+            dict(oi_thresholds),
+            {user_id: username for user_id, username in users if username is not None},
+            {user_id: (percent, seconds) for user_id, percent, seconds in windows},
+            cooldowns,
+        )
+
+    def upsert_user(self, user_id: int, username: str | None):
+        self.pending.append((SQL_UPSERT_USER, (user_id, username)))
+
+    def add_subscription(self, user_id: int, symbol: str):
+        self.pending.append((SQL_ADD_SUBSCRIPTION, (user_id, symbol)))
+
+    def remove_subscription(self, user_id: int, symbol: str):
+        self.pending.append((SQL_REMOVE_SUBSCRIPTION, (user_id, symbol)))
+
+    def set_threshold(self, user_id: int, threshold: float):
+        self.pending.append((SQL_SET_THRESHOLD, (user_id, threshold)))
+
+    def set_oi_threshold(self, user_id: int, threshold: float):
+        self.pending.append((SQL_SET_OI_THRESHOLD, (user_id, threshold)))
+
+    def set_window(self, user_id: int, rule: tuple | None):
+        if rule is None:
+            self.pending.append((SQL_CLEAR_WINDOW, (user_id,)))
+        else:
+            self.pending.append((SQL_SET_WINDOW, (user_id, *rule)))
+
+    def set_cooldown(self, user_id: int, scope: str, seconds: float | None):
+        if seconds is None:
+            self.pending.append((SQL_CLEAR_COOLDOWN, (user_id, scope)))
+        else:
+            self.pending.append((SQL_SET_COOLDOWN, (user_id, scope, seconds)))
+
+    def _write(self, ops: list):
+        """Одна транзакция; подряд идущие одинаковые запросы - одним executemany"""
+        with self.lock:
+            self.conn.execute("BEGIN")
+            try:
+                i = 0
+                while i < len(ops):
+                    sql = ops[i][0]
+                    j = i
+                    while j < len(ops) and ops[j][0] == sql:
+                        j += 1
+                    self.conn.executemany(sql, [params for _, params in ops[i:j]])
+                    i = j
+                self.conn.execute("COMMIT")
+            except Exception:
+                self.conn.execute("ROLLBACK")
+                raise
+
+    async def flush(self) -> int:
+        """Пишет накопленные изменения в отдельном потоке. Возвращает число операций"""
+        async with self.flush_lock:
+            if not self.pending:
+                return 0
+            ops, self.pending = self.pending, []
+            try:
+                await asyncio.to_thread(self._write, ops)
+            except Exception:
+                self.pending[:0] = ops  # не теряем изменения, повторим позже
+                raise
+            self.stats["flushes"] += 1
+            self.stats["ops"] += len(ops)
+            return len(ops)
+
+    async def query(self, sql: str, params: tuple = ()) -> list:
+        """SELECT по актуальным данным (сначала сбрасываем pending)"""
+        await self.flush()
+
+        def run():
+            with self.lock:
+                return self.conn.execute(sql, params).fetchall()
+
+        self.stats["queries"] += 1
+        return await asyncio.to_thread(run)
+
+    async def users_page(self, offset: int, limit: int):
+        """(всего пользователей, [(user_id, username)]) для /users"""
+        total = (await self.query("SELECT COUNT(*) FROM users"))[0][0]
+        rows = await self.query("SELECT user_id, username FROM users ORDER BY user_id LIMIT ? OFFSET ?", (limit, offset))
+        return total, rows
+
+    async def tracked_counts(self) -> list:
+        """[(symbol, подписчиков)] по индексу subscriptions_by_symbol для /tracked"""
+        return await self.query("SELECT symbol, COUNT(*) FROM subscriptions GROUP BY symbol ORDER BY symbol")
+
+state_store: SqliteStore | None = None  # создаётся в load_state при STORAGE_BACKEND=sqlite
 
 # ----------------- Data models -----------------
 @dataclass
@@ -159,6 +991,234 @@ class TickerMarketData:
 # Кеш доступних контрактів MEXC (оголошуємо після класу)
 available_contracts: Dict[str, TickerContractDetail] = {}
 
+# ----------------- Market snapshot -----------------
+class MarketSnapshot:
+    """Колонковий снапшот ринку: стабільний індекс символ→рядок і float64 колонки.
+
+    Колонки оновлюються на місці при кожному опитуванні/пуші, тож на тік не
+    створюються нові об'єкти. TickerMarketData будується лише на вимогу (entry).
+    """
+
+    COLUMNS = ("last", "fair", "index", "funding", "oi", "volume")
+
+    def __init__(self, capacity: int = 1024):
+        self.rows: Dict[str, int] = {}
+        self.symbols: list = []
+        self.contracts: list = []
+        for name in self.COLUMNS:
+            setattr(self, name, np.zeros(capacity, dtype=np.float64))
+        self.valid = np.zeros(capacity, dtype=bool)  # тікер є в останньому снапшоті
+        self.changed = np.zeros(capacity, dtype=bool)  # last/fair/OI змінились з останнього take_changed
+        self._seen = np.zeros(capacity, dtype=bool)
+        self.updated_at = 0.0  # perf_counter останнього оновлення (для затримки детекції)
+
+    def __len__(self) -> int:
+        return len(self.symbols)
+
+    @property
+    def capacity(self) -> int:
+        return len(self.last)
+
+    def _grow(self):
+        capacity = self.capacity * 2
+        for name in self.COLUMNS + ("valid", "changed", "_seen"):
+            old = getattr(self, name)
+            new = np.zeros(capacity, dtype=old.dtype)
+            new[:len(old)] = old
+            setattr(self, name, new)
+
+    def row_for(self, symbol: str, contract: TickerContractDetail) -> int:
+        row = self.rows.get(symbol)
+        if row is None:
+            row = len(self.symbols)
+            if row == self.capacity:
+                self._grow()
+            self.rows[symbol] = row
+            self.symbols.append(symbol)
+            self.contracts.append(contract)
+        else:
+            self.contracts[row] = contract
+        return row
+
+    def update(self, t: dict, contract: TickerContractDetail, extras: bool = True) -> bool:
+        """Записує тікер REST/WS у свій рядок. Відсутні в пуші поля лишаються попередніми.
+
+        extras=False - тільки поля детекторів (last, fair, OI).
+        """
+        # Пропускаємо якщо немає fairPrice
+        if not t.get("fairPrice"):
+            return False
+        row = self.row_for(t["symbol"], contract)
+        last = float(t["lastPrice"])
+        fair = float(t["fairPrice"])
+        oi = t.get("holdVol")
+        oi = float(oi) if oi is not None else self.oi[row]
+        if not self.valid[row] or last != self.last[row] or fair != self.fair[row] or oi != self.oi[row]:
+            self.changed[row] = True
+        self.last[row] = last
+        self.fair[row] = fair
+        self.oi[row] = oi
+        if extras:
+            for key, column in (("indexPrice", self.index), ("fundingRate", self.funding), ("volume24", self.volume)):
+                value = t.get(key)
+                if value is not None:
+                    column[row] = float(value)
+        self.valid[row] = True
+        self._seen[row] = True
+        return True
+
+    def update_all(self, data: list, contracts: Dict[str, TickerContractDetail], wanted=None, extras: bool = True):
+        """Повний список тікерів (REST): рядки, яких немає у відповіді, стають невалідними.
+
+        wanted - якщо задано, розбираються лише ці символи; решта рядків з відповіді
+        зберігають попередні значення і валідність (їх оновить повне опитування з extras).
+        """
+        self._seen[:] = False
+        for t in data:
+            symbol = t["symbol"]
+            if wanted is not None and symbol not in wanted:
+                row = self.rows.get(symbol)
+                if row is not None:
+                    self._seen[row] = self.valid[row]
+                continue
+            c = contracts.get(symbol)
+            if c:
+                self.update(t, c, extras)
+        np.copyto(self.valid, self._seen)
+        self.updated_at = time.perf_counter()
+
+    def refresh_contracts(self, contracts: Dict[str, TickerContractDetail], symbols):
+        """Оновлює деталі контракту в рядках після змін каталогу"""
+        for symbol in symbols:
+            row = self.rows.get(symbol)
+            if row is not None and symbol in contracts:
+                self.contracts[row] = contracts[symbol]
+
+    def take_changed(self) -> np.ndarray:
+        """Рядки, що змінились з минулого виклику (прапорці скидаються)"""
+        rows = np.flatnonzero(self.changed & self.valid)
+        self.changed[:] = False
+        return rows
+
+    def entry(self, row: int) -> TickerMarketData:
+        return TickerMarketData(
+            tickerContract=self.contracts[row],
+            lastPrice=float(self.last[row]),
+            fairPrice=float(self.fair[row]),
+            indexPrice=float(self.index[row]),
+            fundingRate=float(self.funding[row]),
+            openInterest=float(self.oi[row]),
+            volume24h=float(self.volume[row]),
+        )
+
+market_snapshot = MarketSnapshot()
+
+# ----------------- Symbol index -----------------
+class SymbolIndex:
+    """Індекс символів для normalize_symbol, /search і /subscribe.
+
+    Перебудовується лише при зміні каталогу контрактів. Базові монети
+    відсортовані, тож префікс шукається бісекцією, підрядок - через індекс
+    n-грам; результати ранжуються за 24h обсягом зі снапшоту ринку.
+    """
+
+    def __init__(self, snapshot: MarketSnapshot):
+        self.snapshot = snapshot
+        self.base_keys: list = []  # відсортовані базові монети (з повторами), паралельно symbols
+        self.symbols: list = []
+        self.by_base: Dict[str, list] = {}
+        self.grams: Dict[str, list] = {}  # підрядок до SYMBOL_GRAM_SIZE символів -> символи в порядку symbols
+        self.quotes: Dict[str, str] = {}
+        self.fuzzy_cache: Dict[str, list] = {}  # запит -> схожі монети, скидається при перебудові
+        self.stats = {"rebuilds": 0, "queries": 0, "rebuild_ms": 0.0}
+
+    def rebuild(self, contracts: Dict[str, TickerContractDetail]):
+        started = time.perf_counter()
+        pairs = sorted(((c.baseCoin or symbol.split("_")[0]).upper(), symbol) for symbol, c in contracts.items())
+        self.base_keys = [base for base, _ in pairs]
+        self.symbols = [symbol for _, symbol in pairs]
+        self.by_base = {}
+        for base, symbol in pairs:
+            self.by_base.setdefault(base, []).append(symbol)
+        self.grams = {}
+        for symbol in self.symbols:
+            grams = {symbol[i:i + n] for n in range(1, SYMBOL_GRAM_SIZE + 1) for i in range(len(symbol) - n + 1)}
+            for gram in grams:
+                self.grams.setdefault(gram, []).append(symbol)
+        self.quotes = {symbol: c.quoteCoin.upper() for symbol, c in contracts.items()}
+        self.fuzzy_cache = {}
+        self.stats["rebuilds"] += 1
+        self.stats["rebuild_ms"] = (time.perf_counter() - started) * 1000
+
+    def volume(self, symbol: str) -> float:
+        row = self.snapshot.rows.get(symbol)
+        return float(self.snapshot.volume[row]) if row is not None else 0.0
+
+    def _ranked(self, symbols, quote: str | None) -> list:
+        if quote:
+            symbols = [s for s in symbols if self.quotes.get(s) == quote]
+        return sorted(symbols, key=self.volume, reverse=True)
+
+    def with_base(self, base: str, quote: str | None = None) -> list:
+        """Всі контракти монети (BTC -> BTC_USDT, BTC_USDC, ...)"""
+        return self._ranked(self.by_base.get(base.upper(), ()), quote)
+
+    def top(self, limit: int, quote: str | None = None) -> list:
+        symbols = self.symbols if not quote else [s for s in self.symbols if self.quotes.get(s) == quote]
+        return heapq.nlargest(limit, symbols, key=self.volume)
+
+    def _fuzzy(self, term: str) -> list:
+        close = self.fuzzy_cache.get(term)
+        if close is None:
+            # довжина відрізняється більш ніж на 2 - похожість все одно нижче порогу
+            candidates = [base for base in self.by_base if abs(len(base) - len(term)) <= 2]
+            close = difflib.get_close_matches(term, candidates, n=SEARCH_RESULTS_LIMIT, cutoff=SYMBOL_FUZZY_CUTOFF)
+            if len(self.fuzzy_cache) >= 4096:
+                self.fuzzy_cache.clear()
+            self.fuzzy_cache[term] = close
+        return [s for base in close for s in self.by_base[base]]
+
+    def _containing(self, term: str) -> list:
+        """Символи, що містять term, у порядку symbols"""
+        if len(term) <= SYMBOL_GRAM_SIZE:
+            return self.grams.get(term, [])
+        # символ з term містить кожну його n-граму - перевіряємо лише найрідшу
+        rarest = min(
+            (self.grams.get(term[i:i + SYMBOL_GRAM_SIZE], []) for i in range(len(term) - SYMBOL_GRAM_SIZE + 1)),
+            key=len,
+        )
+        return [s for s in rarest if term in s]
+
+    def search(self, term: str, quote: str | None = None) -> list:
+        """Точна монета, далі префікс монети, підрядок символу; якщо нічого - нечіткий збіг.
+        Кожна група ранжується за обсягом. "BTC_USDC" = монета BTC з фільтром USDC"""
+        self.stats["queries"] += 1
+        term = term.upper().strip()
+        if "_" in term:
+            term, _, term_quote = term.partition("_")
+            quote = quote or term_quote or None
+        quote = quote.upper() if quote else None
+        if not term:
+            return self.top(len(self.symbols), quote)
+
+        lo = bisect.bisect_left(self.base_keys, term)
+        hi = bisect.bisect_left(self.base_keys, term + "\uffff")
+        exact = self.by_base.get(term, [])
+        taken = set(exact)
+        prefix = [s for s in self.symbols[lo:hi] if s not in taken]
+        taken.update(prefix)
+        substring = [s for s in self._containing(term) if s not in taken]
+        groups = [exact, prefix, substring]
+        if not any(groups):
+            groups = [self._fuzzy(term)]
+
+        results = []
+        for group in groups:
+            results.extend(self._ranked(group, quote))
+        return results
+
+symbol_index = SymbolIndex(market_snapshot)
+
 # Helper function для нормалізації тікера
 def normalize_symbol(input_symbol: str) -> tuple[str | None, list[str]]:
     """
@@ -177,36 +1237,166 @@ def normalize_symbol(input_symbol: str) -> tuple[str | None, list[str]]:
         if usdt_symbol in available_contracts:
             return usdt_symbol, [usdt_symbol]
         
-        # Шукаємо всі можливі варіанти
-        possible = [s for s in available_contracts.keys() if s.startswith(f"{symbol}_")]
+        # Інші котирування цієї монети
+        possible = symbol_index.with_base(symbol)
         if possible:
             return None, possible
     
-    return None, []
+    # Схожі назви (префікс, підрядок, нечіткий збіг)
+    return None, symbol_index.search(symbol)[:SEARCH_RESULTS_LIMIT]
+
+
+# ----------------- HTTP clients -----------------
+# Таймаути по эндпоинтам: отдельно на подключение и на чтение ответа
+HTTP_TIMEOUTS = {
+    "mexc_ticker": aiohttp.ClientTimeout(total=None, connect=3, sock_connect=3, sock_read=4),
+    "mexc_detail": aiohttp.ClientTimeout(total=None, connect=5, sock_connect=5, sock_read=15),
+    "telegram_send": aiohttp.ClientTimeout(total=None, connect=5, sock_connect=5, sock_read=10),
+    "telegram_api": aiohttp.ClientTimeout(total=None, connect=5, sock_connect=5, sock_read=None),
+    # sock_read сессии действует и на кадры WebSocket - тишину стрима ловит receive_timeout
+    "mexc_ws": aiohttp.ClientTimeout(total=None, connect=5, sock_connect=5, sock_read=None),
+}
+SESSION_TIMEOUTS = {"mexc": "mexc_ticker", "mexc_ws": "mexc_ws", "telegram": "telegram_api"}  # таймаут сессии по умолчанию
+
+class HttpClients:
+    """Общие aiohttp сессии (mexc, mexc_ws, telegram) с настроенным пулом соединений.
+
+    Keep-alive и кеш DNS убирают TLS рукопожатие на каждом цикле, а trace
+    хуки считают запросы, новые/переиспользованные соединения и ожидание
+    свободного соединения (насыщение пула).
+    """
+
+    def __init__(self):
+        self.sessions: Dict[str, aiohttp.ClientSession] = {}
+        self.stats: Dict[str, dict] = {}
+
+    def session(self, name: str) -> aiohttp.ClientSession:
+        session = self.sessions.get(name)
+        if session is None or session.closed:
+            connector = aiohttp.TCPConnector(
+                limit=HTTP_POOL_LIMITS[name],
+                limit_per_host=HTTP_POOL_LIMITS[name],
+                keepalive_timeout=HTTP_KEEPALIVE_TIMEOUT,
+                ttl_dns_cache=HTTP_DNS_CACHE_TTL,
+                use_dns_cache=True,
+            )
+            session = aiohttp.ClientSession(
+                connector=connector,
+                timeout=HTTP_TIMEOUTS[SESSION_TIMEOUTS[name]],
+                trace_configs=[self._trace(name)],
+            )
+            self.sessions[name] = session
+        return session
+
+    def _trace(self, name: str) -> aiohttp.TraceConfig:
+        st = self.stats.setdefault(name, {
+            "requests": 0, "errors": 0, "in_flight": 0, "max_in_flight": 0,
+            "new_connections": 0, "reused_connections": 0,
+            "queued": 0, "queued_ms": 0.0, "dns_hits": 0, "dns_misses": 0,
+        })
+        trace = aiohttp.TraceConfig()
+
+        async def on_request_start(session, ctx, params):
+            st["requests"] += 1
+            st["in_flight"] += 1
+            st["max_in_flight"] = max(st["max_in_flight"], st["in_flight"])
+
+        async def on_request_end(session, ctx, params):
+            st["in_flight"] -= 1
+
+        async def on_request_exception(session, ctx, params):
+            st["in_flight"] -= 1
+            st["errors"] += 1
+
+        async def on_queued_start(session, ctx, params):
+            ctx.queued_at = time.perf_counter()
+
+        async def on_queued_end(session, ctx, params):
+            st["queued"] += 1
+            st["queued_ms"] += (time.perf_counter() - ctx.queued_at) * 1000
+
+        async def on_create_end(session, ctx, params):
+            st["new_connections"] += 1
+
+        async def on_reuse(session, ctx, params):
+            st["reused_connections"] += 1
+
+        async def on_dns_hit(session, ctx, params):
+            st["dns_hits"] += 1
 
+        async def on_dns_miss(session, ctx, params):
+            st["dns_misses"] += 1
+
+        trace.on_request_start.append(on_request_start)
+        trace.on_request_end.append(on_request_end)
+        trace.on_request_exception.append(on_request_exception)
+        trace.on_connection_queued_start.append(on_queued_start)
+        trace.on_connection_queued_end.append(on_queued_end)
+        trace.on_connection_create_end.append(on_create_end)
+        trace.on_connection_reuseconn.append(on_reuse)
+        trace.on_dns_cache_hit.append(on_dns_hit)
+        trace.on_dns_cache_miss.append(on_dns_miss)
+        return trace
+
+    async def close(self):
+        for session in self.sessions.values():
+            await session.close()
+        self.sessions.clear()
+
+http_clients = HttpClients()
+
+class SharedAiohttpSession(AiohttpSession):
+    """Сессия aiogram поверх общего пула telegram вместо собственного"""
+
+    def __init__(self, clients: HttpClients, **kwargs):
+        super().__init__(**kwargs)
+        self.clients = clients
+
+    async def create_session(self) -> aiohttp.ClientSession:
+        return self.clients.session("telegram")
+
+    async def close(self) -> None:
+        # пулом владеет HttpClients
+        pass
 
 # ----------------- Async Telegram -----------------
-async def send_telegram_message(session, chat_id, text):
-    url = f"https://api.telegram.org/bot{telegram_bot_token}/sendMessage"
-    payload = {
-        "chat_id": chat_id,
-        "text": text,
-        "parse_mode": "HTML",
-        "disable_web_page_preview": True,
-    }
-    try:
-        async with session.post(url, json=payload) as r:
-            await r.text()
-    except Exception as e:
-        print("Telegram error:", e)
+TELEGRAM_SEND_URL = f"https://api.telegram.org/bot{telegram_bot_token}/sendMessage"
+TELEGRAM_JSON_HEADERS = {"Content-Type": "application/json"}
+
+@dataclass(frozen=True, slots=True)
+class PreparedAlert:
+    """Готовый алерт: текст рендерится и сериализуется в JSON один раз на событие.
+
+    body_tail - тело sendMessage без chat_id, на каждого получателя остаётся
+    только склеить байты.
+    """
+    kind: str
+    text: str
+    body_tail: bytes
+
+    @classmethod
+    def build(cls, kind: str, text: str) -> "PreparedAlert":
+        payload = json.dumps(
+            {"text": text, "parse_mode": "HTML", "disable_web_page_preview": True},
+            ensure_ascii=False,
+            separators=(",", ":"),
+        ).encode("utf-8")
+        return cls(kind=kind, text=text, body_tail=payload[1:])
+
+    def body_for(self, chat_id: int) -> bytes:
+        return b'{"chat_id":%d,' % chat_id + self.body_tail
+
+async def send_telegram_message(session, chat_id, alert: PreparedAlert):
+    """Отправка готового алерта напрямую в Bot API. Возвращает (HTTP статус, ответ)"""
+    async with session.post(TELEGRAM_SEND_URL, data=alert.body_for(chat_id), headers=TELEGRAM_JSON_HEADERS, timeout=HTTP_TIMEOUTS["telegram_send"]) as r:
+        return r.status, await r.json(content_type=None)
 
 # ----------------- Bot Commands -----------------
 async def handle_start(message: types.Message, bot: Bot):
     """Обработка команды /start"""
     user_id = message.from_user.id
-    bot_users.add(user_id)
-    # Сохраняем ник пользователя
-    user_usernames[user_id] = message.from_user.username or message.from_user.first_name
+    # Сохраняем пользователя и его ник
+    register_user(user_id, message.from_user.username or message.from_user.first_name)
     
     # Проверка подписки на канал
     if not await check_subscription(bot, user_id):
@@ -224,11 +1414,12 @@ async def handle_start(message: types.Message, bot: Bot):
         f"  /clear - удалить все подписки\n"
         f"  /my - посмотреть свои подписки\n\n"
         f"  /setthreshold ПРОЦЕНТ - установить свой порог\n"
+        f"  /setoithreshold ПРОЦЕНТ - порог алертов открытого интереса\n"
         f"  /mythreshold - посмотреть свой порог\n\n"
         f"✅ Используйте /search для поиска монет!",
         parse_mode="HTML"
     )
-    save_state()
+    mark_state_dirty()
     print(f"[BOT] Новый пользователь: {username} (ID: {user_id})")
 
 async def handle_users(message: types.Message, page: int = 0):
@@ -246,19 +1437,20 @@ async def send_users_page(target: types.Message | types.CallbackQuery, page: int
     """Отправка страницы со списком пользователей"""
     USERS_PER_PAGE = 10
     
-    total_users = len(bot_users)
-    sorted_users = sorted(bot_users)
-    
     # Вычисляем границы страницы
     start_idx = page * USERS_PER_PAGE
+    if state_store is not None:
+        total_users, page_users = await state_store.users_page(start_idx, USERS_PER_PAGE)
+    else:
+        total_users = len(bot_users)
+        page_users = [(uid, user_usernames.get(uid)) for uid in sorted(bot_users)[start_idx:start_idx + USERS_PER_PAGE]]
     end_idx = min(start_idx + USERS_PER_PAGE, total_users)
-    page_users = sorted_users[start_idx:end_idx]
     
     # Формируем список пользователей с никнеймами
     if total_users > 0:
         user_list = "\n".join([
-            f"  {start_idx + i + 1}. @{user_usernames.get(uid, 'unknown')} (ID: <code>{uid}</code>)" 
-            for i, uid in enumerate(page_users)
+            f"  {start_idx + i + 1}. @{username or 'unknown'} (ID: <code>{uid}</code>)" 
+            for i, (uid, username) in enumerate(page_users)
         ])
     else:
         user_list = "<i>Пока нет пользователей</i>"
@@ -312,7 +1504,8 @@ async def handle_check_subscription(callback: types.CallbackQuery, bot: Bot):
     """Обработка нажатия кнопки проверки подписки"""
     user_id = callback.from_user.id
     
-    # Проверяем подписку
+    # Проверяем подписку (пользователь мог только что подписаться - кеш не используем)
+    membership_cache.invalidate(user_id)
     is_subscribed = await check_subscription(bot, user_id)
     
     if is_subscribed:
@@ -334,7 +1527,7 @@ async def handle_check_subscription(callback: types.CallbackQuery, bot: Bot):
 async def handle_subscribe(message: types.Message, bot: Bot):
     """Обработка команды /subscribe SYMBOL - подписка на монету"""
     user_id = message.from_user.id
-    bot_users.add(user_id)
+    register_user(user_id)
     
     # Проверка подписки на канал
     if not await check_subscription(bot, user_id):
@@ -375,18 +1568,11 @@ async def handle_subscribe(message: types.Message, bot: Bot):
             )
         return
     
-    # Инициализируем подписки пользователя если их нет
-    if user_id not in user_subscriptions:
-        user_subscriptions[user_id] = set()
-    
-    # Проверяем не подписан ли уже
-    if symbol in user_subscriptions[user_id]:
+    # Добавляем подписку (и проверяем не подписан ли уже)
+    if not add_subscription(user_id, symbol):
         await message.answer(f"ℹ️ Вы уже подписаны на <b>{symbol}</b>", parse_mode="HTML")
         return
-    
-    # Добавляем подписку
-    user_subscriptions[user_id].add(symbol)
-    save_state()
+    mark_state_dirty()
     contract = available_contracts[symbol]
     await message.answer(
         f"✅ Вы подписались на <b>{symbol}</b>\n"
@@ -421,14 +1607,11 @@ async def handle_unsubscribe(message: types.Message, bot: Bot):
     if symbol is None:
         symbol = input_symbol.upper()
     
-    # Проверяем есть ли подписки
-    if user_id not in user_subscriptions or symbol not in user_subscriptions[user_id]:
+    # Удаляем подписку (если она есть)
+    if not remove_subscription(user_id, symbol):
         await message.answer(f"ℹ️ Вы не подписаны на <b>{symbol}</b>", parse_mode="HTML")
         return
-    
-    # Удаляем подписку
-    user_subscriptions[user_id].remove(symbol)
-    save_state()
+    mark_state_dirty()
     await message.answer(
         f"✅ Вы отписались от <b>{symbol}</b>",
         parse_mode="HTML"
@@ -449,9 +1632,8 @@ async def handle_clear_subscriptions(message: types.Message, bot: Bot):
         await message.answer("ℹ️ У вас нет активных подписок.")
         return
     
-    count = len(user_subscriptions[user_id])
-    user_subscriptions[user_id].clear()
-    save_state()
+    count = clear_user_subscriptions(user_id)
+    mark_state_dirty()
     
     await message.answer(
         f"✅ Все подписки удалены!\n\n"
@@ -463,7 +1645,7 @@ async def handle_clear_subscriptions(message: types.Message, bot: Bot):
 async def handle_my_subscriptions(message: types.Message, bot: Bot):
     """Обработка команды /my - показать свои подписки"""
     user_id = message.from_user.id
-    bot_users.add(user_id)
+    register_user(user_id)
     
     # Проверка подписки на канал
     if not await check_subscription(bot, user_id):
@@ -518,53 +1700,194 @@ async def handle_set_threshold(message: types.Message, bot: Bot):
     except ValueError:
         await message.answer("❌ Неверный формат порога. Введите число от 0 до 100.")
         return
-    user_thresholds[user_id] = threshold
-    save_state()
+    set_user_threshold(user_id, threshold)
+    mark_state_dirty()
     await message.answer(
         f"✅ Ваш персональный порог splash установлен: <b>{threshold}%</b>\n\n"
         f"Теперь алерты будут приходить только при изменении цены на {threshold}% и более.",
         parse_mode="HTML"
     )
 
+async def handle_set_oi_threshold(message: types.Message, bot: Bot):
+    """Обработка команды /setoithreshold ПРОЦЕНТ - установить персональный порог OI splash"""
+    user_id = message.from_user.id
+    
+    # Проверка подписки на канал
+    if not await check_subscription(bot, user_id):
+        await send_subscription_required(message)
+        return
+    
+    args = message.text.split(maxsplit=1)
+    if len(args) < 2:
+        await message.answer(
+            "❌ Укажите порог OI в процентах!\n\n"
+            "Пример: <code>/setoithreshold 15</code>",
+            parse_mode="HTML"
+        )
+        return
+    try:
+        threshold = float(args[1].replace(",", ".").strip())
+        if threshold <= 0 or threshold > 100:
+            raise ValueError
+    except ValueError:
+        await message.answer("❌ Неверный формат порога. Введите число от 0 до 100.")
+        return
+    set_user_oi_threshold(user_id, threshold)
+    mark_state_dirty()
+    await message.answer(
+        f"✅ Ваш персональный порог OI установлен: <b>{threshold}%</b>\n\n"
+        f"Теперь алерты OI будут приходить при изменении открытого интереса на {threshold}% и более.",
+        parse_mode="HTML"
+    )
+
 async def handle_my_threshold(message: types.Message):
     """Обработка команды /mythreshold - показать персональный порог splash"""
     user_id = message.from_user.id
     threshold = user_thresholds.get(user_id)
+    rule = user_windows.get(user_id)
+    window_text = f"\n📐 Оконный алерт: <b>{rule[0]}% за {rule[1] // 60} мин</b>" if rule else ""
+    window_text += f"\n📊 Порог OI: <b>{get_user_oi_threshold(user_id)}%</b>"
     if threshold is not None:
         await message.answer(
-            f"🔔 Ваш персональный порог splash: <b>{threshold}%</b>",
+            f"🔔 Ваш персональный порог splash: <b>{threshold}%</b>{window_text}",
             parse_mode="HTML"
         )
     else:
         await message.answer(
             f"🔔 У вас не установлен персональный порог splash.\n"
-            f"По умолчанию: <b>{CASUAL_SPLASH_THRESHOLD}%</b>\n\n"
+            f"По умолчанию: <b>{CASUAL_SPLASH_THRESHOLD}%</b>{window_text}\n\n"
             f"Установить свой: <code>/setthreshold 4.5</code>",
             parse_mode="HTML"
         )
 
+async def handle_set_window(message: types.Message, bot: Bot):
+    """Обработка команды /setwindow ПРОЦЕНТ МИНУТЫ - сплеш "X% за Y минут" (/setwindow off - выключить)"""
+    user_id = message.from_user.id
+    
+    # Проверка подписки на канал
+    if not await check_subscription(bot, user_id):
+        await send_subscription_required(message)
+        return
+    
+    allowed = ", ".join(str(w // 60) for w in SPLASH_WINDOWS)
+    args = message.text.split()
+    if len(args) == 2 and args[1].lower() == "off":
+        set_user_window(user_id, None)
+        mark_state_dirty()
+        await message.answer("✅ Оконные алерты выключены.")
+        return
+    if len(args) < 3:
+        rule = user_windows.get(user_id)
+        current = f"Сейчас: <b>{rule[0]}% за {rule[1] // 60} мин</b>\n\n" if rule else ""
+        await message.answer(
+            f"{current}"
+            f"❌ Укажите процент и окно в минутах ({allowed})!\n\n"
+            f"Пример: <code>/setwindow 3 5</code> - алерт при движении на 3% за 5 минут\n"
+            f"Выключить: <code>/setwindow off</code>",
+            parse_mode="HTML"
+        )
+        return
+    try:
+        percent = float(args[1].replace(",", ".").strip())
+        minutes = int(args[2])
+        if percent <= 0 or percent > 100 or minutes * 60 not in SPLASH_WINDOWS:
+            raise ValueError
+    except ValueError:
+        await message.answer(f"❌ Неверный формат. Процент от 0 до 100, окно: {allowed} мин.")
+        return
+    set_user_window(user_id, (percent, minutes * 60))
+    mark_state_dirty()
+    await message.answer(
+        f"✅ Оконный алерт установлен: <b>{percent}% за {minutes} мин</b>\n\n"
+        f"Работает для всех ваших монет вместе с обычным порогом splash.",
+        parse_mode="HTML"
+    )
+
+async def handle_cooldown(message: types.Message, bot: Bot):
+    """Обработка команды /cooldown [SYMBOL] МИНУТЫ|off - не чаще одного алерта каждого типа по монете за N минут"""
+    user_id = message.from_user.id
+    
+    # Проверка подписки на канал
+    if not await check_subscription(bot, user_id):
+        await send_subscription_required(message)
+        return
+    
+    args = message.text.split()
+    if len(args) < 2:
+        settings = user_cooldowns.get(user_id, {})
+        if settings:
+            lines = "\n".join(
+                f"  • {'все монеты' if scope == '*' else f'<code>{scope}</code>'}: {seconds / 60:g} мин"
+                for scope, seconds in sorted(settings.items())
+            )
+        else:
+            lines = "  <i>не установлены</i>"
+        await message.answer(
+            f"⏳ <b>Ваши кулдауны:</b>\n{lines}\n\n"
+            f"Подавлено алертов: <b>{alert_cooldowns.suppressed.get(user_id, 0)}</b>\n\n"
+            f"Все монеты: <code>/cooldown 10</code>\n"
+            f"Одна монета: <code>/cooldown BTC 30</code>\n"
+            f"Убрать: <code>/cooldown off</code> или <code>/cooldown BTC off</code>",
+            parse_mode="HTML"
+        )
+        return
+    
+    if len(args) >= 3:
+        symbol, possible = normalize_symbol(args[1])
+        if symbol is None:
+            hint = f"\n\nВозможно: <code>{possible[0]}</code>" if possible else ""
+            await message.answer(f"❌ Тикер <b>{args[1].upper()}</b> не найден{hint}", parse_mode="HTML")
+            return
+        scope, value = symbol, args[2]
+    else:
+        scope, value = "*", args[1]
+    scope_text = "всех монет" if scope == "*" else f"<b>{scope}</b>"
+    
+    if value.lower() == "off":
+        set_user_cooldown(user_id, scope, None)
+        alert_cooldowns.forget_user(user_id, scope)
+        mark_state_dirty()
+        await message.answer(f"✅ Кулдаун для {scope_text} снят.", parse_mode="HTML")
+        return
+    try:
+        minutes = float(value.replace(",", "."))
+        if minutes <= 0 or minutes > 24 * 60:
+            raise ValueError
+    except ValueError:
+        await message.answer("❌ Неверный формат. Укажите минуты от 0 до 1440 или off.")
+        return
+    set_user_cooldown(user_id, scope, minutes * 60)
+    alert_cooldowns.forget_user(user_id, scope)
+    mark_state_dirty()
+    await message.answer(
+        f"✅ Кулдаун для {scope_text}: <b>{minutes:g} мин</b>\n\n"
+        f"Каждый тип алерта (splash, fair price, OI) по монете будет приходить не чаще раза в {minutes:g} мин.",
+        parse_mode="HTML"
+    )
+
 async def handle_search(message: types.Message):
     """Обработка команды /search TERM - поиск доступных монет"""
     user_id = message.from_user.id
-    bot_users.add(user_id)
+    register_user(user_id)
     
-    # Извлекаем поисковый запрос
-    args = message.text.split(maxsplit=1)
+    # Извлекаем поисковый запрос: /search TERM [QUOTE]
+    args = message.text.split()
     if len(args) < 2:
-        # Показываем топ монет
-        top_symbols = list(available_contracts.keys())[:20]
+        # Показываем топ монет по объёму
+        top_symbols = symbol_index.top(SEARCH_RESULTS_LIMIT)
         symbols_list = "\n".join([f"  • <code>{s}</code>" for s in top_symbols])
         await message.answer(
-            f"🔍 <b>Топ 20 монет на MEXC:</b>\n\n{symbols_list}\n\n"
-            f"Для поиска используйте:\n<code>/search BTC</code>",
+            f"🔍 <b>Топ {SEARCH_RESULTS_LIMIT} монет на MEXC по объёму:</b>\n\n{symbols_list}\n\n"
+            f"Для поиска используйте:\n<code>/search BTC</code> или <code>/search BTC USDC</code>",
             parse_mode="HTML"
         )
         return
     
     search_term = args[1].upper().strip()
+    quote = args[2] if len(args) > 2 else None
     
-    # Ищем монеты
-    matches = [s for s in available_contracts.keys() if search_term in s]
+    # Ищем монеты (по индексу, отсортированы по объёму)
+    matches = symbol_index.search(search_term, quote)
     
     if not matches:
         await message.answer(
@@ -574,11 +1897,11 @@ async def handle_search(message: types.Message):
         )
         return
     
-    # Показываем первые 20 результатов
-    results = matches[:20]
+    # Показываем первые результаты
+    results = matches[:SEARCH_RESULTS_LIMIT]
     symbols_list = "\n".join([f"  • <code>{s}</code>" for s in results])
     
-    more_text = f"\n\n... и еще {len(matches) - 20} монет" if len(matches) > 20 else ""
+    more_text = f"\n\n... и еще {len(matches) - SEARCH_RESULTS_LIMIT} монет" if len(matches) > SEARCH_RESULTS_LIMIT else ""
     
     await message.answer(
         f"🔍 <b>Найдено монет:</b> {len(matches)}\n\n"
@@ -591,7 +1914,7 @@ async def handle_search(message: types.Message):
 async def handle_watch(message: types.Message):
     """Команда для перегляду поточного статусу монети"""
     user_id = message.from_user.id
-    bot_users.add(user_id)
+    register_user(user_id)
     
     # Извлекаем символ из команды
     args = message.text.split(maxsplit=1)
@@ -624,7 +1947,7 @@ async def handle_watch(message: types.Message):
         return
     
     # Получаем текущее состояние
-    state = splash_state.get(symbol)
+    state = get_splash_entry(symbol)
     subscribed = symbol in user_subscriptions.get(user_id, set())
     user_threshold = user_thresholds.get(user_id, CASUAL_SPLASH_THRESHOLD)
     
@@ -726,10 +2049,11 @@ async def handle_all_tracked(message: types.Message):
         await message.answer("❌ У вас нет доступа к этой команде.")
         return
     
-    # Собираем все уникальные монеты
-    all_tracked = set()
-    for subscribed_symbols in user_subscriptions.values():
-        all_tracked.update(subscribed_symbols)
+    # Все уникальные монеты с числом подписчиков - из базы или обратного индекса
+    if state_store is not None:
+        all_tracked = dict(await state_store.tracked_counts())
+    else:
+        all_tracked = {symbol: len(users) for symbol, users in symbol_subscribers.items()}
     
     if not all_tracked:
         await message.answer(
@@ -740,16 +2064,9 @@ async def handle_all_tracked(message: types.Message):
     
     # Сортируем и форматируем список
     sorted_coins = sorted(all_tracked)
-    coins_list = "\n".join([f"  • <code>{symbol}</code>" for symbol in sorted_coins])
-    
-    # Считаем сколько пользователей отслеживают каждую монету
-    coin_user_count = {}
-    for subscribed_symbols in user_subscriptions.values():
-        for symbol in subscribed_symbols:
-            coin_user_count[symbol] = coin_user_count.get(symbol, 0) + 1
     
     # Формируем статистику
-    detailed_list = "\n".join([f"  • <code>{symbol}</code> — {coin_user_count[symbol]} пользователь(ей)" for symbol in sorted_coins])
+    detailed_list = "\n".join([f"  • <code>{symbol}</code> — {all_tracked[symbol]} пользователь(ей)" for symbol in sorted_coins])
     
     response = (
         f"[TRACKED] Total unique coins: {len(all_tracked)}\n\n"
@@ -758,10 +2075,451 @@ async def handle_all_tracked(message: types.Message):
     
     await message.answer(response, parse_mode="HTML")
 
+async def handle_stats(message: types.Message):
+    """Обработка команды /stats - метрики мониторинга (только для админа)"""
+    user_id = message.from_user.id
+    
+    # Проверка админа
+    if admin_user_id and user_id != admin_user_id:
+        await message.answer("❌ У вас нет доступа к этой команде.")
+        return
+    
+    response = (
+        f"[STATS] Sweeps: {sweep_stats['cycles']}\n\n"
+        f"Symbols per sweep: <b>{sweep_stats['symbols']}</b> (changed {sweep_stats['changed']})\n"
+        f"Engine: {DETECTOR_ENGINE}, JSON: {JSON_BACKEND}\n"
+        f"Evaluated overall: {sweep_stats['changed_total']}/{sweep_stats['symbols_total']}\n"
+        f"Ticker fetch: {sweep_stats['fetch_ms']:.0f} ms\n"
+        f"Evaluation: {sweep_stats['eval_ms']:.1f} ms\n"
+        f"Between detections: {sweep_stats['cycle_ms']:.0f} ms (target {EVALUATION_CYCLE_TARGET * 1000:.0f} ms)\n"
+        f"Fetch → last symbol: {sweep_stats['lag_ms']:.1f} ms (max {sweep_stats['max_lag_ms']:.1f} ms)"
+    )
+    
+    if scheduler is not None:
+        task_lines = "\n".join(
+            f"  {t.name}: every {t.interval:g}s, runs {t.stats['runs']}, "
+            f"avg {t.stats['avg_ms']:.1f} ms, max {t.stats['max_ms']:.0f} ms, "
+            f"errors {t.stats['errors']}, timeouts {t.stats['timeouts']}"
+            for t in scheduler.tasks
+        )
+        response += f"\n\n<b>Tasks:</b>\n{task_lines}"
+    
+    for name, hs in http_clients.stats.items():
+        avg_wait = hs["queued_ms"] / hs["queued"] if hs["queued"] else 0.0
+        response += (
+            f"\n\n<b>HTTP {name}:</b> pool {HTTP_POOL_LIMITS[name]}, in flight {hs['in_flight']} (max {hs['max_in_flight']})\n"
+            f"Requests: {hs['requests']}, errors: {hs['errors']}\n"
+            f"Connections: new {hs['new_connections']}, reused {hs['reused_connections']}\n"
+            f"Waited for pool: {hs['queued']} (avg {avg_wait:.1f} ms), DNS hits/misses: {hs['dns_hits']}/{hs['dns_misses']}"
+        )
+    
+    ps = persist_stats
+    avg_write = ps["total_ms"] / ps["writes"] if ps["writes"] else 0.0
+    write_size = f"last batch: {ps['ops']} ops" if state_store is not None else f"size: {ps['bytes'] / 1024:.1f} KB"
+    if change_log is not None:
+        cl = change_log.stats
+        write_size += (
+            f"\nLog: {change_log.size / 1024:.1f} KB, appends: {cl['appends']}, compactions: {cl['compactions']}\n"
+            f"Replayed on start: {replay_stats['replayed']} records in {replay_stats['replay_ms']:.0f} ms"
+        )
+    response += (
+        f"\n\n<b>State ({STORAGE_BACKEND}):</b> {'есть несохранённые изменения' if state_dirty or (state_store is not None and state_store.pending) else 'сохранено'}\n"
+        f"Writes: {ps['writes']}, errors: {ps['errors']}, {write_size}\n"
+        f"Write: last {ps['last_ms']:.1f} ms, avg {avg_write:.1f} ms, max {ps['max_ms']:.1f} ms"
+    )
+    
+    window_bytes = sum(w.nbytes() for w in price_windows.values())
+    response += (
+        f"\n\n<b>Windows:</b> {len(user_windows)} rules, {len(symbol_window_thresholds)} coins, "
+        f"{len(price_windows)} buffers, ~{window_bytes / 1024:.1f} KB "
+        f"({16 * WINDOW_BUFFER_SIZE / 1024:.1f} KB buffer per coin)"
+    )
+    
+    ds = detector_state_stats
+    response += (
+        f"\n\n<b>Detector state:</b> {ds['entries']} монет, {ds['bytes'] / 1024:.1f} KB, "
+        f"saves: {ds['saves']}, last {ds['save_ms']:.1f} ms\n"
+        f"Restored on start: {ds['restored']}, discarded: {ds['discarded']}"
+    )
+    
+    ms = membership_cache.stats
+    response += (
+        f"\n\n<b>Membership cache:</b> {len(membership_cache.entries)}/{MEMBERSHIP_CACHE_SIZE}\n"
+        f"Hits: {ms['hits']}, misses: {ms['misses']}, coalesced: {ms['coalesced']}\n"
+        f"Evictions: {ms['evictions']}, invalidations: {ms['invalidations']}"
+    )
+    
+    cs = contract_catalog.stats
+    response += (
+        f"\n\n<b>Catalog:</b> {len(contract_catalog.contracts)} contracts, "
+        f"search index: {symbol_index.stats['rebuilds']} rebuilds ({symbol_index.stats['rebuild_ms']:.1f} ms), {symbol_index.stats['queries']} queries\n"
+        f"Refreshes: {cs['refreshes']} (unchanged {cs['unchanged']}, errors {cs['errors']}), "
+        f"last {cs['refresh_ms']:.0f} ms, diff {cs['last_diff']}"
+    )
+    
+    response += "\n\n<b>Sources:</b>"
+    for source in (market_source, reference_source):
+        if source is not None:
+            ss = source.stats
+            response += f"\n{source.name} every {source.interval:g}s: {ss['polls']} polls, {ss['errors']} errors, {ss['tickers']} tickers, last {ss['last_ms']:.0f} ms"
+    
+    if ticker_stream is not None:
+        ws = ticker_stream.stats
+        age = time.monotonic() - ticker_stream.last_message if ticker_stream.last_message else float("inf")
+        response += (
+            f"\n\n<b>WebSocket:</b> {'fresh' if ticker_stream.is_fresh() else 'stale → REST'}\n"
+            f"Messages: {ws['messages']}, tickers: {ws['tickers']}, reconnects: {ws['reconnects']}\n"
+            f"Last push: {age:.1f} s ago"
+        )
+    
+    if alert_dispatcher is not None:
+        ds = alert_dispatcher.stats
+        response += (
+            f"\n\n<b>Alerts:</b>\n"
+            f"Queue: {alert_dispatcher.queue.qsize()}/{ALERT_QUEUE_SIZE}\n"
+            f"Sent: {ds['sent']}, failed: {ds['failed']}, dropped: {ds['dropped']}, 429: {ds['retry_after']}\n"
+            f"Send latency: {ds['latency_ms']:.0f} ms (max {ds['max_latency_ms']:.0f} ms)"
+        )
+    
+    ac = alert_cooldowns.stats
+    response += (
+        f"\n\n<b>Cooldowns:</b> {len(user_cooldowns)} users, {len(alert_cooldowns.until)}/{ALERT_COOLDOWN_MAX_ENTRIES} active\n"
+        f"Checked: {ac['checked']}, suppressed: {ac['suppressed']}, evicted: {ac['evicted']}"
+    )
+    
+    if alert_coalescer is not None:
+        co = alert_coalescer.stats
+        reduction = 1 - co["messages"] / co["alerts"] if co["alerts"] else 0.0
+        response += (
+            f"\n\n<b>Coalescing:</b> window {ALERT_COALESCE_WINDOW:g} s, batch ≤ {ALERT_COALESCE_MAX_BATCH}\n"
+            f"Alerts: {co['alerts']} → messages: {co['messages']} (digests {co['digests']}), "
+            f"reduction {reduction:.0%}"
+        )
+    
+    await message.answer(response, parse_mode="HTML")
+
 async def bot_polling(bot: Bot, dp: Dispatcher):
     """Запуск polling для обработки команд"""
     print("[BOT] Запущен обработчик команд...")
-    await dp.start_polling(bot)
+    await dp.start_polling(bot, allowed_updates=dp.resolve_used_update_types())
+
+# ----------------- Alert dispatch -----------------
+@dataclass(slots=True)
+class OutgoingAlert:
+    chat_id: int
+    alert: PreparedAlert  # один объект на всех получателей события
+    created: float
+    attempts: int = 0
+
+class AlertDispatcher:
+    """Очередь исходящих алертов с воркерами, которые соблюдают лимиты Telegram.
+
+    Мониторинг только кладёт алерты в очередь (submit), отправка идёт в
+    отдельных задачах: общий лимит сообщений в секунду, интервал на чат,
+    повтор после 429 retry_after и политика выброса при переполнении.
+    """
+
+    def __init__(self):
+        self.session: aiohttp.ClientSession | None = None
+        self.queue: asyncio.Queue = asyncio.Queue(maxsize=ALERT_QUEUE_SIZE)
+        self.workers: list = []
+        self._next_global_slot = 0.0
+        self._chat_next_slot: Dict[int, float] = {}
+        self.stats = {
+            "enqueued": 0,
+            "sent": 0,
+            "failed": 0,
+            "dropped": 0,
+            "retry_after": 0,
+            "latency_ms": 0.0,  # скользящее среднее от постановки в очередь до отправки
+            "max_latency_ms": 0.0,
+        }
+
+    def start(self):
+        self.session = http_clients.session("telegram")
+        for i in range(ALERT_WORKERS):
+            self.workers.append(asyncio.create_task(self._worker(), name=f"alert-worker-{i}"))
+        print(f"[DISPATCH] Started {ALERT_WORKERS} workers, queue size {ALERT_QUEUE_SIZE}")
+
+    async def stop(self, drain_timeout: float = ALERT_DRAIN_TIMEOUT):
+        """Даёт воркерам дослать очередь (не дольше drain_timeout), потом останавливает их"""
+        if self.workers:
+            try:
+                await asyncio.wait_for(self.queue.join(), drain_timeout)
+            except asyncio.TimeoutError:
+                print(f"[DISPATCH] Shutdown: {self.queue.qsize()} alerts left unsent")
+        for task in self.workers:
+            task.cancel()
+        await asyncio.gather(*self.workers, return_exceptions=True)
+        self.workers.clear()
+
+    async def submit(self, chat_id: int, prepared: PreparedAlert) -> bool:
+        """Ставит алерт в очередь. При почти полной очереди недолго ждёт, потом применяет политику выброса"""
+        alert = OutgoingAlert(chat_id=chat_id, alert=prepared, created=time.perf_counter())
+        if self.queue.qsize() >= ALERT_QUEUE_SIZE * ALERT_BACKPRESSURE_RATIO:
+            try:
+                await asyncio.wait_for(self.queue.put(alert), ALERT_BACKPRESSURE_TIMEOUT)
+                self.stats["enqueued"] += 1
+                return True
+            except asyncio.TimeoutError:
+                pass
+        return self._put_nowait(alert)
+
+    def _put_nowait(self, alert: OutgoingAlert) -> bool:
+        try:
+            self.queue.put_nowait(alert)
+        except asyncio.QueueFull:
+            self.stats["dropped"] += 1
+            if ALERT_DROP_POLICY == "newest":
+                return False
+            # Выбрасываем самый старый алерт - он уже наименее актуален
+            self.queue.get_nowait()
+            self.queue.task_done()
+            self.queue.put_nowait(alert)
+        self.stats["enqueued"] += 1
+        return True
+
+    async def _wait_for_slot(self, chat_id: int):
+        """Резервирует ближайший слот с учётом общего лимита и лимита на чат"""
+        now = time.monotonic()
+        slot = max(now, self._next_global_slot, self._chat_next_slot.get(chat_id, 0.0))
+        self._next_global_slot = slot + 1 / TELEGRAM_GLOBAL_RATE
+        self._chat_next_slot[chat_id] = slot + TELEGRAM_PER_CHAT_INTERVAL
+        if len(self._chat_next_slot) > ALERT_QUEUE_SIZE:
+            self._chat_next_slot = {k: v for k, v in self._chat_next_slot.items() if v > now}
+        if slot > now:
+            await asyncio.sleep(slot - now)
+
+
+    async def _worker(self):
+        while True:
+            alert = await self.queue.get()
+            try:
+                await self._send(alert)
+            except Exception as e:
+                # один плохой алерт не должен останавливать воркер
+                self.stats["failed"] += 1
+                print(f"[DISPATCH] Worker error on {alert.alert.kind} alert to user {alert.chat_id}: {e!r}")
+            finally:
+                self.queue.task_done()
+
+    async def _send(self, alert: OutgoingAlert):
+        while True:
+            alert.attempts += 1
+            await self._wait_for_slot(alert.chat_id)
+            try:
+                status, response = await send_telegram_message(self.session, alert.chat_id, alert.alert)
+                if not isinstance(response, dict):
+                    # пустое или не-JSON тело (например 502 от прокси)
+                    raise ValueError(f"HTTP {status}: unexpected response {response!r}")
+            except Exception as e:
+                if alert.attempts < ALERT_MAX_ATTEMPTS:
+                    continue
+                self.stats["failed"] += 1
+                print(f"[BOT] Failed to send {alert.alert.kind} alert to user {alert.chat_id}: {e}")
+                return
+
+            if status == 429:
+                self.stats["retry_after"] += 1
+                retry_after = (response.get("parameters") or {}).get("retry_after", 1)
+                # Telegram просит подождать - откладываем все отправки, а не только этот чат
+                pause_until = time.monotonic() + retry_after
+                self._next_global_slot = max(self._next_global_slot, pause_until)
+                self._chat_next_slot[alert.chat_id] = max(self._chat_next_slot.get(alert.chat_id, 0.0), pause_until)
+                print(f"[DISPATCH] 429 for {alert.chat_id}, retry after {retry_after}s")
+                if alert.attempts < ALERT_MAX_ATTEMPTS:
+                    continue
+                self.stats["failed"] += 1
+                return
+            if not response.get("ok"):
+                # 400/403: бот заблокирован или чат не существует - повтор не поможет
+                if status >= 500 and alert.attempts < ALERT_MAX_ATTEMPTS:
+                    continue
+                self.stats["failed"] += 1
+                print(f"[BOT] Failed to send {alert.alert.kind} alert to user {alert.chat_id}: {response.get('description')}")
+                return
+
+            latency_ms = (time.perf_counter() - alert.created) * 1000
+            self.stats["sent"] += 1
+            self.stats["latency_ms"] = self.stats["latency_ms"] * 0.9 + latency_ms * 0.1
+            self.stats["max_latency_ms"] = max(self.stats["max_latency_ms"], latency_ms)
+            return
+
+alert_dispatcher: AlertDispatcher | None = None
+
+class AlertCoalescer:
+    """Склейка алертов по пользователю перед AlertDispatcher.
+
+    Первый алерт пользователю уходит сразу и открывает окно
+    ALERT_COALESCE_WINDOW; всё, что пришло ему внутри окна, уходит одним
+    дайджестом в конце окна (или раньше, если набралось ALERT_COALESCE_MAX_BATCH).
+    Пока алерты продолжают идти, окно продлевается.
+    """
+
+    def __init__(self, dispatcher: AlertDispatcher):
+        self.dispatcher = dispatcher
+        self.open_until: Dict[int, float] = {}  # chat_id -> конец текущего окна
+        self.pending: Dict[int, list] = {}  # chat_id -> [PreparedAlert]
+        self.deadlines: deque = deque()  # (конец окна, chat_id) по возрастанию - окно у всех одинаковое
+        self.task: asyncio.Task | None = None
+        self.stats = {"alerts": 0, "messages": 0, "digests": 0}
+
+    def start(self):
+        if ALERT_COALESCE_WINDOW > 0:
+            self.task = asyncio.create_task(self._flusher(), name="alert-coalescer")
+
+    async def stop(self):
+        if self.task is not None:
+            self.task.cancel()
+            await asyncio.gather(self.task, return_exceptions=True)
+        # недоотправленное - в очередь, пока воркеры ещё живы
+        for chat_id in list(self.pending):
+            await self._flush(chat_id)
+
+    async def submit(self, chat_id: int, prepared: PreparedAlert) -> bool:
+        self.stats["alerts"] += 1
+        if ALERT_COALESCE_WINDOW <= 0 or prepared.kind not in ALERT_COALESCE_KINDS:
+            self.stats["messages"] += 1
+            return await self.dispatcher.submit(chat_id, prepared)
+        now = time.monotonic()
+        if self.open_until.get(chat_id, 0.0) <= now:
+            self._open_window(chat_id, now)
+            self.stats["messages"] += 1
+            return await self.dispatcher.submit(chat_id, prepared)
+        batch = self.pending.setdefault(chat_id, [])
+        batch.append(prepared)
+        if len(batch) >= ALERT_COALESCE_MAX_BATCH:
+            return await self._flush(chat_id)
+        return True
+
+    def _open_window(self, chat_id: int, now: float):
+        deadline = now + ALERT_COALESCE_WINDOW
+        self.open_until[chat_id] = deadline
+        self.deadlines.append((deadline, chat_id))
+
+    async def _flush(self, chat_id: int) -> bool:
+        batch = self.pending.pop(chat_id, None)
+        if not batch:
+            return False
+        if len(batch) == 1:
+            self.stats["messages"] += 1
+            return await self.dispatcher.submit(chat_id, batch[0])
+        queued = True
+        for text in self._digest_texts(batch):
+            self.stats["messages"] += 1
+            self.stats["digests"] += 1
+            queued = await self.dispatcher.submit(chat_id, PreparedAlert.build("digest", text)) and queued
+        return queued
+
+    @staticmethod
+    def _digest_texts(batch: list) -> list:
+        """Тексты дайджеста; режем по границам алертов, чтобы не рвать HTML и уложиться в лимит Telegram"""
+        separator = "\n➖➖➖\n"
+        budget = TELEGRAM_MESSAGE_LIMIT - 100  # запас под заголовок
+        chunks, current, size = [], [], 0
+        for alert in batch:
+            part = alert.text.strip()[:budget]
+            if current and size + len(separator) + len(part) > budget:
+                chunks.append(current)
+                current, size = [], 0
+            current.append(part)
+            size += len(separator) + len(part)
+        chunks.append(current)
+        return [
+            f"📦 <b>{len(chunk)} алертов за {ALERT_COALESCE_WINDOW:g} с</b>\n\n" + separator.join(chunk)
+            for chunk in chunks
+        ]
+
+    async def _flusher(self):
+        tick = ALERT_COALESCE_WINDOW / 4
+        while True:
+            await asyncio.sleep(tick)
+            now = time.monotonic()
+            while self.deadlines and self.deadlines[0][0] <= now:
+                deadline, chat_id = self.deadlines.popleft()
+                if self.open_until.get(chat_id) != deadline:
+                    continue  # окно уже продлено, запись устарела
+                if chat_id in self.pending:
+                    # поток алертов не прекратился - продлеваем окно
+                    self._open_window(chat_id, now)
+                    await self._flush(chat_id)
+                else:
+                    del self.open_until[chat_id]
+
+alert_coalescer: AlertCoalescer | None = None
+
+class AlertCooldowns:
+    """Кулдауны по (пользователь, монета, тип алерта).
+
+    Запись создаётся только для пользователей, включивших /cooldown, и
+    живёт до истечения кулдауна. Словарь упорядочен по времени последнего
+    алерта (ключ переставляется в конец), поэтому при переполнении
+    вытесняются самые старые; проверка - один lookup в dict.
+    """
+
+    def __init__(self, max_entries: int):
+        self.max_entries = max_entries
+        self.until: Dict[tuple, float] = {}  # (user_id, symbol, kind) -> monotonic время окончания
+        self.suppressed: Dict[int, int] = {}  # user_id -> подавлено алертов
+        self.stats = {"checked": 0, "suppressed": 0, "evicted": 0}
+
+    def admit(self, recipients, symbol: str, kind: str, now: float) -> list:
+        """Получатели, у которых этот алерт не под кулдауном (и запуск их кулдауна)"""
+        allowed = []
+        for user_id in recipients:
+            settings = user_cooldowns.get(user_id)
+            if settings is None:
+                allowed.append(user_id)
+                continue
+            seconds = settings.get(symbol, settings.get("*", 0))
+            if seconds <= 0:
+                allowed.append(user_id)
+                continue
+            self.stats["checked"] += 1
+            key = (user_id, symbol, kind)
+            until = self.until.pop(key, None)
+            if until is not None and until > now:
+                self.until[key] = until
+                self.stats["suppressed"] += 1
+                self.suppressed[user_id] = self.suppressed.get(user_id, 0) + 1
+                continue
+            self.until[key] = now + seconds
+            allowed.append(user_id)
+        if len(self.until) > self.max_entries:
+            self._shrink(now)
+        return allowed
+
+    def _shrink(self, now: float):
+        expired = [key for key, until in self.until.items() if until <= now]
+        for key in expired:
+            del self.until[key]
+        while len(self.until) > self.max_entries:
+            del self.until[next(iter(self.until))]
+            self.stats["evicted"] += 1
+
+    def forget_user(self, user_id: int, scope: str):
+        """Сбросить активные кулдауны после изменения настроек"""
+        for key in [key for key in self.until if key[0] == user_id and (scope == "*" or key[1] == scope)]:
+            del self.until[key]
+
+alert_cooldowns = AlertCooldowns(ALERT_COOLDOWN_MAX_ENTRIES)
+
+async def dispatch_alert(recipients, text: str, kind: str, symbol: str | None = None) -> int:
+    """Ставит один готовый алерт в очередь для всех получателей, возвращает число поставленных.
+    С symbol учитываются кулдауны пользователей"""
+    if alert_dispatcher is None:
+        return 0
+    if symbol is not None and user_cooldowns:
+        recipients = alert_cooldowns.admit(recipients, symbol, kind, time.monotonic())
+        if not recipients:
+            return 0
+    prepared = PreparedAlert.build(kind, text)
+    target = alert_coalescer or alert_dispatcher
+    queued = 0
+    for user_id in recipients:
+        if await target.submit(user_id, prepared):
+            queued += 1
+    return queued
 
 # ----------------- FairPrice -----------------
 async def send_fairprice_message(session, bot: Bot, md, change):
@@ -773,29 +2531,27 @@ async def send_fairprice_message(session, bot: Bot, md, change):
     side = "long" if change > 0 else "short"
     link = f"https://www.mexc.com/ru-RU/futures/{symbol}?lang=ru-RU"
 
+    reference = reference_price(symbol)
+    reference_line = f"{reference_source.name}: {reference} ({(md.lastPrice - reference) / reference * 100:+.2f}%)\n" if reference else ""
+
     msg = (
         f"{emoji} <a href='{link}'>${md.tickerContract.baseCoin}</a> Fair Price {change:.2f}%\n"
         f"LastPrice: {md.lastPrice}\n"
-        f"FairPrice: {md.fairPrice}\n\n"
+        f"FairPrice: {md.fairPrice}\n"
+        f"{reference_line}\n"
         f'Side: {side}\n'
         f"Limit: ~${limit_usd:,.2f}"
     )
     
-    # Отправляем всем пользователям, подписанным на этот символ
-    sent_count = 0
-    for user_id, subscribed_symbols in user_subscriptions.items():
-        if symbol in subscribed_symbols:
-            try:
-                await bot.send_message(chat_id=user_id, text=msg, parse_mode="HTML", disable_web_page_preview=True)
-                sent_count += 1
-            except Exception as e:
-                print(f"[BOT] Failed to send fairprice alert to user {user_id}: {e}")
+    # Ставим в очередь всем пользователям, подписанным на этот символ
+    sent_count = await dispatch_alert(tuple(symbol_subscribers.get(symbol, ())), msg, "fairprice", symbol)
     
     if sent_count > 0:
-        print(f"[ALERT] Fair Price {symbol}: {change:.2f}% → sent to {sent_count} user(s)")
+        print(f"[ALERT] Fair Price {symbol}: {change:.2f}% → queued for {sent_count} user(s)")
 
-async def send_splash_message(session, bot: Bot, direction, change, splash_state_entry: dict, current_price, market_data_entry: TickerMarketData):
-    """Отправка алерта Price Splash всем подписанным пользователям"""
+async def send_splash_message(session, bot: Bot, direction, change, splash_state_entry: dict, current_price, market_data_entry: TickerMarketData, recipients=None, window=None):
+    """Отправка алерта Price Splash подписанным пользователям (или только recipients).
+    window - окно правила "X% за Y минут" в секундах, если алерт оконный"""
     symbol = market_data_entry.tickerContract.symbol
     now = time.time()
     max_price = splash_state_entry['max']
@@ -817,29 +2573,25 @@ async def send_splash_message(session, bot: Bot, direction, change, splash_state
         f"Limit: ~${limit_usd:,.2f}\n\n"
         f"⏱️ {duration:.1f} min\n"
     )
+    if window:
+        message += f"📐 Окно: {window // 60} min\n"
     
-    # Отправляем всем пользователям, подписанным на этот символ
-    sent_count = 0
-    for user_id, subscribed_symbols in user_subscriptions.items():
-        if symbol in subscribed_symbols:
-            try:
-                await bot.send_message(chat_id=user_id, text=message, parse_mode="HTML", disable_web_page_preview=True)
-                sent_count += 1
-            except Exception as e:
-                print(f"[BOT] Failed to send splash alert to user {user_id}: {e}")
+    if recipients is None:
+        recipients = tuple(symbol_subscribers.get(symbol, ()))
+    
+    # Ставим в очередь пользователям, чей порог пересечён
+    sent_count = await dispatch_alert(recipients, message, "splash", symbol)
     
     if sent_count > 0:
-        print(f"[ALERT] Price Splash {symbol}: {sign}{change:.2f}% → sent to {sent_count} user(s)")
+        print(f"[ALERT] Price Splash {symbol}: {sign}{change:.2f}% → queued for {sent_count} user(s)")
 
 
-async def send_holdvol_splash(session, bot: Bot, md_entry: TickerMarketData, direction, change_percent, state_entry):
-    """Отправка алерта Open Interest всем подписанным пользователям"""
+async def send_holdvol_splash(session, bot: Bot, md_entry: TickerMarketData, direction, change_percent, old_oi, recipients):
+    """Отправка алерта Open Interest подписчикам, чей порог OI пересечён (old_oi - OI прошлого алерта)"""
     symbol = md_entry.tickerContract.symbol
     emoji = "🟢" if direction == "up" else "🔴"
     link = f"https://www.mexc.com/ru-RU/futures/{symbol}?lang=ru-RU"
 
-    # старое и новое значение OI
-    old_oi = state_entry["last_alert_holdvol"]
     new_oi = md_entry.openInterest
 
     # в миллионах
@@ -856,16 +2608,9 @@ async def send_holdvol_splash(session, bot: Bot, md_entry: TickerMarketData, dir
         f"${old_usd:,.2f} —> ${new_usd:,.2f}"
     )
 
-    # обновляем last_alert_holdvol в переданном state_entry
-    state_entry["last_alert_holdvol"] = new_oi
-    
-    # Отправляем всем пользователям, подписанным на этот символ
-    for user_id, subscribed_symbols in user_subscriptions.items():
-        if symbol in subscribed_symbols:
-            try:
-                await bot.send_message(chat_id=user_id, text=msg, parse_mode="HTML", disable_web_page_preview=True)
-            except Exception as e:
-                print(f"[BOT] Failed to send OI alert to user {user_id}: {e}")
+    sent_count = await dispatch_alert(recipients, msg, "oi", symbol)
+    if sent_count > 0:
+        print(f"[ALERT] OI Splash {symbol}: {change_percent:+.2f}% → queued for {sent_count} user(s)")
 
 # ----------------- Price splash -----------------
 async def check_price(md_entry: TickerMarketData, session, bot: Bot = None):
@@ -874,6 +2619,11 @@ async def check_price(md_entry: TickerMarketData, session, bot: Bot = None):
     if symbol in SYMBOLS_TO_IGNORE or price == 0:
         return
     
+    # Монеты без подписчиков не отслеживаем вовсе
+    ladder = symbol_thresholds.get(symbol)
+    if not ladder or not ladder.users:
+        return
+    
     is_stock = md_entry.tickerContract.isStock
     if is_stock:
         return
@@ -882,9 +2632,7 @@ async def check_price(md_entry: TickerMarketData, session, bot: Bot = None):
 
     if symbol not in splash_state:
         splash_state[symbol] = {"max": price, "max_ts": now, "min": price, "min_ts": now, "last_direction": None}
-        # Логування для відстежуваних монет
-        if any(symbol in subs for subs in user_subscriptions.values()):
-            print(f"[WATCH] {symbol} initialized at {price}")
+        print(f"[WATCH] {symbol} initialized at {price}")
         return
 
     s = splash_state[symbol]
@@ -903,42 +2651,36 @@ async def check_price(md_entry: TickerMarketData, session, bot: Bot = None):
     pump = (price - s["min"]) / s["min"] * 100
     
     # Детальне логування для відстежуваних монет
-    is_watched = any(symbol in subs for subs in user_subscriptions.values())
-    if is_watched and (abs(drop) > 0.05 or abs(pump) > 0.05):  # логуємо навіть малі зміни
+    if abs(drop) > 0.05 or abs(pump) > 0.05:  # логуємо навіть малі зміни
         print(f"[WATCH] {symbol}: price={price:.8f}, pump={pump:+.2f}%, drop={drop:+.2f}%, direction={s['last_direction']}")
     
-    # Перевіряємо drop - чи є хтось підписаний і чи відповідає їх порогу
-    if s["last_direction"] != "down":
-        for user_id, subscribed_symbols in user_subscriptions.items():
-            if symbol not in subscribed_symbols:
-                continue
-            user_threshold = user_thresholds.get(user_id, CASUAL_SPLASH_THRESHOLD)
-            if abs(drop) >= user_threshold:
-                print(f"[TRIGGER] {symbol} drop {drop:.2f}% ≥ user {user_id} threshold {user_threshold}%")
-                await send_splash_message(session, bot, "down", drop, s, price, md_entry)
-                s["last_direction"] = "down"
-                s["min"] = price
-                s["min_ts"] = now
-                break
+    # Мінімальний поріг серед підписників - одне порівняння замість перебору
+    min_threshold = ladder.min_threshold
     
-    # Перевіряємо pump - чи є хтось підписаний і чи відповідає їх порогу
-    if s["last_direction"] != "up":
-        for user_id, subscribed_symbols in user_subscriptions.items():
-            if symbol not in subscribed_symbols:
-                continue
-            user_threshold = user_thresholds.get(user_id, CASUAL_SPLASH_THRESHOLD)
-            if pump >= user_threshold:
-                print(f"[TRIGGER] {symbol} pump {pump:.2f}% ≥ user {user_id} threshold {user_threshold}%")
-                await send_splash_message(session, bot, "up", pump, s, price, md_entry)
-                s["last_direction"] = "up"
-                s["max"] = price
-                s["max_ts"] = now
-                break
+    # Перевіряємо drop
+    if s["last_direction"] != "down" and abs(drop) >= min_threshold:
+        recipients = ladder.crossed(drop)
+        print(f"[TRIGGER] {symbol} drop {drop:.2f}% ≥ min threshold {min_threshold}% ({len(recipients)} user(s))")
+        await send_splash_message(session, bot, "down", drop, s, price, md_entry, recipients)
+        s["last_direction"] = "down"
+        s["min"] = price
+        s["min_ts"] = now
+    
+    # Перевіряємо pump
+    if s["last_direction"] != "up" and pump >= min_threshold:
+        recipients = ladder.crossed(pump)
+        print(f"[TRIGGER] {symbol} pump {pump:.2f}% ≥ min threshold {min_threshold}% ({len(recipients)} user(s))")
+        await send_splash_message(session, bot, "up", pump, s, price, md_entry, recipients)
+        s["last_direction"] = "up"
+        s["max"] = price
+        s["max_ts"] = now
 
 async def check_fairprice(md_entry: TickerMarketData, session, bot: Bot = None):
     symbol = md_entry.tickerContract.symbol
     if not md_entry.fairPrice or not md_entry.lastPrice:
         return
+    if symbol not in symbol_subscribers:
+        return
 
     change = (md_entry.fairPrice - md_entry.lastPrice) / md_entry.fairPrice * 100
     abs_change = abs(change)
@@ -946,7 +2688,9 @@ async def check_fairprice(md_entry: TickerMarketData, session, bot: Bot = None):
     state = fairprice_state.get(symbol)
 
     if abs_change < FAIRPRICE_CHANGE_THRESHOLD:
-        fairprice_state.pop(symbol, None)
+        # гистерезис: колебания у порога не сбрасывают состояние и не дают повторных алертов
+        if abs_change < FAIRPRICE_CHANGE_THRESHOLD - FAIRPRICE_HYSTERESIS:
+            fairprice_state.pop(symbol, None)
         return
 
     if state is None or state["side"] != side:
@@ -964,6 +2708,9 @@ async def check_holdvol_splash(md_entry: TickerMarketData, session, bot: Bot = N
     symbol = md_entry.tickerContract.symbol
     if symbol in SYMBOLS_TO_IGNORE or md_entry.openInterest == 0:
         return
+    ladder = symbol_oi_thresholds.get(symbol)
+    if not ladder or not ladder.users:
+        return
 
     current_oi = md_entry.openInterest
 
@@ -994,115 +2741,1085 @@ async def check_holdvol_splash(md_entry: TickerMarketData, session, bot: Bot = N
     drop = (current_oi - state["max"]) / state["max"] * 100
     pump = (current_oi - state["min"]) / state["min"] * 100
 
+    min_threshold = ladder.min_threshold
+
     # сплеш вниз
-    if drop <= -HOLDVOL_SPLASH_THRESHOLD and state["last_direction"] != "down":
+    if drop <= -min_threshold and state["last_direction"] != "down":
         if bot:
-            await send_holdvol_splash(session, bot, md_entry, "down", drop, state)
+            await send_holdvol_splash(session, bot, md_entry, "down", drop, state["last_alert_holdvol"], ladder.crossed(drop))
+        state["last_alert_holdvol"] = current_oi
         state["last_direction"] = "down"
         state["min"] = current_oi
         state["min_ts"] = now
 
     # сплеш вверх
-    if pump >= HOLDVOL_SPLASH_THRESHOLD and state["last_direction"] != "up":
+    if pump >= min_threshold and state["last_direction"] != "up":
         if bot:
-            await send_holdvol_splash(session, bot, md_entry, "up", pump, state)
+            await send_holdvol_splash(session, bot, md_entry, "up", pump, state["last_alert_holdvol"], ladder.crossed(pump))
+        state["last_alert_holdvol"] = current_oi
         state["last_direction"] = "up"
         state["max"] = current_oi
         state["max_ts"] = now
-# ----------------- MEXC API -----------------
-async def get_mexc_tickers_contract_detail(session) -> Dict[str, TickerContractDetail]:
-    async with session.get("https://contract.mexc.com/api/v1/contract/detail") as r:
-        data = (await r.json())["data"]
-
-    contracts = {}
-    for c in data:
-        is_stock = any("stock" in x.lower() for x in c.get("conceptPlate", []))
-        contracts[c["symbol"]] = TickerContractDetail(
-            symbol=c["symbol"],
-            isStock=is_stock,
-            limitMaxVol=float(c["limitMaxVol"]),
-            contractSize=float(c["contractSize"]),
-            quoteCoin=c["quoteCoinName"],
-            baseCoin=c["baseCoinName"],
-            maxVol=float(c["maxVol"]),
-        )
-    return contracts
 
-async def get_mexc_tickers_market_data(session, contracts):
-    async with session.get("https://contract.mexc.com/api/v1/contract/ticker") as r:
-        data = (await r.json())["data"]
+# ----------------- Rolling windows -----------------
+class RollingWindow:
+    """Кольцевой буфер (ts, price) монеты и монотонные очереди max/min по каждому окну SPLASH_WINDOWS.
+
+    Очереди хранят порядковые номера точек буфера (номер старше capacity -
+    точка уже перезаписана), поэтому память фиксирована, а push и запрос
+    max/min - амортизированно O(1) на окно.
+    """
 
-    market = {}
-    for t in data:
-        c = contracts.get(t["symbol"])
-        if not c:
+    __slots__ = ("capacity", "ts", "price", "seq", "max_q", "min_q", "last_dir", "last_alert_ts")
+
+    def __init__(self, capacity: int = WINDOW_BUFFER_SIZE):
+        self.capacity = capacity
+        self.ts = array("d", bytes(8 * capacity))
+        self.price = array("d", bytes(8 * capacity))
+        self.seq = 0  # номер следующей точки
+        self.max_q = [deque() for _ in SPLASH_WINDOWS]
+        self.min_q = [deque() for _ in SPLASH_WINDOWS]
+        self.last_dir = [0] * len(SPLASH_WINDOWS)  # направление последнего алерта по окну (1/-1)
+        self.last_alert_ts = [0.0] * len(SPLASH_WINDOWS)
+
+    def last_ts(self) -> float:
+        return self.ts[(self.seq - 1) % self.capacity] if self.seq else 0.0
+
+    def push(self, ts: float, price: float):
+        cap = self.capacity
+        seq = self.seq
+        self.ts[seq % cap] = ts
+        self.price[seq % cap] = price
+        self.seq = seq + 1
+        for k in range(len(SPLASH_WINDOWS)):
+            q = self.max_q[k]
+            while q and self.price[q[-1] % cap] <= price:
+                q.pop()
+            q.append(seq)
+            q = self.min_q[k]
+            while q and self.price[q[-1] % cap] >= price:
+                q.pop()
+            q.append(seq)
+            self._evict(k, ts)
+
+    def _evict(self, k: int, now: float):
+        cap = self.capacity
+        oldest = self.seq - cap
+        cutoff = now - SPLASH_WINDOWS[k]
+        for q in (self.max_q[k], self.min_q[k]):
+            while q and (q[0] < oldest or self.ts[q[0] % cap] < cutoff):
+                q.popleft()
+
+    def extremes(self, k: int, now: float, price: float) -> tuple:
+        """(max, max_ts, min, min_ts) за окно k с учётом текущей цены"""
+        self._evict(k, now)
+        cap = self.capacity
+        max_, max_ts, min_, min_ts = price, now, price, now
+        if self.max_q[k]:
+            i = self.max_q[k][0] % cap
+            if self.price[i] > price:
+                max_, max_ts = self.price[i], self.ts[i]
+        if self.min_q[k]:
+            i = self.min_q[k][0] % cap
+            if self.price[i] < price:
+                min_, min_ts = self.price[i], self.ts[i]
+        return max_, max_ts, min_, min_ts
+
+    def mark_alert(self, k: int, direction: int, now: float, price: float):
+        """После алерта отсчёт идёт от текущей цены (как min/max = price в check_price)"""
+        if self.last_ts() != now:
+            self.push(now, price)
+        q = self.min_q[k] if direction == -1 else self.max_q[k]
+        q.clear()
+        q.append(self.seq - 1)
+        self.last_dir[k] = direction
+        self.last_alert_ts[k] = now
+
+    def nbytes(self) -> int:
+        """Примерная память: буфер + номера в очередях"""
+        return 16 * self.capacity + 8 * sum(len(q) for q in self.max_q + self.min_q)
+
+async def check_price_windows(snapshot: MarketSnapshot, now: float, session, bot: Bot = None):
+    """Сплеши по правилам "X% за Y минут" для монет, где такие правила есть"""
+    for symbol, ladders in list(symbol_window_thresholds.items()):
+        row = snapshot.rows.get(symbol)
+        if row is None or not snapshot.valid[row] or symbol in SYMBOLS_TO_IGNORE or snapshot.contracts[row].isStock:
             continue
-        # Пропускаємо якщо немає fairPrice
-        if "fairPrice" not in t or not t["fairPrice"]:
+        price = float(snapshot.last[row])
+        if price == 0:
             continue
-        market[t["symbol"]] = TickerMarketData(
-            tickerContract=c,
-            lastPrice=float(t["lastPrice"]),
-            fairPrice=float(t["fairPrice"]),
-            indexPrice=float(t["indexPrice"]),
-            fundingRate=float(t["fundingRate"]),
-            openInterest=float(t["holdVol"]),
-            volume24h=float(t["volume24"]),
-        )
-    return market
+        window = price_windows.get(symbol)
+        if window is None:
+            window = price_windows[symbol] = RollingWindow()
+        if now - window.last_ts() >= WINDOW_SAMPLE_INTERVAL:
+            window.push(now, price)
+
+        md_entry = None
+        for k, seconds in enumerate(SPLASH_WINDOWS):
+            ladder = ladders.get(seconds)
+            if ladder is None:
+                continue
+            max_, max_ts, min_, min_ts = window.extremes(k, now, price)
+            drop = (price - max_) / max_ * 100
+            pump = (price - min_) / min_ * 100
+            # повтор в ту же сторону - только после нового окна
+            locked = window.last_dir[k] if now - window.last_alert_ts[k] < seconds else 0
+            for direction, change, code in (("down", drop, -1), ("up", pump, 1)):
+                if locked == code or abs(change) < ladder.min_threshold:
+                    continue
+                md_entry = md_entry or snapshot.entry(row)
+                state_entry = {"max": max_, "max_ts": max_ts, "min": min_, "min_ts": min_ts}
+                recipients = ladder.crossed(change)
+                print(f"[TRIGGER] {symbol} {direction} {change:.2f}% within {seconds // 60}m ({len(recipients)} user(s))")
+                await send_splash_message(session, bot, direction, change, state_entry, price, md_entry, recipients, window=seconds)
+                window.mark_alert(k, code, now, price)
+                break
 
+# ----------------- Batch detector -----------------
+DIRECTION_NAMES = {0: None, 1: "up", -1: "down"}
 
-# ----------------- Main -----------------
-async def monitoring_loop(bot: Bot):
-    """Основній цикл моніторингу MEXC"""
-    global available_contracts
-    
-    timeout = aiohttp.ClientTimeout(total=5)
-    async with aiohttp.ClientSession(timeout=timeout) as session:
-        contracts = await get_mexc_tickers_contract_detail(session)
-        available_contracts = contracts  # Оновлюємо глобальний кеш
+class BatchDetector:
+    """check_price / check_fairprice / check_holdvol_splash по всьому снапшоту за один NumPy прохід.
 
-        last_contracts_update = time.time()
-        CONTRACTS_REFRESH_INTERVAL = 60  # обновляем раз в 60 секунд
+    Стан (max/min/мітки часу/last_direction) зберігається масивами, рядки
+    збігаються з рядками MarketSnapshot. Семантика повторює скалярні функції;
+    step повертає лише рядки, що перетнули мінімальний поріг своєї монети.
+    """
 
-        while True:
-            now = time.time()
-            
-            # обновляем contracts раз в минуту
-            if now - last_contracts_update >= CONTRACTS_REFRESH_INTERVAL:
+    def __init__(self, snapshot: MarketSnapshot):
+        self.snapshot = snapshot
+        self.size = 0
+        capacity = snapshot.capacity
+        f64 = lambda: np.zeros(capacity, dtype=np.float64)
+        # пороги і фільтри рядків
+        self.min_threshold = np.full(capacity, np.inf)
+        self.oi_threshold = np.full(capacity, np.inf)
+        self.is_stock = np.zeros(capacity, dtype=bool)
+        self.ignored = np.zeros(capacity, dtype=bool)
+        # price splash
+        self.s_init = np.zeros(capacity, dtype=bool)
+        self.s_max, self.s_max_ts, self.s_min, self.s_min_ts = f64(), f64(), f64(), f64()
+        self.s_dir = np.zeros(capacity, dtype=np.int8)
+        # fair price
+        self.fp_active = np.zeros(capacity, dtype=bool)
+        self.fp_side = np.zeros(capacity, dtype=np.int8)
+        self.fp_last = f64()
+        # open interest
+        self.h_init = np.zeros(capacity, dtype=bool)
+        self.h_max, self.h_max_ts, self.h_min, self.h_min_ts = f64(), f64(), f64(), f64()
+        self.h_dir = np.zeros(capacity, dtype=np.int8)
+        self.h_last_alert = f64()
+        # стан з диска для монет, яких ще немає в снапшоті
+        self.restored: Dict[str, dict] = {}
+
+    ARRAYS = (
+        "min_threshold", "oi_threshold", "is_stock", "ignored",
+        "s_init", "s_max", "s_max_ts", "s_min", "s_min_ts", "s_dir",
+        "fp_active", "fp_side", "fp_last",
+        "h_init", "h_max", "h_max_ts", "h_min", "h_min_ts", "h_dir", "h_last_alert",
+    )
+
+    def _sync_rows(self):
+        """Підтягує нові рядки снапшоту: розмір масивів, пороги, прапорці контракту"""
+        snap = self.snapshot
+        if len(snap) == self.size:
+            return
+        if snap.capacity > len(self.min_threshold):
+            for name in self.ARRAYS:
+                old = getattr(self, name)
+                new = np.full(snap.capacity, np.inf) if name in ("min_threshold", "oi_threshold") else np.zeros(snap.capacity, dtype=old.dtype)
+                new[:len(old)] = old
+                setattr(self, name, new)
+        for row in range(self.size, len(snap)):
+            self._sync_row(row)
+        self.size = len(snap)
+
+    def _sync_row(self, row: int):
+        symbol = self.snapshot.symbols[row]
+        self._sync_thresholds(row, symbol)
+        self.is_stock[row] = self.snapshot.contracts[row].isStock
+        self.ignored[row] = symbol in SYMBOLS_TO_IGNORE
+        record = self.restored.pop(symbol, None)
+        if record is not None:
+            self._restore_row(row, record)
+
+    def sync_threshold(self, symbol: str):
+        row = self.snapshot.rows.get(symbol)
+        if row is not None and row < self.size:
+            self._sync_thresholds(row, symbol)
+
+    def _sync_thresholds(self, row: int, symbol: str):
+        ladder = symbol_thresholds.get(symbol)
+        self.min_threshold[row] = ladder.min_threshold if ladder else np.inf
+        ladder = symbol_oi_thresholds.get(symbol)
+        self.oi_threshold[row] = ladder.min_threshold if ladder else np.inf
+
+    def sync_all_rows(self):
+        for row in range(self.size):
+            self._sync_row(row)
+
+    def forget(self, symbol: str):
+        """Скидає стан монети (аналог splash_state.pop и т.д.)"""
+        row = self.snapshot.rows.get(symbol)
+        if row is not None and row < self.size:
+            self.s_init[row] = False
+            self.fp_active[row] = False
+            self.h_init[row] = False
+        self.restored.pop(symbol, None)
+
+    def export_state(self) -> dict:
+        """Стан у форматі записів detector_state ({symbol: {"s"|"f"|"h": tuple}})"""
+        records = {}
+        n = self.size
+        for row in np.flatnonzero(self.s_init[:n] | self.fp_active[:n] | self.h_init[:n]):
+            record = {}
+            if self.s_init[row]:
+                record["s"] = (float(self.s_max[row]), float(self.s_max_ts[row]), float(self.s_min[row]), float(self.s_min_ts[row]), int(self.s_dir[row]))
+            if self.fp_active[row]:
+                record["f"] = (float(self.fp_last[row]), int(self.fp_side[row]))
+            if self.h_init[row]:
+                record["h"] = (float(self.h_max[row]), float(self.h_max_ts[row]), float(self.h_min[row]), float(self.h_min_ts[row]), float(self.h_last_alert[row]), int(self.h_dir[row]))
+            records[self.snapshot.symbols[row]] = record
+        for symbol, record in self.restored.items():
+            records.setdefault(symbol, record)
+        return records
+
+    def import_state(self, records: dict):
+        """Відновлює стан; монети без рядка отримають його при появі в снапшоті"""
+        for symbol, record in records.items():
+            row = self.snapshot.rows.get(symbol)
+            if row is not None and row < self.size:
+                self._restore_row(row, record)
+            else:
+                self.restored[symbol] = record
+
+    def _restore_row(self, row: int, record: dict):
+        if "s" in record:
+            self.s_max[row], self.s_max_ts[row], self.s_min[row], self.s_min_ts[row], self.s_dir[row] = record["s"]
+            self.s_init[row] = True
+        if "f" in record:
+            self.fp_last[row], self.fp_side[row] = record["f"]
+            self.fp_active[row] = True
+        if "h" in record:
+            self.h_max[row], self.h_max_ts[row], self.h_min[row], self.h_min_ts[row], self.h_last_alert[row], self.h_dir[row] = record["h"]
+            self.h_init[row] = True
+
+    def splash_entry(self, symbol: str) -> dict | None:
+        """Стан splash монети у форматі splash_state (для /watch)"""
+        row = self.snapshot.rows.get(symbol)
+        if row is None or row >= self.size or not self.s_init[row]:
+            return None
+        return {
+            "max": float(self.s_max[row]),
+            "max_ts": float(self.s_max_ts[row]),
+            "min": float(self.s_min[row]),
+            "min_ts": float(self.s_min_ts[row]),
+            "last_direction": DIRECTION_NAMES[int(self.s_dir[row])],
+            "current": float(self.snapshot.last[row]),
+        }
+
+    def step(self, rows: np.ndarray, now: float) -> list:
+        """Обробляє змінені рядки. Повертає події (kind, row, ...), стан уже оновлено"""
+        self._sync_rows()
+        events = []
+        if len(rows) == 0:
+            return events
+        rows = rows[np.isfinite(self.min_threshold[rows])]  # монети без підписників
+        self._step_splash(rows, now, events)
+        self._step_fairprice(rows, events)
+        self._step_holdvol(rows, now, events)
+        return events
+
+    def _step_splash(self, rows: np.ndarray, now: float, events: list):
+        snap = self.snapshot
+        rows = rows[(snap.last[rows] != 0) & ~self.ignored[rows] & ~self.is_stock[rows]]
+        price = snap.last[rows]
+
+        new = ~self.s_init[rows]
+        r = rows[new]
+        self.s_max[r] = self.s_min[r] = price[new]
+        self.s_max_ts[r] = self.s_min_ts[r] = now
+        self.s_dir[r] = 0
+        self.s_init[r] = True
+        rows, price = rows[~new], price[~new]
+
+        higher = price > self.s_max[rows]
+        self.s_max[rows[higher]] = price[higher]
+        self.s_max_ts[rows[higher]] = now
+        lower = price < self.s_min[rows]
+        self.s_min[rows[lower]] = price[lower]
+        self.s_min_ts[rows[lower]] = now
+
+        drop = (price - self.s_max[rows]) / self.s_max[rows] * 100
+        pump = (price - self.s_min[rows]) / self.s_min[rows] * 100
+        threshold = self.min_threshold[rows]
+
+        down = (self.s_dir[rows] != -1) & (np.abs(drop) >= threshold)
+        for i in np.flatnonzero(down):
+            events.append(("splash", int(rows[i]), "down", float(drop[i]), self._splash_state(rows[i])))
+        r = rows[down]
+        self.s_dir[r] = -1
+        self.s_min[r] = price[down]
+        self.s_min_ts[r] = now
+
+        up = (self.s_dir[rows] != 1) & (pump >= threshold)
+        for i in np.flatnonzero(up):
+            events.append(("splash", int(rows[i]), "up", float(pump[i]), self._splash_state(rows[i])))
+        r = rows[up]
+        self.s_dir[r] = 1
+        self.s_max[r] = price[up]
+        self.s_max_ts[r] = now
+
+    def _splash_state(self, row) -> dict:
+        return {
+            "max": float(self.s_max[row]),
+            "max_ts": float(self.s_max_ts[row]),
+            "min": float(self.s_min[row]),
+            "min_ts": float(self.s_min_ts[row]),
+        }
+
+    def _step_fairprice(self, rows: np.ndarray, events: list):
+        snap = self.snapshot
+        rows = rows[(snap.fair[rows] != 0) & (snap.last[rows] != 0)]
+        fair, last = snap.fair[rows], snap.last[rows]
+        change = (fair - last) / fair * 100
+        side = np.where(fair > last, 1, -1).astype(np.int8)
+
+        abs_change = np.abs(change)
+        quiet = abs_change < FAIRPRICE_CHANGE_THRESHOLD
+        self.fp_active[rows[abs_change < FAIRPRICE_CHANGE_THRESHOLD - FAIRPRICE_HYSTERESIS]] = False
+        rows, change, side = rows[~quiet], change[~quiet], side[~quiet]
+
+        active = self.fp_active[rows]
+        fresh = ~active | (self.fp_side[rows] != side)
+        stepped = active & ~fresh & (np.abs(change - self.fp_last[rows]) >= FAIRPRICE_STEP_THRESHOLD)
+        fire = fresh | stepped
+        for i in np.flatnonzero(fire):
+            events.append(("fairprice", int(rows[i]), float(change[i])))
+        r = rows[fire]
+        self.fp_active[r] = True
+        self.fp_side[r] = side[fire]
+        self.fp_last[r] = change[fire]
+
+    def _step_holdvol(self, rows: np.ndarray, now: float, events: list):
+        snap = self.snapshot
+        rows = rows[(snap.oi[rows] != 0) & ~self.ignored[rows]]
+        oi = snap.oi[rows]
+
+        new = ~self.h_init[rows]
+        r = rows[new]
+        self.h_max[r] = self.h_min[r] = self.h_last_alert[r] = oi[new]
+        self.h_max_ts[r] = self.h_min_ts[r] = now
+        self.h_dir[r] = 0
+        self.h_init[r] = True
+        rows, oi = rows[~new], oi[~new]
+
+        higher = oi > self.h_max[rows]
+        self.h_max[rows[higher]] = oi[higher]
+        self.h_max_ts[rows[higher]] = now
+        lower = oi < self.h_min[rows]
+        self.h_min[rows[lower]] = oi[lower]
+        self.h_min_ts[rows[lower]] = now
+
+        drop = (oi - self.h_max[rows]) / self.h_max[rows] * 100
+        pump = (oi - self.h_min[rows]) / self.h_min[rows] * 100
+        threshold = self.oi_threshold[rows]
+
+        down = (drop <= -threshold) & (self.h_dir[rows] != -1)
+        for i in np.flatnonzero(down):
+            events.append(("oi", int(rows[i]), "down", float(drop[i]), float(self.h_last_alert[rows[i]])))
+        r = rows[down]
+        self.h_last_alert[r] = oi[down]
+        self.h_dir[r] = -1
+        self.h_min[r] = oi[down]
+        self.h_min_ts[r] = now
+
+        up = (pump >= threshold) & (self.h_dir[rows] != 1)
+        for i in np.flatnonzero(up):
+            events.append(("oi", int(rows[i]), "up", float(pump[i]), float(self.h_last_alert[rows[i]])))
+        r = rows[up]
+        self.h_last_alert[r] = oi[up]
+        self.h_dir[r] = 1
+        self.h_max[r] = oi[up]
+        self.h_max_ts[r] = now
+
+market_detector = BatchDetector(market_snapshot)
+
+def get_splash_entry(symbol: str) -> dict | None:
+    """Стан splash монети з активного движка детекції"""
+    if DETECTOR_ENGINE == "batch":
+        return market_detector.splash_entry(symbol)
+    return splash_state.get(symbol)
+
+async def deliver_detector_events(events: list, snapshot: MarketSnapshot, session, bot: Bot):
+    """Рендер і постановка в очередь алертов по событиям BatchDetector"""
+    for event in events:
+        kind, row = event[0], event[1]
+        md_entry = snapshot.entry(row)
+        symbol = md_entry.tickerContract.symbol
+        if kind == "splash":
+            _, _, direction, change, state_entry = event
+            ladder = symbol_thresholds.get(symbol)
+            if ladder is None:
+                continue
+            recipients = ladder.crossed(change)
+            print(f"[TRIGGER] {symbol} {'drop' if direction == 'down' else 'pump'} {change:.2f}% ≥ min threshold {ladder.min_threshold}% ({len(recipients)} user(s))")
+            await send_splash_message(session, bot, direction, change, state_entry, md_entry.lastPrice, md_entry, recipients)
+        elif kind == "fairprice":
+            await send_fairprice_message(session, bot, md_entry, event[2])
+        elif kind == "oi":
+            _, _, direction, change, old_oi = event
+            ladder = symbol_oi_thresholds.get(symbol)
+            if ladder is None:
+                continue
+            await send_holdvol_splash(session, bot, md_entry, direction, change, old_oi, ladder.crossed(change))
+
+# ----------------- Detector state persistence -----------------
+# Файл: заголовок, затем записи (вид, длина символа, символ, поля вида).
+# "s" - splash: max, max_ts, min, min_ts, направление
+# "f" - fair price: last_alert_change, сторона (1 above / -1 below)
+# "h" - open interest: max, max_ts, min, min_ts, last_alert_holdvol, направление
+DETECTOR_STATE_MAGIC = b"SPLD"
+DETECTOR_STATE_VERSION = 1
+DETECTOR_STATE_HEADER = struct.Struct("<4sHdI")  # magic, версия, saved_at, число записей
+DETECTOR_STATE_ENTRY = struct.Struct("<cB")  # вид, длина символа
+DETECTOR_STATE_FIELDS = {
+    "s": struct.Struct("<ddddb"),
+    "f": struct.Struct("<db"),
+    "h": struct.Struct("<dddddb"),
+}
+DIRECTION_CODES = {None: 0, "up": 1, "down": -1}
+detector_state_stats = {"saves": 0, "entries": 0, "bytes": 0, "save_ms": 0.0, "restored": 0, "discarded": 0}
+
+def encode_detector_state(records: dict, saved_at: float) -> bytes:
+    parts = []
+    for symbol, record in records.items():
+        name = symbol.encode("utf-8")
+        for kind, values in record.items():
+            parts.append(DETECTOR_STATE_ENTRY.pack(kind.encode(), len(name)) + name + DETECTOR_STATE_FIELDS[kind].pack(*values))
+    return DETECTOR_STATE_HEADER.pack(DETECTOR_STATE_MAGIC, DETECTOR_STATE_VERSION, saved_at, len(parts)) + b"".join(parts)
+
+def decode_detector_state(data: bytes):
+    """Возвращает (saved_at, records)"""
+    magic, version, saved_at, count = DETECTOR_STATE_HEADER.unpack_from(data, 0)
+    if magic != DETECTOR_STATE_MAGIC or version != DETECTOR_STATE_VERSION:
+        raise ValueError(f"неизвестный формат {magic!r} v{version}")
+    offset = DETECTOR_STATE_HEADER.size
+    records = {}
+    for _ in range(count):
+        kind, name_len = DETECTOR_STATE_ENTRY.unpack_from(data, offset)
+        offset += DETECTOR_STATE_ENTRY.size
+        symbol = data[offset:offset + name_len].decode("utf-8")
+        offset += name_len
+        fields = DETECTOR_STATE_FIELDS[kind.decode()]
+        records.setdefault(symbol, {})[kind.decode()] = fields.unpack_from(data, offset)
+        offset += fields.size
+    return saved_at, records
+
+def export_scalar_state() -> dict:
+    """splash_state / fairprice_state / holdvol_state в формате записей"""
+    records = {}
+    for symbol, s in splash_state.items():
+        records.setdefault(symbol, {})["s"] = (s["max"], s["max_ts"], s["min"], s["min_ts"], DIRECTION_CODES[s["last_direction"]])
+    for symbol, s in fairprice_state.items():
+        records.setdefault(symbol, {})["f"] = (s["last_alert_change"], 1 if s["side"] == "above" else -1)
+    for symbol, s in holdvol_state.items():
+        records.setdefault(symbol, {})["h"] = (s["max"], s["max_ts"], s["min"], s["min_ts"], s["last_alert_holdvol"], DIRECTION_CODES[s["last_direction"]])
+    return records
+
+def import_scalar_state(records: dict):
+    for symbol, record in records.items():
+        if "s" in record:
+            max_, max_ts, min_, min_ts, direction = record["s"]
+            splash_state[symbol] = {"max": max_, "max_ts": max_ts, "min": min_, "min_ts": min_ts, "last_direction": DIRECTION_NAMES[direction]}
+        if "f" in record:
+            change, side = record["f"]
+            fairprice_state[symbol] = {"last_alert_change": change, "side": "above" if side == 1 else "below"}
+        if "h" in record:
+            max_, max_ts, min_, min_ts, last_alert, direction = record["h"]
+            holdvol_state[symbol] = {
+                "max": max_, "max_ts": max_ts, "min": min_, "min_ts": min_ts,
+                "last_direction": DIRECTION_NAMES[direction], "last_alert_holdvol": last_alert,
+            }
+
+async def persist_detector_state():
+    """Периодический снимок состояния детекторов (запись в отдельном потоке)"""
+    records = market_detector.export_state() if DETECTOR_ENGINE == "batch" else export_scalar_state()
+    started = time.perf_counter()
+    try:
+        data = encode_detector_state(records, time.time())
+        detector_state_stats["bytes"] = await asyncio.to_thread(write_file_atomic, DETECTOR_STATE_FILE, data)
+    except Exception as e:
+        print(f"[STATE] Ошибка сохранения состояния детекторов: {e}")
+        return
+    detector_state_stats["saves"] += 1
+    detector_state_stats["entries"] = len(records)
+    detector_state_stats["save_ms"] = (time.perf_counter() - started) * 1000
+
+def restore_detector_state():
+    """Тёплый старт детекторов. Снимок старше DETECTOR_STATE_MAX_AGE отбрасывается:
+    цена за время простоя могла уйти, и старые max/min дали бы ложные алерты"""
+    if not os.path.exists(DETECTOR_STATE_FILE):
+        return
+    try:
+        with open(DETECTOR_STATE_FILE, 'rb') as f:
+            saved_at, records = decode_detector_state(f.read())
+    except Exception as e:
+        print(f"[STATE] Ошибка чтения состояния детекторов: {e}")
+        return
+    age = time.time() - saved_at
+    if age > DETECTOR_STATE_MAX_AGE:
+        detector_state_stats["restored"] = 0
+        detector_state_stats["discarded"] = len(records)
+        print(f"[STATE] Состояние детекторов устарело ({age:.0f} с), начинаем с нуля")
+        return
+    # монеты, на которые уже никто не подписан, не восстанавливаем
+    fresh = {symbol: record for symbol, record in records.items() if symbol in symbol_subscribers}
+    detector_state_stats["restored"] = len(fresh)
+    detector_state_stats["discarded"] = len(records) - len(fresh)
+    if DETECTOR_ENGINE == "batch":
+        market_detector.import_state(fresh)
+    else:
+        import_scalar_state(fresh)
+    print(f"[STATE] Состояние детекторов восстановлено: {len(fresh)} монет (снимок {age:.0f} с назад)")
+
+# ----------------- Evaluation -----------------
+async def evaluate_market(snapshot: MarketSnapshot, session, bot: Bot, fetched_at: float, rows):
+    """Один прохід детекції (BatchDetector або check_price/check_fairprice/check_holdvol_splash) по змінених рядках снапшоту.
+
+    Замість фіксованої паузи на кожен символ віддаємо управління event loop'у
+    лише коли прохід займає довше за EVALUATION_YIELD_BUDGET, тож ринок
+    перевіряється в межах одного снапшоту, а команди бота не голодують.
+    """
+    eval_start = time.perf_counter()
+    if DETECTOR_ENGINE == "batch":
+        events = market_detector.step(rows, time.time())
+        await deliver_detector_events(events, snapshot, session, bot)
+    else:
+        slice_start = eval_start
+        for row in rows:
+            md_entry = snapshot.entry(row)
+            await check_price(md_entry, session, bot)
+            await check_fairprice(md_entry, session, bot)
+            await check_holdvol_splash(md_entry, session, bot)
+            if time.perf_counter() - slice_start >= EVALUATION_YIELD_BUDGET:
+                await asyncio.sleep(0)
+                slice_start = time.perf_counter()
+
+    if symbol_window_thresholds:
+        await check_price_windows(snapshot, time.time(), session, bot)
+
+    eval_end = time.perf_counter()
+    lag_ms = (eval_end - fetched_at) * 1000
+    sweep_stats["cycles"] += 1
+    total = int(np.count_nonzero(snapshot.valid))
+    sweep_stats["symbols"] = total
+    sweep_stats["changed"] = len(rows)
+    sweep_stats["symbols_total"] += total
+    sweep_stats["changed_total"] += len(rows)
+    sweep_stats["eval_ms"] = (eval_end - eval_start) * 1000
+    sweep_stats["lag_ms"] = lag_ms
+    sweep_stats["max_lag_ms"] = max(sweep_stats["max_lag_ms"], lag_ms)
+
+# ----------------- MEXC API -----------------
+def parse_contract_detail(c: dict) -> TickerContractDetail:
+    is_stock = any("stock" in x.lower() for x in c.get("conceptPlate", []))
+    return TickerContractDetail(
+        symbol=c["symbol"],
+        isStock=is_stock,
+        limitMaxVol=float(c["limitMaxVol"]),
+        contractSize=float(c["contractSize"]),
+        quoteCoin=c["quoteCoinName"],
+        baseCoin=c["baseCoinName"],
+        maxVol=float(c["maxVol"]),
+    )
+
+def _contract_signature(c: dict) -> tuple:
+    """Поля /contract/detail, з яких будується TickerContractDetail"""
+    return (
+        tuple(c.get("conceptPlate", ())),
+        c["limitMaxVol"], c["contractSize"], c["quoteCoinName"], c["baseCoinName"], c["maxVol"],
+    )
+
+# ----------------- Market data sources -----------------
+class MarketDataSource(abc.ABC):
+    """Джерело тікерів для MarketSnapshot.
+
+    poll() повертає список тікерів у спільному форматі (як у MEXC
+    /contract/ticker): symbol, lastPrice, fairPrice, indexPrice, fundingRate,
+    holdVol, volume24; полів, яких джерело не дає, у тікері просто немає.
+    Кожне джерело опитується окремою задачею планувальника зі своїм інтервалом.
+    """
+
+    name = "source"
+
+    def __init__(self, interval: float):
+        self.interval = interval
+        self.stats = {"polls": 0, "errors": 0, "tickers": 0, "last_ms": 0.0}
+
+    @abc.abstractmethod
+    async def poll(self, session, contracts: Dict[str, TickerContractDetail]) -> list:
+        """Один знімок тікерів у спільному форматі"""
+
+    async def ingest(self, session, snapshot: "MarketSnapshot", contracts, wanted=None, extras: bool = True):
+        """Одне опитування з оновленням снапшоту на місці (wanted/extras - див. MarketSnapshot.update_all)"""
+        started = time.perf_counter()
+        try:
+            data = await self.poll(session, contracts)
+        except Exception:
+            self.stats["errors"] += 1
+            raise
+        snapshot.update_all(data, contracts, wanted, extras)
+        self.stats["polls"] += 1
+        self.stats["tickers"] = len(data)
+        self.stats["last_ms"] = (time.perf_counter() - started) * 1000
+
+class CatalogSource(MarketDataSource):
+    """Джерело, яке дає і каталог контрактів - лише таке може бути основним (MARKET_SOURCE)"""
+
+    @abc.abstractmethod
+    async def contract_detail(self, session) -> bytes:
+        """Сира відповідь у форматі /contract/detail ({"data": [...]}) для ContractCatalog"""
+
+class MexcFuturesSource(CatalogSource):
+    """REST MEXC futures: /contract/ticker і /contract/detail (сирі байти декодує json_loads)"""
+
+    name = "mexc"
+
+    def __init__(self, interval: float = EVALUATION_CYCLE_TARGET, base_url: str = MEXC_FUTURES_URL):
+        super().__init__(interval)
+        self.base_url = base_url
+
+    async def poll(self, session, contracts) -> list:
+        async with session.get(f"{self.base_url}/ticker", timeout=HTTP_TIMEOUTS["mexc_ticker"]) as r:
+            raw = await r.read()
+        return json_loads(raw)["data"]
+
+    async def contract_detail(self, session) -> bytes:
+        async with session.get(f"{self.base_url}/detail", timeout=HTTP_TIMEOUTS["mexc_detail"]) as r:
+            return await r.read()
+
+class MexcSpotSource(MarketDataSource):
+    """REST MEXC spot (/ticker/price) як опорна ціна: BTCUSDT -> рядок BTC_USDT.
+
+    У спота немає fair price і OI, тому lastPrice = fairPrice = спотова ціна.
+    """
+
+    name = "mexc_spot"
+
+    def __init__(self, interval: float = REFERENCE_POLL_INTERVAL, base_url: str = MEXC_SPOT_URL):
+        super().__init__(interval)
+        self.base_url = base_url
+
+    async def poll(self, session, contracts) -> list:
+        async with session.get(f"{self.base_url}/ticker/price", timeout=HTTP_TIMEOUTS["mexc_ticker"]) as r:
+            raw = await r.read()
+        futures = {f"{c.baseCoin}{c.quoteCoin}".upper(): symbol for symbol, c in contracts.items()}
+        tickers = []
+        for t in json_loads(raw):
+            symbol = futures.get(t["symbol"])
+            if symbol is not None:
+                tickers.append({"symbol": symbol, "lastPrice": t["price"], "fairPrice": t["price"]})
+        return tickers
+
+class FixtureSource(CatalogSource):
+    """Кадри тікерів з локального файлу - для тестів і запуску без біржі.
+
+    Рядок файлу - один кадр: список тікерів, відповідь REST {"data": [...]}
+    або кадр push.tickers (файли ws_replay_server.py підходять). Кожен poll
+    віддає наступний кадр; після останнього - по колу або останній кадр.
+    Каталог контрактів будується із символів фікстури.
+    """
+
+    name = "fixture"
+
+    def __init__(self, path: str, interval: float = EVALUATION_CYCLE_TARGET, loop: bool = True):
+        super().__init__(interval)
+        self.path = path
+        self.loop = loop
+        self.frames: list = []
+        with open(path, "r", encoding="utf-8") as f:
+            for line in f:
+                if line.strip():
+                    frame = json_loads(line)
+                    self.frames.append(frame["data"] if isinstance(frame, dict) else frame)
+        self.position = 0
+
+    async def poll(self, session, contracts) -> list:
+        if not self.frames:
+            return []
+        if self.position == len(self.frames):
+            if not self.loop:
+                return self.frames[-1]
+            self.position = 0
+        frame = self.frames[self.position]
+        self.position += 1
+        return frame
+
+    async def contract_detail(self, session) -> bytes:
+        return json.dumps({"data": synthetic_contract_detail(self.frames)}).encode()
+
+def synthetic_contract_detail(frames) -> list:
+    """Записи /contract/detail для символів з кадрів тікерів (BTC_USDT -> base BTC, quote USDT)"""
+    symbols = sorted({t["symbol"] for frame in frames for t in frame})
+    return [
+        {
+            "symbol": symbol, "baseCoinName": symbol.split("_")[0], "quoteCoinName": symbol.split("_")[-1],
+            "contractSize": 1, "limitMaxVol": 0, "maxVol": 0, "conceptPlate": [],
+        }
+        for symbol in symbols
+    ]
+
+MARKET_SOURCE_TYPES = {"mexc": MexcFuturesSource, "mexc_spot": MexcSpotSource}
+
+def build_market_source(spec: str, primary: bool = False, **kwargs) -> MarketDataSource:
+    """"mexc" / "mexc_spot" / "fixture:PATH" -> джерело. primary - основне джерело, потрібен каталог контрактів"""
+    if spec.startswith("fixture:"):
+        return FixtureSource(spec.split(":", 1)[1], **kwargs)
+    source_type = MARKET_SOURCE_TYPES.get(spec.lower())
+    if source_type is None:
+        raise ValueError(f"невідоме джерело ринку {spec!r} (доступні: {', '.join(MARKET_SOURCE_TYPES)}, fixture:PATH)")
+    if primary and not issubclass(source_type, CatalogSource):
+        primaries = [name for name, t in MARKET_SOURCE_TYPES.items() if issubclass(t, CatalogSource)]
+        raise ValueError(
+            f"джерело {spec!r} не надає каталог контрактів і може бути лише REFERENCE_SOURCE "
+            f"(MARKET_SOURCE: {', '.join(primaries)}, fixture:PATH)"
+        )
+    return source_type(**kwargs)
+
+market_source = build_market_source(MARKET_SOURCE, primary=True)
+reference_source = build_market_source(REFERENCE_SOURCE, interval=REFERENCE_POLL_INTERVAL) if REFERENCE_SOURCE else None
+reference_snapshot = MarketSnapshot()  # ціни опорного джерела в рядках символів ф'ючерсів
+
+def reference_price(symbol: str) -> float | None:
+    """Остання ціна опорного джерела для монети (None, якщо джерела немає або монети в ньому немає)"""
+    row = reference_snapshot.rows.get(symbol)
+    if row is None or not reference_snapshot.valid[row]:
+        return None
+    return float(reference_snapshot.last[row])
+
+class ContractCatalog:
+    """Кеш контрактів основного джерела ринку з інкрементальним оновленням.
+
+    contracts - один і той самий словник на весь час роботи, змінюється на
+    місці. Якщо хеш відповіді /contract/detail не змінився, нічого не
+    розбирається; інакше перебудовуються лише додані/змінені символи, а
+    слухачі отримують (added, removed, changed).
+    """
+
+    def __init__(self, source: CatalogSource):
+        self.source = source
+        self.contracts: Dict[str, TickerContractDetail] = {}
+        self.digest = None
+        self._signatures: Dict[str, tuple] = {}
+        self.listeners: list = []  # async def listener(added, removed, changed)
+        self.stats = {"refreshes": 0, "unchanged": 0, "errors": 0, "refresh_ms": 0.0, "last_diff": "-"}
+
+    async def refresh(self, session) -> bool:
+        """Одне оновлення. Повертає True, якщо каталог змінився"""
+        started = time.perf_counter()
+        raw = await self.source.contract_detail(session)
+        self.stats["refreshes"] += 1
+        digest = hashlib.blake2b(raw, digest_size=16).digest()
+        if digest == self.digest:
+            self.stats["unchanged"] += 1
+            self.stats["refresh_ms"] = (time.perf_counter() - started) * 1000
+            return False
+
+        data = json_loads(raw)["data"]
+        if not data:
+            # порожня відповідь - скоріше збій API, ніж делістинг усього ринку
+            raise ValueError("empty /contract/detail payload")
+        first_load = not self.contracts
+        seen = set()
+        added, changed = [], []
+        for c in data:
+            symbol = c["symbol"]
+            seen.add(symbol)
+            signature = _contract_signature(c)
+            old = self._signatures.get(symbol)
+            if old == signature:
+                continue
+            self.contracts[symbol] = parse_contract_detail(c)
+            self._signatures[symbol] = signature
+            (added if old is None else changed).append(symbol)
+        removed = [symbol for symbol in self.contracts if symbol not in seen]
+        for symbol in removed:
+            del self.contracts[symbol]
+            del self._signatures[symbol]
+        self.digest = digest
+        self.stats["refresh_ms"] = (time.perf_counter() - started) * 1000
+        self.stats["last_diff"] = f"+{len(added)} -{len(removed)} ~{len(changed)}"
+
+        if not first_load and (added or removed or changed):
+            for listener in self.listeners:
                 try:
-                    contracts = await get_mexc_tickers_contract_detail(session)
-                    available_contracts = contracts  # Оновлюємо глобальний кеш
-                    last_contracts_update = now
-                    print(f"[{time.strftime('%H:%M:%S')}] Contracts updated ({len(contracts)} tickers)")
+                    await listener(added, removed, changed)
                 except Exception as e:
-                    print("Error updating contracts:", e)
+                    print(f"[CATALOG] Listener error: {e}")
+        return bool(added or removed or changed)
+
+contract_catalog = ContractCatalog(market_source)
+
+async def on_catalog_change(added: list, removed: list, changed: list):
+    """Реакція бота на зміни каталогу: стан детектора, індекс пошуку, лістинги/делістинги"""
+    symbol_index.rebuild(contract_catalog.contracts)
+    if changed:
+        market_snapshot.refresh_contracts(contract_catalog.contracts, changed)
+        market_detector.sync_all_rows()
+    for symbol in added:
+        print(f"[CATALOG] New listing: {symbol}")
+    for symbol in removed:
+        print(f"[CATALOG] Delisted: {symbol}")
+        subscribers = tuple(symbol_subscribers.get(symbol, ()))
+        if subscribers:
+            await dispatch_alert(
+                subscribers,
+                f"⚠️ Контракт <b>{symbol}</b> больше не торгуется на MEXC (делистинг).\n"
+                f"Отписаться: <code>/unsubscribe {symbol}</code>",
+                "catalog",
+            )
+    if admin_user_id and (added or removed):
+        lines = [f"🆕 <code>{s}</code>" for s in added] + [f"❌ <code>{s}</code>" for s in removed]
+        await dispatch_alert((admin_user_id,), "[CATALOG] Changes:\n" + "\n".join(lines[:50]), "catalog")
+
+contract_catalog.listeners.append(on_catalog_change)
+
+class TickerStream:
+    """Стрим тікерів MEXC futures (sub.tickers), що оновлює снапшот по символу.
+
+    Сам перепідключається і заново підписується; monitoring_loop читає
+    снапшот поки стрим свіжий і повертається до REST, якщо ні.
+    """
+
+    def __init__(self, session: aiohttp.ClientSession, snapshot: "MarketSnapshot", contracts: Dict[str, TickerContractDetail], updated: asyncio.Event, url: str = MEXC_WS_URL):
+        self.session = session
+        self.snapshot = snapshot
+        self.contracts = contracts
+        self.url = url
+        self.updated = updated
+        self.last_message = 0.0
+        self.stats = {"messages": 0, "tickers": 0, "reconnects": 0}
+
+    def is_fresh(self) -> bool:
+        return self.stats["tickers"] > 0 and time.monotonic() - self.last_message < WS_STALE_AFTER
+
+    async def run(self):
+        delay = 1
+        while True:
             try:
-                market_data = await get_mexc_tickers_market_data(session, contracts)
+                async with self.session.ws_connect(self.url, heartbeat=None, autoping=True, receive_timeout=WS_RECEIVE_TIMEOUT) as ws:
+                    await ws.send_json({"method": "sub.tickers", "param": {}})
+                    print(f"[WS] Connected to {self.url}, subscribed to tickers")
+                    delay = 1
+                    pinger = asyncio.create_task(self._ping(ws))
+                    try:
+                        async for msg in ws:
+                            if msg.type == aiohttp.WSMsgType.TEXT:
+                                self._handle(json_loads(msg.data))
+                            elif msg.type == aiohttp.WSMsgType.BINARY:
+                                self._handle(json_loads(gzip.decompress(msg.data)))
+                            elif msg.type in (aiohttp.WSMsgType.CLOSED, aiohttp.WSMsgType.ERROR):
+                                break
+                    finally:
+                        pinger.cancel()
+            except asyncio.CancelledError:
+                raise
             except Exception as e:
-                print("Error updating market data:", e)
-                await asyncio.sleep(1)
-                continue
+                print(f"[WS] Stream error: {e}")
+            self.stats["reconnects"] += 1
+            print(f"[WS] Disconnected, reconnecting in {delay}s")
+            await asyncio.sleep(delay)
+            delay = min(delay * 2, WS_RECONNECT_DELAY_MAX)
+
+    async def _ping(self, ws):
+        while True:
+            await asyncio.sleep(WS_PING_INTERVAL)
+            await ws.send_json({"method": "ping"})
+
+    def _handle(self, msg: dict):
+        channel = msg.get("channel")
+        if channel not in ("push.tickers", "push.ticker"):
+            return
+        data = msg.get("data")
+        tickers = data if isinstance(data, list) else [data]
+        for t in tickers:
+            c = self.contracts.get(t.get("symbol"))
+            if c and self.snapshot.update(t, c):
+                self.stats["tickers"] += 1
+        self.stats["messages"] += 1
+        self.last_message = time.monotonic()
+        self.snapshot.updated_at = time.perf_counter()
+        self.updated.set()
+
+ticker_stream: TickerStream | None = None
+
+
+# ----------------- Scheduler -----------------
+@dataclass
+class ScheduledTask:
+    name: str
+    func: Callable[[], Awaitable]
+    interval: float  # пауза між запусками (від старту до старту), сек
+    jitter: float = 0.0  # випадкова добавка до паузи, сек
+    timeout: float | None = None
+    trigger: asyncio.Event | None = None  # запуск раніше інтервалу, коли подія встановлена
+    run_immediately: bool = True
+    stats: dict = field(default_factory=lambda: {
+        "runs": 0, "errors": 0, "timeouts": 0, "last_ms": 0.0, "avg_ms": 0.0, "max_ms": 0.0,
+    })
+
+class Scheduler:
+    """Незалежні періодичні задачі з власним інтервалом, jitter, таймаутом і метриками.
+
+    Повільна задача (наприклад, /contract/detail) не затримує інші: кожна
+    крутиться у своєму asyncio task, обмін даними - через спільний снапшот
+    ринку, події та чергу алертів.
+    """
+
+    def __init__(self):
+        self.tasks: list = []
+
+    def add(self, task: ScheduledTask):
+        self.tasks.append(task)
+
+    async def run(self):
+        await asyncio.gather(*(self._loop(task) for task in self.tasks))
+
+    async def _loop(self, task: ScheduledTask):
+        if not task.run_immediately:
+            await self._pause(task, task.interval)
+        while True:
+            started = time.perf_counter()
             try:
-                # price splash & fairprice & holdvol alerts
-                for symbol, md_entry in market_data.items():
-                    await check_price(md_entry, session, bot)
-                    await check_fairprice(md_entry, session, bot)
-                    # await check_holdvol_splash(md_entry, session, bot)
-                    await asyncio.sleep(0.1)
+                await asyncio.wait_for(task.func(), task.timeout)
+            except asyncio.TimeoutError:
+                task.stats["timeouts"] += 1
+                print(f"[SCHED] {task.name} timed out after {task.timeout}s")
+            except asyncio.CancelledError:
+                raise
             except Exception as e:
-                print("Error parsing market data:", e)
-                await asyncio.sleep(1)
+                task.stats["errors"] += 1
+                print(f"[SCHED] {task.name} error: {e}")
+            elapsed = time.perf_counter() - started
+            st = task.stats
+            st["runs"] += 1
+            st["last_ms"] = elapsed * 1000
+            st["avg_ms"] += (st["last_ms"] - st["avg_ms"]) / min(st["runs"], 100)
+            st["max_ms"] = max(st["max_ms"], st["last_ms"])
+            await self._pause(task, max(0.0, task.interval - elapsed))
+
+    async def _pause(self, task: ScheduledTask, delay: float):
+        if task.jitter:
+            delay += random.uniform(0, task.jitter)
+        if task.trigger is None:
+            await asyncio.sleep(delay)
+            return
+        try:
+            await asyncio.wait_for(task.trigger.wait(), delay)
+        except asyncio.TimeoutError:
+            pass
+
+scheduler: Scheduler | None = None
+
+# ----------------- Main -----------------
+async def monitoring_loop(bot: Bot):
+    """Моніторинг ринку: каталог, тікери джерел, детекція і збереження стану як окремі задачі"""
+    global available_contracts, ticker_stream, scheduler
+    
+    session = http_clients.session("mexc")
+    await contract_catalog.refresh(session)
+    contracts = available_contracts = contract_catalog.contracts  # оновлюється на місці
+    symbol_index.rebuild(contracts)  # далі перебудовується слухачем каталогу
+    market_updated = asyncio.Event()
+
+    # У режимі ws тікери приходять стрімом, REST лишається запасним варіантом
+    stream_task = None
+    if INGESTION_MODE == "ws":
+        ticker_stream = TickerStream(http_clients.session("mexc_ws"), market_snapshot, contracts, market_updated)
+        stream_task = asyncio.create_task(ticker_stream.run(), name="ticker-stream")
+
+    async def refresh_catalog():
+        if await contract_catalog.refresh(session):
+            print(f"[{time.strftime('%H:%M:%S')}] Contracts updated ({len(contracts)} tickers, {contract_catalog.stats['last_diff']})")
+
+    last_extras_update = 0.0
+
+    async def ingest_tickers():
+        nonlocal last_extras_update
+        if ticker_stream is not None and ticker_stream.is_fresh():
+            return
+        started = time.perf_counter()
+        now = time.time()
+        if now - last_extras_update >= TICKER_EXTRAS_INTERVAL:
+            # повний розбір: всі монети і всі поля
+            await market_source.ingest(session, market_snapshot, contracts)
+            last_extras_update = now
+        else:
+            # детекторам потрібні лише монети з підписниками і last/fair/OI
+            await market_source.ingest(session, market_snapshot, contracts, symbol_subscribers, extras=False)
+        sweep_stats["fetch_ms"] = (time.perf_counter() - started) * 1000
+        market_updated.set()
+
+    async def ingest_reference():
+        await reference_source.ingest(session, reference_snapshot, contracts, symbol_subscribers, extras=False)
+
+    last_detect = time.perf_counter()
+
+    async def detect():
+        nonlocal last_detect
+        market_updated.clear()
+        # price splash & fairprice & holdvol alerts
+        await evaluate_market(market_snapshot, session, bot, market_snapshot.updated_at, market_snapshot.take_changed())
+        now = time.perf_counter()
+        sweep_stats["cycle_ms"] = (now - last_detect) * 1000
+        last_detect = now
+        if sweep_stats["cycles"] % SWEEP_LOG_INTERVAL == 0:
+            streaming = ticker_stream is not None and ticker_stream.is_fresh()
+            print(
+                f"[SWEEP] {sweep_stats['changed']}/{sweep_stats['symbols']} changed symbols ({'ws' if streaming else 'rest'}), "
+                f"fetch {sweep_stats['fetch_ms']:.0f}ms, eval {sweep_stats['eval_ms']:.1f}ms, "
+                f"lag {sweep_stats['lag_ms']:.1f}ms (max {sweep_stats['max_lag_ms']:.1f}ms)"
+            )
+
+    scheduler = Scheduler()
+    scheduler.add(ScheduledTask("catalog", refresh_catalog, CONTRACTS_REFRESH_INTERVAL, jitter=5, timeout=20, run_immediately=False))
+    scheduler.add(ScheduledTask("ingest", ingest_tickers, market_source.interval, timeout=5))
+    if reference_source is not None:
+        scheduler.add(ScheduledTask(f"ingest_{reference_source.name}", ingest_reference, reference_source.interval, timeout=5))
+    # без таймауту: детектори змінюють стан до постановки алертів у чергу,
+    # скасування посеред проходу втрачає алерти (тривалість видно в /stats)
+    scheduler.add(ScheduledTask("detect", detect, EVALUATION_CYCLE_TARGET, trigger=market_updated))
+    scheduler.add(ScheduledTask("persist", persist_state, STATE_SAVE_INTERVAL, timeout=10))
+    scheduler.add(ScheduledTask("detector_state", persist_detector_state, DETECTOR_STATE_SAVE_INTERVAL, timeout=10, run_immediately=False))
+    try:
+        await scheduler.run()
+    finally:
+        if stream_task is not None:
+            stream_task.cancel()
+        # не теряем изменения, сделанные после последнего сохранения
+        await persist_state()
+        await persist_detector_state()
 
 async def main():
     """Запуск бота: мониторинг + обработка команд"""
+    global alert_dispatcher, alert_coalescer
+    
     # Загружаем сохраненное состояние
     load_state()
+    restore_detector_state()
     
     # Инициализация aiogram бота
-    bot = Bot(token=telegram_bot_token)
+    bot = Bot(token=telegram_bot_token, session=SharedAiohttpSession(http_clients))
     dp = Dispatcher()
     
+    # Отправка алертов идёт отдельными воркерами
+    alert_dispatcher = AlertDispatcher()
+    alert_dispatcher.start()
+    # Склейка алертов по пользователю перед очередью
+    alert_coalescer = AlertCoalescer(alert_dispatcher)
+    alert_coalescer.start()
+    
     # Регистрация команд
     dp.message.register(handle_start, Command(commands=["start"]))
     dp.message.register(handle_search, Command(commands=["search", "find"]))
@@ -1110,29 +3827,45 @@ async def main():
     dp.message.register(handle_users, Command(commands=["users"]))
     dp.message.register(handle_user_info, Command(commands=["user"]))
     dp.message.register(handle_all_tracked, Command(commands=["tracked"]))
+    dp.message.register(handle_stats, Command(commands=["stats"]))
     dp.message.register(handle_subscribe, Command(commands=["subscribe", "sub"]))
     dp.message.register(handle_unsubscribe, Command(commands=["unsubscribe", "unsub"]))
     dp.message.register(handle_clear_subscriptions, Command(commands=["clear", "clearall"]))
     dp.message.register(handle_my_subscriptions, Command(commands=["my", "mysubs"]))
     dp.message.register(handle_set_threshold, Command(commands=["setthreshold", "threshold"]))
     dp.message.register(handle_my_threshold, Command(commands=["mythreshold", "mythres"]))
+    dp.message.register(handle_set_window, Command(commands=["setwindow", "window"]))
+    dp.message.register(handle_set_oi_threshold, Command(commands=["setoithreshold", "oithreshold"]))
+    dp.message.register(handle_cooldown, Command(commands=["cooldown"]))
     
     # Регистрация callback handler для пагинации и проверки подписки
     dp.callback_query.register(handle_users_pagination, F.data.startswith("users_page:"))
     dp.callback_query.register(handle_check_subscription, F.data == "check_subscription")
     
+    # Изменения участников канала (приходят, если бот админ канала)
+    dp.chat_member.register(handle_chat_member_update)
+    
     print("[BOT] Starting MEXC Splash Alert Bot...")
     print("[BOT] Monitoring: ENABLED")
     if admin_user_id:
         print(f"[BOT] Admin ID: {admin_user_id}")
-    print("[BOT] User commands: /start, /search, /subscribe, /unsubscribe, /clear, /my, /setthreshold, /mythreshold, /tracked")
-    print("[BOT] Admin commands: /users, /user\n")
+    print("[BOT] User commands: /start, /search, /subscribe, /unsubscribe, /clear, /my, /setthreshold, /setoithreshold, /mythreshold, /setwindow, /cooldown, /tracked")
+    print("[BOT] Admin commands: /users, /user, /stats\n")
     
     # Запускаем оба таска параллельно
-    await asyncio.gather(
-        monitoring_loop(bot),
-        bot_polling(bot, dp),
-    )
+    try:
+        await asyncio.gather(
+            monitoring_loop(bot),
+            bot_polling(bot, dp),
+        )
+    finally:
+        await alert_coalescer.stop()
+        await alert_dispatcher.stop()
+        await http_clients.close()
+        if state_store is not None:
+            state_store.close()
+        if change_log is not None:
+            change_log.close()
 
 import asyncio
 import sys
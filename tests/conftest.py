@@ -0,0 +1,34 @@
+import os
+import sys
+
+# splash.py завершується при імпорті без токена; Telegram у тестах не використовується
+os.environ.setdefault("TELEGRAM_BOT_TOKEN", "0:test")
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import pytest
+import splash
+
+
+@pytest.fixture
+def clean_state(tmp_path, monkeypatch):
+    """Пустое состояние бота; файлы состояния пишутся во временную папку"""
+    monkeypatch.chdir(tmp_path)
+
+    def reset():
+        for store in (splash.change_log, splash.state_store):
+            if store is not None:
+                store.close()
+        splash.change_log = None
+        splash.state_store = None
+        splash.bot_users = set()
+        splash.user_subscriptions = {}
+        splash.user_thresholds = {}
+        splash.user_oi_thresholds = {}
+        splash.user_usernames = {}
+        splash.user_windows = {}
+        splash.user_cooldowns = {}
+        splash.rebuild_subscriber_index()
+
+    reset()
+    yield reset
+    reset()
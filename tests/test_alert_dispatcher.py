@@ -0,0 +1,84 @@
+import asyncio
+
+import splash
+
+
+def test_stop_delivers_pending_digests(monkeypatch):
+    sent = []
+
+    async def fake_send(session, chat_id, alert):
+        await asyncio.sleep(0.01)
+        sent.append((chat_id, alert.kind))
+        return 200, {"ok": True}
+
+    monkeypatch.setattr(splash, "send_telegram_message", fake_send)
+    monkeypatch.setattr(splash, "TELEGRAM_GLOBAL_RATE", 1000)
+    monkeypatch.setattr(splash, "http_clients", splash.HttpClients())
+
+    async def run():
+        dispatcher = splash.AlertDispatcher()
+        coalescer = splash.AlertCoalescer(dispatcher)
+        dispatcher.start()
+        coalescer.start()
+        for chat_id in range(1, 31):
+            for kind in ("splash", "oi", "fairprice"):
+                await coalescer.submit(chat_id, splash.PreparedAlert.build(kind, f"{kind} {chat_id}"))
+        # остановка посреди окна склейки: дайджесты ещё не в очереди
+        await coalescer.stop()
+        await dispatcher.stop()
+        await splash.http_clients.close()
+        return dispatcher
+
+    dispatcher = asyncio.run(run())
+    # первый алерт сразу + дайджест остальных на каждого пользователя
+    assert len(sent) == 60
+    assert dispatcher.stats["sent"] == 60
+    assert dispatcher.queue.empty()
+
+
+def test_stop_gives_up_after_drain_timeout(monkeypatch):
+    async def stuck_send(session, chat_id, alert):
+        await asyncio.sleep(60)
+
+    monkeypatch.setattr(splash, "send_telegram_message", stuck_send)
+    monkeypatch.setattr(splash, "http_clients", splash.HttpClients())
+
+    async def run():
+        dispatcher = splash.AlertDispatcher()
+        dispatcher.start()
+        await dispatcher.submit(1, splash.PreparedAlert.build("splash", "x"))
+        await asyncio.wait_for(dispatcher.stop(drain_timeout=0.1), 5)
+        await splash.http_clients.close()
+        return dispatcher
+
+    dispatcher = asyncio.run(run())
+    assert dispatcher.workers == []
+
+
+def test_empty_bot_api_reply_does_not_kill_workers(monkeypatch):
+    replies = {1: (502, None), 2: (200, "<html>"), 3: (502, None)}
+
+    async def flaky_send(session, chat_id, alert):
+        return replies.get(chat_id, (200, {"ok": True}))
+
+    monkeypatch.setattr(splash, "send_telegram_message", flaky_send)
+    monkeypatch.setattr(splash, "TELEGRAM_GLOBAL_RATE", 1000)
+    monkeypatch.setattr(splash, "TELEGRAM_PER_CHAT_INTERVAL", 0)
+    monkeypatch.setattr(splash, "http_clients", splash.HttpClients())
+
+    async def run():
+        dispatcher = splash.AlertDispatcher()
+        dispatcher.start()
+        for chat_id in range(1, 6):
+            await dispatcher.submit(chat_id, splash.PreparedAlert.build("splash", "x"))
+        await asyncio.wait_for(dispatcher.queue.join(), 5)
+        alive = all(not task.done() for task in dispatcher.workers)
+        await dispatcher.stop()
+        await splash.http_clients.close()
+        return dispatcher, alive
+
+    dispatcher, alive = asyncio.run(run())
+    assert alive
+    # чаты 1-3 получают пустой/не-JSON ответ на каждую попытку
+    assert dispatcher.stats["failed"] == 3
+    assert dispatcher.stats["sent"] == 2
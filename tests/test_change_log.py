@@ -0,0 +1,26 @@
+import splash
+
+
+def test_torn_tail_is_trimmed_before_next_append(clean_state, tmp_path):
+    # процесс упал посреди записи подписки на ETH
+    (tmp_path / splash.STATE_LOG_FILE).write_bytes(b'["s",1,"BTC_USDT"]\n["s",1,"ETH_')
+
+    splash.load_state()
+    assert splash.user_subscriptions == {1: {"BTC_USDT"}}
+    splash.add_subscription(2, "SOL_USDT")
+
+    clean_state()
+    splash.load_state()
+    assert splash.user_subscriptions == {1: {"BTC_USDT"}, 2: {"SOL_USDT"}}
+    assert (tmp_path / splash.STATE_LOG_FILE).read_bytes().endswith(b'["s",2,"SOL_USDT"]\n')
+
+
+def test_log_without_newline_at_all_is_dropped(clean_state, tmp_path):
+    (tmp_path / splash.STATE_LOG_FILE).write_bytes(b'["s",1,"BT')
+
+    splash.load_state()
+    splash.add_subscription(1, "ETH_USDT")
+
+    clean_state()
+    splash.load_state()
+    assert splash.user_subscriptions == {1: {"ETH_USDT"}}
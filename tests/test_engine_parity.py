@@ -0,0 +1,48 @@
+import os
+
+import pytest
+
+import backtest
+import splash
+
+FIXTURE = os.path.join(os.path.dirname(__file__), "fixtures", "tickers.jsonl")
+
+
+def replay(engine, monkeypatch):
+    """Алерти движка по кадрам фікстури (крок 1 с) зі свіжим станом детекторів"""
+    frames = splash.FixtureSource(FIXTURE).frames
+    contracts = {c["symbol"]: splash.parse_contract_detail(c) for c in splash.synthetic_contract_detail(frames)}
+    snapshot = splash.MarketSnapshot()
+    monkeypatch.setattr(splash, "DETECTOR_ENGINE", engine)
+    monkeypatch.setattr(splash, "market_snapshot", snapshot)
+    monkeypatch.setattr(splash, "market_detector", splash.BatchDetector(snapshot))
+    monkeypatch.setattr(splash, "splash_state", {})
+    monkeypatch.setattr(splash, "fairprice_state", {})
+    monkeypatch.setattr(splash, "holdvol_state", {})
+    return backtest.replay_alerts([(1_700_000_000 + i, frame) for i, frame in enumerate(frames)], contracts)
+
+
+@pytest.fixture
+def subscribers(clean_state):
+    for user_id, threshold, oi_threshold in ((1, 3, 10), (2, 5, 15), (3, 2, 10)):
+        splash.set_user_threshold(user_id, threshold)
+        splash.set_user_oi_threshold(user_id, oi_threshold)
+    for symbol in ("BTC_USDT", "ETH_USDT", "SOL_USDT", "PEPE_USDT", "DOGE_USDT", "XRP_USDT"):
+        splash.add_subscription(1, symbol)
+        splash.add_subscription(2, symbol)
+    splash.add_subscription(3, "SOL_USDT")
+
+
+def test_scalar_and_batch_engines_send_identical_alerts(subscribers, monkeypatch):
+    scalar = replay("scalar", monkeypatch)
+    batch = replay("batch", monkeypatch)
+
+    assert {kind for _, kind, _, _, _ in scalar} == {"splash", "fairprice", "oi"}
+    assert batch == scalar
+
+
+def test_replay_restores_patched_module(subscribers, monkeypatch):
+    clock, dispatch = splash.time, splash.dispatch_alert
+    replay("scalar", monkeypatch)
+    assert splash.time is clock
+    assert splash.dispatch_alert is dispatch
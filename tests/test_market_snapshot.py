@@ -0,0 +1,46 @@
+import splash
+
+
+def make_frame(count, price):
+    return [
+        {"symbol": f"C{i}_USDT", "lastPrice": price, "fairPrice": price, "holdVol": 1000, "volume24": 5}
+        for i in range(count)
+    ]
+
+
+def make_contracts(frame):
+    return {c["symbol"]: splash.parse_contract_detail(c) for c in splash.synthetic_contract_detail([frame])}
+
+
+def test_filtered_poll_keeps_skipped_rows_valid():
+    frame = make_frame(200, 1.0)
+    contracts = make_contracts(frame)
+    snapshot = splash.MarketSnapshot(capacity=16)
+
+    snapshot.update_all(frame, contracts)
+    assert len(snapshot.take_changed()) == 200
+
+    # між повними опитуваннями розбираються лише монети з підписниками
+    snapshot.update_all(frame, contracts, wanted={"C0_USDT"}, extras=False)
+    assert len(snapshot.take_changed()) == 0
+    assert snapshot.valid[:200].all()
+
+    # повне опитування з тими самими цінами нічого не вважає зміненим
+    snapshot.update_all(frame, contracts)
+    assert len(snapshot.take_changed()) == 0
+
+    moved = make_frame(200, 1.0)
+    moved[5]["lastPrice"] = 1.1
+    snapshot.update_all(moved, contracts)
+    assert snapshot.take_changed().tolist() == [snapshot.rows["C5_USDT"]]
+
+
+def test_filtered_poll_invalidates_missing_rows():
+    frame = make_frame(3, 1.0)
+    contracts = make_contracts(frame)
+    snapshot = splash.MarketSnapshot()
+    snapshot.update_all(frame, contracts)
+
+    # C2 зник з відповіді (делістинг) - невалідний навіть без підписників
+    snapshot.update_all(frame[:2], contracts, wanted={"C0_USDT"}, extras=False)
+    assert snapshot.valid[:3].tolist() == [True, True, False]
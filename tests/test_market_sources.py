@@ -0,0 +1,33 @@
+import asyncio
+
+import pytest
+
+import splash
+
+
+def test_spot_source_is_rejected_as_primary():
+    with pytest.raises(ValueError, match="REFERENCE_SOURCE"):
+        splash.build_market_source("mexc_spot", primary=True)
+    assert isinstance(splash.build_market_source("mexc_spot"), splash.MexcSpotSource)
+    assert isinstance(splash.build_market_source("mexc", primary=True), splash.CatalogSource)
+
+
+def test_fixture_source_provides_catalog(tmp_path):
+    path = tmp_path / "frames.jsonl"
+    path.write_text('[{"symbol":"BTC_USDT","lastPrice":1,"fairPrice":1}]\n')
+    source = splash.build_market_source(f"fixture:{path}", primary=True)
+    catalog = splash.ContractCatalog(source)
+
+    assert asyncio.run(catalog.refresh(None))
+    assert list(catalog.contracts) == ["BTC_USDT"]
+
+
+def test_sources_must_implement_abstract_methods():
+    class NoCatalog(splash.CatalogSource):
+        async def poll(self, session, contracts):
+            return []
+
+    with pytest.raises(TypeError):
+        splash.MarketDataSource(1)
+    with pytest.raises(TypeError):
+        NoCatalog(1)
@@ -0,0 +1,30 @@
+import asyncio
+
+import splash
+
+
+def test_waiters_recover_when_leading_lookup_is_cancelled():
+    calls = []
+
+    async def fetch():
+        calls.append(1)
+        if len(calls) == 1:
+            await asyncio.sleep(60)
+        return True
+
+    async def run():
+        cache = splash.MembershipCache(60, 60, 100)
+        leader = asyncio.create_task(cache.lookup(1, fetch))
+        await asyncio.sleep(0)
+        waiters = [asyncio.create_task(cache.lookup(1, fetch)) for _ in range(3)]
+        await asyncio.sleep(0)
+        leader.cancel()
+        results = await asyncio.wait_for(asyncio.gather(*waiters), 5)
+        return cache, leader, results
+
+    cache, leader, results = asyncio.run(run())
+    assert leader.cancelled()
+    assert results == [True, True, True]
+    # после отмены один из ожидающих стал ведущим, остальные дождались его
+    assert len(calls) == 2
+    assert cache.pending == {}
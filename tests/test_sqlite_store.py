@@ -0,0 +1,34 @@
+import asyncio
+
+import splash
+
+
+def test_migration_includes_change_log(clean_state, monkeypatch):
+    # JSON-бэкенд с журналом: всё состояние пока только в bot_state.log
+    splash.load_state()
+    splash.register_user(1, "alice")
+    splash.add_subscription(1, "BTC_USDT")
+    splash.set_user_threshold(1, 2.5)
+
+    clean_state()
+    monkeypatch.setattr(splash, "STORAGE_BACKEND", "sqlite")
+    splash.load_state()
+    assert splash.bot_users == {1}
+    assert splash.user_subscriptions == {1: {"BTC_USDT"}}
+    assert splash.user_thresholds == {1: 2.5}
+    assert splash.user_usernames == {1: "alice"}
+    assert splash.symbol_subscribers == {"BTC_USDT": {1}}
+
+
+def test_register_user_is_flushed_without_dirty_flag(clean_state, monkeypatch):
+    monkeypatch.setattr(splash, "STORAGE_BACKEND", "sqlite")
+    splash.load_state()
+    # /search, /watch, /my регистрируют пользователя без mark_state_dirty
+    splash.register_user(42, "bob")
+    asyncio.run(splash.persist_state())
+    assert splash.state_store.pending == []
+
+    clean_state()
+    splash.load_state()
+    assert splash.bot_users == {42}
+    assert splash.user_usernames == {42: "bob"}
@@ -0,0 +1,32 @@
+import random
+
+import splash
+
+
+def make_index(symbols):
+    frames = [[{"symbol": symbol} for symbol in symbols]]
+    contracts = {c["symbol"]: splash.parse_contract_detail(c) for c in splash.synthetic_contract_detail(frames)}
+    index = splash.SymbolIndex(splash.MarketSnapshot())
+    index.rebuild(contracts)
+    return index
+
+
+def test_substring_lookup_matches_full_scan():
+    rng = random.Random(3)
+    alphabet = "ABCDEFGHIJKLMNOPQRSTUVWXYZ0123456789"
+    symbols = {f"{''.join(rng.choices(alphabet, k=rng.randint(2, 8)))}_{rng.choice(('USDT', 'USDC', 'USD'))}" for _ in range(500)}
+    index = make_index(symbols)
+
+    for symbol in rng.sample(sorted(symbols), 50):
+        start = rng.randint(0, len(symbol) - 1)
+        for term in (symbol[start:start + n] for n in range(1, 7)):
+            assert index._containing(term) == [s for s in index.symbols if term in s]
+    assert index._containing("ZZZZZZZZ") == []
+
+
+def test_search_groups():
+    index = make_index(["BTC_USDT", "BTC_USDC", "BTCDOM_USDT", "WBTC_USDT", "ETH_USDT"])
+
+    assert index.search("BTC") == ["BTC_USDC", "BTC_USDT", "BTCDOM_USDT", "WBTC_USDT"]
+    assert index.search("BTC", "USDC") == ["BTC_USDC"]
+    assert index.search("DOM") == ["BTCDOM_USDT"]
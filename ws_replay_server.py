@@ -0,0 +1,94 @@
+"""
+Локальна заміна WebSocket MEXC futures для перевірки INGESTION_MODE=ws.
+
+Запис кадрів з біржі:
+    python ws_replay_server.py record frames.jsonl --count 200
+Відтворення (бот запускати з MEXC_WS_URL=ws://127.0.0.1:8765/edge):
+    python ws_replay_server.py serve frames.jsonl
+"""
+
+import argparse
+import asyncio
+import json
+import aiohttp
+from aiohttp import web
+
+MEXC_WS_URL = "wss://contract.mexc.com/edge"
+
+
+async def record(path: str, count: int):
+    """Записує кадри push.tickers у файл, по одному JSON на рядок"""
+    async with aiohttp.ClientSession() as session:
+        async with session.ws_connect(MEXC_WS_URL) as ws:
+            await ws.send_json({"method": "sub.tickers", "param": {}})
+            written = 0
+            with open(path, "w", encoding="utf-8") as f:
+                async for msg in ws:
+                    if msg.type != aiohttp.WSMsgType.TEXT:
+                        continue
+                    frame = json.loads(msg.data)
+                    if frame.get("channel") != "push.tickers":
+                        continue
+                    f.write(json.dumps(frame, ensure_ascii=False) + "\n")
+                    written += 1
+                    print(f"[RECORD] {written}/{count}")
+                    if written >= count:
+                        break
+
+
+def make_app(path: str, interval: float, loop_frames: bool) -> web.Application:
+    with open(path, "r", encoding="utf-8") as f:
+        frames = [line.strip() for line in f if line.strip()]
+
+    async def edge(request: web.Request):
+        ws = web.WebSocketResponse()
+        await ws.prepare(request)
+        print(f"[REPLAY] Client connected, {len(frames)} frames")
+
+        async def replay():
+            while True:
+                for frame in frames:
+                    await ws.send_str(frame)
+                    await asyncio.sleep(interval)
+                if not loop_frames:
+                    break
+
+        replay_task = None
+        try:
+            async for msg in ws:
+                if msg.type != aiohttp.WSMsgType.TEXT:
+                    continue
+                method = json.loads(msg.data).get("method")
+                if method == "ping":
+                    await ws.send_json({"channel": "pong", "data": 0})
+                elif method == "sub.tickers" and replay_task is None:
+                    await ws.send_json({"channel": "rs.sub.tickers", "data": "success"})
+                    replay_task = asyncio.create_task(replay())
+        finally:
+            if replay_task is not None:
+                replay_task.cancel()
+        print("[REPLAY] Client disconnected")
+        return ws
+
+    app = web.Application()
+    app.router.add_get("/edge", edge)
+    return app
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Запис і відтворення WebSocket тікерів MEXC")
+    sub = parser.add_subparsers(dest="command", required=True)
+    rec = sub.add_parser("record")
+    rec.add_argument("path")
+    rec.add_argument("--count", type=int, default=100)
+    srv = sub.add_parser("serve")
+    srv.add_argument("path")
+    srv.add_argument("--port", type=int, default=8765)
+    srv.add_argument("--interval", type=float, default=0.5, help="пауза між кадрами, сек")
+    srv.add_argument("--once", action="store_true", help="не повторювати кадри по колу")
+    args = parser.parse_args()
+
+    if args.command == "record":
+        asyncio.run(record(args.path, args.count))
+    else:
+        web.run_app(make_app(args.path, args.interval, not args.once), host="127.0.0.1", port=args.port)